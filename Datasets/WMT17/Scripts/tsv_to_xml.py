@@ -1,34 +1,17 @@
-from lxml import etree as ET
+import os
+import sys
+import importlib.util
 
-root = ET.fromstring("<mtf/>")
+# Term pairs of the WMT17 terminology TSV (source segment, target segment, then source/target term pairs) to MTF,
+# via the streaming converter of the Kalcium client (`kalcium-glossary` when the package is installed)
+if importlib.util.find_spec("kalcium_client") is None:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "Open WebUI", "kalcium-python-client", "src"))
 
-tsv = open("C:/Users/Christian.Lang/eurocom Translation Service GmbH/AI Box - Dokumente/Testing/Testing_BaseModel/iate.414.terminology.tsv", "r", encoding="utf-8").readlines()
+from kalcium_client.glossary_convert import convert
 
-term_pairs = []
-for line in tsv:
-    cells = line.split("\t")
-    for idx in range(2,len(cells),2):
-        term_pair = (cells[idx], cells[idx+1])
-        term_pairs.append(term_pair)
+tsv_path = sys.argv[1] if len(sys.argv) > 1 else "iate.414.terminology.tsv"
+output_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "iate.414.terminology.xml")
 
-lang_map = {0:{"name": "English (United Kingdom)",
-               "code": "EN-GB"},
-            1:{"name": "German (Germany)",
-               "code": "DE-DE"}}
+convert(tsv_path, output_path, inputFormat="tsv", outputFormat="mtf", languages=["EN-GB", "DE-DE"], pairStart=2)
 
-for idx,pair in enumerate(set(term_pairs)):
-    conceptGrp = ET.SubElement(root,"conceptGrp")
-    concept = ET.SubElement(conceptGrp, "concept")
-    concept.text = str(idx+1)
-    for lang_idx, term_string in enumerate(pair):
-        languageGrp = ET.SubElement(conceptGrp,"languageGrp")
-        language = ET.SubElement(languageGrp,"language", type=lang_map[lang_idx]["name"],lang=lang_map[lang_idx]["code"])
-        termGrp = ET.SubElement(languageGrp,"termGrp")
-        term = ET.SubElement(termGrp,"term")
-        term.text = term_string
-
-output_dir = "C:/Users/Christian.Lang/eurocom Translation Service GmbH/AI Box - Dokumente/Testing/Testing_BaseModel/scripts"
-with open(f"{output_dir}/iate.414.terminology.xml", "wb") as out:
-    out.write(ET.tostring(root, encoding="utf-8", xml_declaration=True, pretty_print=True))
-
-print(f"Conversion saved to {output_dir}")
\ No newline at end of file
+print(f"Conversion saved to {output_path}")
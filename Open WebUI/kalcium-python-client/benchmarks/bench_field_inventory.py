@@ -0,0 +1,61 @@
+"""Field inventory of a Kalcium XML file: `readXML` (full tree and three XPath scans) vs. the streaming `field_inventory`.
+
+Every method runs in its own process, so the reported peak RSS belongs to that run only.
+
+Usage: python benchmarks/bench_field_inventory.py [path to a Kalcium XML file | number of generated entries]
+"""
+import logging
+import os
+import resource
+import sys
+import tempfile
+from multiprocessing import get_context
+from time import perf_counter
+
+from kalcium_client.xml_utils.KalciumXML import KalciumXML, KalciumXMLWriter
+
+languages = ["English|en-GB", "German|de-DE"]
+
+
+def generate(path: str, count: int):
+    def entries():
+        for idx in range(count):
+            yield f"concept-{idx}", {
+                "fields": {"definition": f"Definition {idx}", "subject": ["law", "tax", "trade"][idx % 3]},
+                "languages": {language: {"fields": {"note": f"note {idx % 100}"},
+                                         "terms": [{"term": f"term {idx}", "fields": {"usage": "preferred", "source": "IATE"}}]}
+                              for language in languages}}
+
+    logging.disable(logging.WARNING)
+    with KalciumXMLWriter(path, languages=languages) as writer:
+        writer.write_entries(entries())
+
+
+def run(method: str, path: str):
+    start = perf_counter()
+    if method == "readXML":
+        _, fields = KalciumXML().readXML(path)
+    else:
+        fields = KalciumXML().field_inventory(path)
+    seconds = perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, {level: sorted(fields[level]) for level in ["entry", "language", "term"]}
+
+
+def main():
+    argument = sys.argv[1] if len(sys.argv) > 1 else "20000"
+    with tempfile.TemporaryDirectory() as directory:
+        if argument.isdigit():
+            path = os.path.join(directory, "termbase.xml")
+            generate(path, int(argument))
+        else:
+            path = argument
+        print(f"{path}: {os.path.getsize(path) / 2**20:.1f} MB")
+        context = get_context("spawn")
+        for method in ["readXML", "field_inventory"]:
+            with context.Pool(1) as pool:
+                seconds, rss, fields = pool.apply(run, (method, path))
+            print(f"{method:>16}: {seconds:6.2f}s, peak RSS {rss:7.1f} MB, fields {fields}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Latency of local fuzzy/prefix/suffix lookups on the WMT17 IATE termbase.
+
+Usage: python benchmarks/bench_fuzzy_index.py [path/to/mtf.xml]
+"""
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from kalcium_client.fuzzy_index import FuzzyTermIndex, levenshtein
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+DEFAULT_TERMBASE = Path(__file__).resolve().parents[3] / "Datasets" / "WMT17" / "Scripts" / "iate.414.terminology.xml"
+
+
+def mutate(term: str, rng: random.Random):
+    chars = list(term)
+    position = rng.randrange(len(chars))
+    chars[position] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    return "".join(chars)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TERMBASE
+    snapshot = TermbaseSnapshot.from_mtf(path)
+    start = perf_counter()
+    index = FuzzyTermIndex(snapshot)
+    print(f"Indexed {len(index.terms)} terms from {len(snapshot)} entries in {(perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(42)
+    queries = [(mutate(term, rng), languageId) for _, languageId, term, _ in snapshot.iter_terms() if len(term) > 3]
+    for searchMode in ["exact", "fuzzy", "prefix", "suffix", "concordance"]:
+        hits = 0
+        start = perf_counter()
+        for query, languageId in queries:
+            hits += len(index.search(query if searchMode == "fuzzy" else query[:4], [languageId], searchMode=searchMode, similarityRate=0.75))
+        elapsed = perf_counter() - start
+        print(f"{searchMode:12} {elapsed / len(queries) * 1e6:8.1f} us/query  {hits} hits")
+
+    # Brute force reference for fuzzy recall
+    missed = 0
+    for query, languageId in queries[:200]:
+        expected = {term for _, _, term, _ in snapshot.iter_terms([languageId])
+                    if 1 - levenshtein(query.lower(), term.lower()) / max(len(query), len(term)) >= 0.75}
+        found = {hit["term"] for hit in index.search(query, [languageId], similarityRate=0.75)}
+        missed += len(expected - found)
+    print(f"Fuzzy hits missed compared to brute force: {missed}")
+
+
+if __name__ == "__main__":
+    main()
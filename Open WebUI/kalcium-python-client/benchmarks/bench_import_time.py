@@ -0,0 +1,80 @@
+"""Import time of the kalcium_client modules and the Open WebUI TAG filter, from `python -X importtime`.
+
+Every module is imported in a fresh interpreter. The report lists the cumulative import time per module
+and the slowest imports it pulls in, so new import-time work shows up as a regression.
+
+Usage: python benchmarks/bench_import_time.py [module ...] [--top N] [--max-ms MS]
+       (exits with 1 if a module takes longer than --max-ms)
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+filter_path = os.path.join(os.path.dirname(os.path.dirname(src)), "retrieval_functions",
+                           "translate_with_tag_with_retrieval_endpoint.py")
+
+modules = [
+    "kalcium_client.client",
+    "kalcium_client.retrieval_endpoint_functions",
+    "kalcium_client.kalcium_tag_functions",
+    "kalcium_client.xml_utils.KalciumXML",
+    "kalcium_client.termbase_export",
+    "kalcium_client.term_automaton",
+    "kalcium_client.entry_cache",
+]
+
+
+def import_times(statement: str):
+    """Run `statement` under -X importtime and return [(cumulative µs, self µs, module)] of all imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True,
+                            env={**os.environ, "PYTHONPATH": src + os.pathsep + os.environ.get("PYTHONPATH", "")})
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip().splitlines()[-1])
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented by two spaces per level after the separating space
+        times.append((int(cumulative_us), int(self_us), name[1:].rstrip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=modules + ["filter"])
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per module")
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    # Modules imported by the interpreter itself (site, encodings, ...) are not counted
+    startup = {name.strip() for _, _, name in import_times("pass")}
+    slow = []
+    for module in args.modules:
+        if module == "filter":
+            statement = f"import importlib.util as u; s = u.spec_from_file_location('tag_filter', {filter_path!r}); s.loader.exec_module(u.module_from_spec(s))"
+        else:
+            statement = f"import {module}"
+        try:
+            times = import_times(statement)
+        except Exception as e:
+            print(f"{module:<48} failed: {e}")
+            continue
+        times = [entry for entry in times if entry[2].strip() not in startup]
+        total = sum(cumulative for cumulative, _, name in times if not name.startswith(" ")) / 1000
+        print(f"{module:<48} {total:>8.1f} ms")
+        nested = [entry for entry in times if entry[2].strip() != module and entry[2].startswith(" ")]
+        for cumulative, _, name in sorted(nested, reverse=True)[:args.top]:
+            print(f"    {name.strip():<44} {cumulative / 1000:>8.1f} ms")
+        if args.max_ms is not None and total > args.max_ms:
+            slow.append(module)
+
+    if slow:
+        print(f"Slower than {args.max_ms} ms: {', '.join(slow)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
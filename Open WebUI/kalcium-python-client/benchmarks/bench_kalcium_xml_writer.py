@@ -0,0 +1,78 @@
+"""Throughput and peak memory of `KalciumXMLWriter` vs. building the whole tree with `KalciumXML.from_dict`.
+
+Every size runs in its own process, so the reported peak RSS belongs to that run only.
+
+Usage: python benchmarks/bench_kalcium_xml_writer.py [number of entries ...] [--compare-limit N]
+       (defaults: 10000 100000; from_dict is only run up to --compare-limit entries, default 100000)
+"""
+import argparse
+import logging
+import os
+import resource
+import tempfile
+from multiprocessing import get_context
+from time import perf_counter
+
+from lxml import etree as ET
+
+from kalcium_client.xml_utils.KalciumXML import KalciumXML, KalciumXMLWriter
+
+languages = ["English|en-GB", "German|de-DE", "Italian|it-IT"]
+
+
+def entries(count: int):
+    for idx in range(count):
+        yield f"concept-{idx}", {
+            "fields": {"definition": f"Definition of concept {idx}", "subject": "law|administration"},
+            "languages": {language: {"fields": {"note": f"note {idx}"},
+                                     "terms": [{"term": f"{language[:2]} term {idx}.{i}", "fields": {"usage": "preferred"}}
+                                               for i in range(2)]}
+                          for language in languages}}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_writer(count: int, path: str):
+    start = perf_counter()
+    with KalciumXMLWriter(path, languages=languages) as writer:
+        writer.write_entries(entries(count))
+    return perf_counter() - start, peak_rss_mb()
+
+
+def run_from_dict(count: int, path: str):
+    start = perf_counter()
+    root, _ = KalciumXML().from_dict(dict(entries(count)))
+    ET.ElementTree(root).write(path, encoding="utf-8", xml_declaration=True)
+    return perf_counter() - start, peak_rss_mb()
+
+
+def run(name: str, count: int):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "entries.xml")
+        seconds, rss = {"writer": run_writer, "from_dict": run_from_dict}[name](count, path)
+        return seconds, rss, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=[10000, 100000])
+    parser.add_argument("--compare-limit", type=int, default=100000)
+    args = parser.parse_args()
+
+    context = get_context("spawn")
+    print(f"{'entries':>9} {'method':>10} {'seconds':>9} {'entries/s':>10} {'peak RSS MB':>12} {'file MB':>9}")
+    for count in args.sizes:
+        for name in ["writer", "from_dict"]:
+            if name == "from_dict" and count > args.compare_limit:
+                continue
+            with context.Pool(1) as pool:
+                seconds, rss, size = pool.apply(run, (name, count))
+            print(f"{count:>9} {name:>10} {seconds:>9.2f} {count / seconds:>10.0f} {rss:>12.1f} {size / 2**20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Decoding cost of large retrieval endpoint payloads: `json.loads(response.text)` vs. bytes-level `loads`.
+
+Usage: python benchmarks/bench_response_decoding.py [number of entries ...]
+"""
+import gzip
+import json
+import sys
+from time import perf_counter
+
+import requests
+
+from kalcium_client import client
+
+
+def json_payload(entries: int):
+    content = [{"id": idx, "definition": f"Definition of concept {idx} – with umlauts: Botschaft, Übersetzung",
+                **{f"en-gb_term_{i}": f"term {idx}.{i}" for i in range(1, 4)},
+                **{f"de-de_term_{i}": f"Begriff {idx}.{i}" for i in range(1, 4)},
+                **{f"de-de_term_{i}_usageStatus": "preferred" for i in range(1, 4)}} for idx in range(entries)]
+    return json.dumps({"content": json.dumps(content, ensure_ascii=False)}, ensure_ascii=False).encode("utf-8")
+
+
+def xml_payload(entries: int):
+    content = "<kalciumEntries>" + "".join(
+        f'<e><id id="{idx}"/><f n="definition" v="Definition {idx}"/><l lid="306"><t t="term {idx}"/></l><l lid="314"><t t="Begriff {idx}"/></l></e>'
+        for idx in range(entries)) + "</kalciumEntries>"
+    return json.dumps({"content": content}).encode("utf-8")
+
+
+def fake_response(body: bytes):
+    # No charset in the content type, as returned by the retrieval endpoint
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = body
+    return response
+
+
+def decode_text(response):
+    entries = json.loads(response.text)
+    try:
+        return json.loads(entries["content"])
+    except:
+        return entries["content"]
+
+
+def decode_bytes(response):
+    entries = client.loads(response.content)
+    content = entries["content"]
+    if isinstance(content, str) and content.lstrip()[:1] in ("[", "{"):
+        return client.loads(content)
+    return content
+
+
+def timed(func, body: bytes, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        response = fake_response(body)
+        start = perf_counter()
+        func(response)
+        best = min(best, perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or [1_000, 10_000, 50_000]
+    print(f"orjson available: {client.orjson is not None}")
+    for name, make_payload in [("json", json_payload), ("xml", xml_payload)]:
+        for size in sizes:
+            body = make_payload(size)
+            compressed = len(gzip.compress(body))
+            text_ms = timed(decode_text, body)
+            bytes_ms = timed(decode_bytes, body)
+            print(f"{name:4} {size:7} entries  {len(body) / 1e6:6.2f} MB (gzip {compressed / 1e6:5.2f} MB)  "
+                  f"response.text: {text_ms:8.1f} ms  bytes: {bytes_ms:8.1f} ms  speedup {text_ms / bytes_ms:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Term recognition recall of the local stem index on the WMT17 IATE/Wiktionary sets.
+
+Usage:
+    python benchmarks/bench_stem_recall.py [--tsv iate.414.terminology.tsv] [--server]
+
+`--tsv` takes a WMT17 term-annotated test set (source, target, then source/target term pairs per line)
+and measures the recall of the annotated source terms. `--server` additionally runs
+KalciumClient.analyze_sentence with `useStemmer=True` on the same sentences for a parity check
+(credentials are read from the KALCIUM_*_TAG_EVALUATION environment variables).
+Without `--tsv`, the German terms of the IATE termbase are recognized in the shipped WMT17 outputs.
+
+The term-annotated test sets (iate.414.terminology.tsv, wikt.727.terminology.tsv) are not part of the repository,
+only the German sides of the WMT17 sets are. Recall against gold terms and the parity check with the server therefore
+need the original WMT17 terminology data; without it, only the synthetic inflections and the hit counts are reported.
+"""
+import argparse
+import os
+import random
+from pathlib import Path
+from time import perf_counter
+
+from kalcium_client.stem_index import StemIndex
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+WMT17 = Path(__file__).resolve().parents[3] / "Datasets" / "WMT17"
+languageCodes = {306: "en-gb", 314: "de-de"}
+
+
+def recall(index, sentences, gold_terms, languageId, useStemmer):
+    found = total = 0
+    for sentence, terms in zip(sentences, gold_terms):
+        hits = {hit["term"].lower() for hit in index.recognize(sentence, languageId, useStemmer=useStemmer)}
+        total += len(terms)
+        found += sum(term.lower() in hits for term in terms)
+    return found / max(total, 1), total
+
+
+def server_recall(sentences, gold_terms, languageId):
+    from kalcium_client.client import KalciumClient
+
+    kalc = KalciumClient(os.getenv("KALCIUM_BASE_URL_TAG_EVALUATION", ""), int(os.getenv("KALCIUM_TENANT_ID_TAG_EVALUATION", "1")),
+                         urlToken=os.getenv("KALCIUM_API_KEY_TAG_EVALUATION", ""))
+    found = total = 0
+    for sentence, terms in zip(sentences, gold_terms):
+        result = kalc.analyze_sentence(sentence, sourceLanguageIds=[languageId], searchMode="fuzzy", similarityRate=0.70, useStemmer=True)
+        hits = {hit["term"].lower() for hit in result.get("hits", [])}
+        total += len(terms)
+        found += sum(term.lower() in hits for term in terms)
+    return found / max(total, 1), total
+
+
+def synthetic_inflections(snapshot):
+    rng = random.Random(7)
+    endings = {306: ["s", "'s"], 314: ["en", "n", "s", "es", "e", "er"]}
+    for entryId, languageId, term, _ in snapshot.iter_terms():
+        if term[-1].isalpha():
+            yield term + rng.choice(endings[languageId]), term, languageId
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--termbase", default=WMT17 / "Scripts" / "iate.414.terminology.xml")
+    parser.add_argument("--tsv", help="WMT17 term-annotated test set, e.g. iate.414.terminology.tsv or wikt.727.terminology.tsv")
+    parser.add_argument("--server", action="store_true", help="compare with the server's stemmer mode")
+    args = parser.parse_args()
+    if args.server and not args.tsv:
+        parser.error("--server needs the gold terms of --tsv")
+
+    snapshot = TermbaseSnapshot.from_mtf(args.termbase, {code: languageId for languageId, code in languageCodes.items()})
+    start = perf_counter()
+    index = StemIndex(snapshot, languageCodes)
+    print(f"Indexed {len(snapshot)} entries in {(perf_counter() - start) * 1000:.1f} ms")
+
+    inflected = list(synthetic_inflections(snapshot))
+    for useStemmer in [False, True]:
+        found = sum(any(hit["term"] == term for hit in index.recognize(form, languageId, useStemmer)) for form, term, languageId in inflected)
+        print(f"Synthetic inflections, useStemmer={useStemmer}: {found / len(inflected):.1%} of {len(inflected)}")
+
+    if args.tsv:
+        sentences, gold_terms = [], []
+        with open(args.tsv, "r", encoding="utf-8") as file:
+            for line in file:
+                cells = line.rstrip("\n").split("\t")
+                sentences.append(cells[0])
+                gold_terms.append(cells[2::2])
+        for useStemmer in [False, True]:
+            start = perf_counter()
+            score, total = recall(index, sentences, gold_terms, 306, useStemmer)
+            print(f"{Path(args.tsv).name}, useStemmer={useStemmer}: recall {score:.1%} of {total} terms "
+                  f"({(perf_counter() - start) / len(sentences) * 1e6:.0f} us/segment)")
+        if args.server:
+            score, total = server_recall(sentences, gold_terms, 306)
+            print(f"{Path(args.tsv).name}, server useStemmer=True: recall {score:.1%} of {total} terms")
+    else:
+        for path in sorted(WMT17.glob("*terminology_translation.tsv.de")):
+            sentences = open(path, "r", encoding="utf-8").read().splitlines()
+            counts = [sum(len(index.recognize(sentence, 314, useStemmer)) for sentence in sentences) for useStemmer in [False, True]]
+            print(f"{path.name}: {counts[0]} German term hits lowercased, {counts[1]} with stemmer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""End-to-end latency and prompt size of the TAG formats: WMT17 segments through `Filter.inlet` of the Open WebUI filter,
+against a fake Kalcium server and a local OpenAI-compatible stub model.
+
+The fake Kalcium serves the IATE glossary of the WMT17 evaluation (MTF) through the real `KalciumClient`: profile 17 as
+JSON retrieval profile, profile 7 as XML. The stub model sleeps for a base latency plus a per prompt token and per output
+token cost and echoes the source text. Only the German sides of the WMT17 sets are in the repository, so the segments are
+sent as "Translate from German to English".
+
+Reported per dataset and format: retrieval time (HTTP calls of the client), render time of the TAG context within the
+inlet (fragments that the entry cache already holds are not rendered again, "unchanged" is not rendered at all), inlet time,
+TAG and prompt tokens and the simulated end-to-end (inlet + model) p50/p95. Tokens are counted with tiktoken if it is
+installed, otherwise approximated as words and punctuation marks.
+
+Usage: python benchmarks/bench_tag_formats.py [--limit N] [--kalcium-ms MS] [--llm-base-ms MS]
+       [--llm-ms-per-prompt-token MS] [--llm-ms-per-output-token MS] [--dataset path ...]
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from kalcium_client import kalcium_tag_functions as kalf
+
+benchmarks = os.path.dirname(os.path.abspath(__file__))
+# The fake Kalcium server is shared with the filter tests
+sys.path.insert(0, os.path.join(os.path.dirname(benchmarks), "tests"))
+from fake_kalcium import Glossary, glossary_path, kalcium_handler, load_filter, repository, serve, wmt17
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+model_configs = os.path.join(repository, "Open WebUI", "model_configs")
+datasets = [os.path.join(wmt17, "tag_2025_03_25_iate.414.terminology.tsv.en"),
+            os.path.join(wmt17, "gpt-4o-mini_2025_03_20_wikt.727.terminology_translation.tsv.de")]
+
+# (name, tag_format, profileId, model config with the system prompt of the format)
+variants = [("markdown", "markdown", 17, "tag-evaluation-gpt-4o-model-no-format-description-*.json"),
+            ("yaml", "yaml", 17, "tag-evaluation-gpt-4o-model-yaml-*.json"),
+            ("unchanged json", "unchanged", 17, "tag-evaluation-gpt-4o-model-no-format-description-*.json"),
+            # Profile 7 returns Kalcium XML; the XML variant of the evaluation used the system prompt of the TBX model
+            ("unchanged kalcium xml", "unchanged", 7, "tag-evaluation-gpt-4o-model-tbx-*.json")]
+
+
+def count_tokens(text: str):
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+def model_handler(baseLatency: float, perPromptToken: float, perOutputToken: float):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = request["messages"]
+            prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+            # The "translation" is the source text of the user message
+            output = messages[-1]["content"].split("</tag>")[-1].split(":", 1)[-1].strip()
+            completion_tokens = count_tokens(output)
+            time.sleep(baseLatency + prompt_tokens * perPromptToken + completion_tokens * perOutputToken)
+            body = json.dumps({"id": "bench", "object": "chat.completion", "model": request.get("model", "stub"),
+                               "choices": [{"index": 0, "message": {"role": "assistant", "content": output}, "finish_reason": "stop"}],
+                               "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                         "total_tokens": prompt_tokens + completion_tokens}}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def percentile(values: list, q: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def run_variant(module, modelUrl: str, segments: list, tag_format: str, profileId: int, system: str):
+    async def emit(event):
+        pass
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tag_filter = module.Filter()
+    retrieval = []
+    get_content = tag_filter.kalc.get_document_content_by_lang_id
+
+    def timed_get_content(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return get_content(*args, **kwargs)
+        finally:
+            retrieval.append(time.perf_counter() - start)
+
+    tag_filter.kalc.get_document_content_by_lang_id = timed_get_content
+
+    # Rendering is timed where the inlet does it: per fragment and when the fragments are assembled
+    rendering = []
+
+    def timed(function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                rendering.append(time.perf_counter() - start)
+        return wrapper
+
+    render_fragment, assemble_tag = kalf.render_fragment, kalf.assemble_tag
+    kalf.render_fragment, kalf.assemble_tag = timed(render_fragment), timed(assemble_tag)
+    try:
+        return await run_segments(module, tag_filter, modelUrl, segments, tag_format, profileId, system, retrieval, rendering, emit)
+    finally:
+        kalf.render_fragment, kalf.assemble_tag = render_fragment, assemble_tag
+
+
+async def run_segments(module, tag_filter, modelUrl: str, segments: list, tag_format: str, profileId: int, system: str,
+                       retrieval: list, rendering: list, emit):
+    user = {"role": "user", "valves": module.Filter.UserValves(tag_format=tag_format, profileId=profileId, show_citation=False)}
+    rows = []
+    for idx, segment in enumerate(segments):
+        body = {"messages": [{"role": "user", "content": f"Translate from German to English: {segment}"}]}
+        metadata = {"chat_id": f"bench-{tag_format}-{profileId}", "message_id": str(idx)}
+        retrieval.clear()
+        rendering.clear()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            body = await tag_filter.inlet(body, __user__=user, __event_emitter__=emit, __metadata__=metadata)
+        inlet = time.perf_counter() - start
+        context = tag_filter.request_contexts.pop(module.request_key(body, metadata))
+
+        start = time.perf_counter()
+        response = requests.post(f"{modelUrl}/v1/chat/completions",
+                                 json={"model": "stub", "messages": [{"role": "system", "content": system}] + body["messages"]})
+        response.raise_for_status()
+        model = time.perf_counter() - start
+        rows.append({"retrieval": sum(retrieval), "render": sum(rendering), "inlet": inlet, "e2e": inlet + model,
+                     "tag": count_tokens(str(context.tag_context or "")), "prompt": response.json()["usage"]["prompt_tokens"]})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", nargs="*", default=datasets, help="files with one source segment per line")
+    parser.add_argument("--limit", type=int, default=50, help="segments per dataset")
+    parser.add_argument("--kalcium-ms", type=float, default=30.0, help="latency of the fake retrieval endpoint")
+    parser.add_argument("--llm-base-ms", type=float, default=20.0)
+    parser.add_argument("--llm-ms-per-prompt-token", type=float, default=0.05)
+    parser.add_argument("--llm-ms-per-output-token", type=float, default=1.0)
+    args = parser.parse_args()
+
+    glossary = Glossary(glossary_path)
+    kalcium_server, kalcium_url = serve(kalcium_handler(glossary, args.kalcium_ms / 1000))
+    model_server, model_url = serve(model_handler(args.llm_base_ms / 1000, args.llm_ms_per_prompt_token / 1000,
+                                                  args.llm_ms_per_output_token / 1000))
+    module = load_filter(kalcium_url)
+    print(f"tokens: {'tiktoken o200k_base' if tiktoken is not None else 'approximated (words and punctuation)'}, "
+          f"{len(glossary.concepts)} glossary concepts")
+
+    for path in args.dataset:
+        with open(path, "r", encoding="utf-8") as file:
+            segments = [line.strip() for line in file if line.strip()][:args.limit]
+        print(f"\n{os.path.basename(path)}: {len(segments)} segments")
+        print(f"{'format':<22} {'retrieval ms':>12} {'render ms':>10} {'inlet ms':>9} {'TAG tok':>8} {'prompt tok':>11} "
+              f"{'e2e p50 ms':>11} {'e2e p95 ms':>11}")
+        for name, tag_format, profileId, config in variants:
+            with open(sorted(glob.glob(os.path.join(model_configs, config)))[0], "r", encoding="utf-8") as file:
+                system = json.load(file)[0]["params"]["system"]
+            rows = asyncio.run(run_variant(module, model_url, segments, tag_format, profileId, system))
+
+            def mean(key):
+                return statistics.mean(row[key] for row in rows)
+
+            e2e = [row["e2e"] * 1000 for row in rows]
+            print(f"{name:<22} {mean('retrieval') * 1000:>12.1f} {mean('render') * 1000:>10.3f} {mean('inlet') * 1000:>9.1f} "
+                  f"{mean('tag'):>8.1f} {mean('prompt'):>11.1f} {percentile(e2e, 0.5):>11.1f} {percentile(e2e, 0.95):>11.1f}")
+
+    kalcium_server.shutdown()
+    model_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Retrieval calls skipped by the term prefilter on the WMT17 sets, and its false positive rate.
+
+Usage:
+    python benchmarks/bench_term_prefilter.py [--snapshot termbase.jsonl --language-id ID] [--error-rate 0.01]
+                                              [--no-stemmer] [--dataset path ...]
+
+Without `--snapshot`, the prefilter is built from the IATE glossary of the WMT17 evaluation (MTF) and checks the German
+segments of the shipped WMT17 sets (only their German sides are in the repository). `--snapshot` takes a termbase
+snapshot written by `TermbaseSnapshot.to_jsonl` instead, `--language-id` is the source language ID of the segments in it.
+
+Reported per dataset: the fraction of retrieval calls the prefilter eliminates, the segments it passes although the
+local stem index recognizes no term in them (the upper bound of what an exact prefilter could still skip), false
+negatives (skipped segments with a recognized term, must be 0) and the check time per segment. The empirical false
+positive rate of the Bloom filter is measured on the corpus tokens that are not among its keys.
+"""
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+from kalcium_client.stem_index import StemIndex, tokenize
+from kalcium_client.term_bloom import TermPrefilter
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+WMT17 = Path(__file__).resolve().parents[3] / "Datasets" / "WMT17"
+languageCodes = {306: "en-gb", 314: "de-de"}
+datasets = [WMT17 / "tag_2025_03_25_iate.414.terminology.tsv.en",
+            WMT17 / "gpt-4o-mini_2025_03_20_wikt.727.terminology_translation.tsv.de"]
+
+
+def keys_of(prefilter, languageId, snapshot):
+    keys = set()
+    for _, termLanguageId, term, _ in snapshot.iter_terms([languageId]):
+        keys.update(prefilter.term_keys(term, termLanguageId))
+    return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snapshot", help="termbase snapshot (JSON lines), default: IATE glossary of WMT17")
+    parser.add_argument("--language-id", type=int, default=314, help="source language ID of the segments")
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--no-stemmer", action="store_true", help="only lowercased tokens, no stems")
+    parser.add_argument("--dataset", nargs="*", type=Path, default=datasets)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        snapshot = TermbaseSnapshot.from_jsonl(args.snapshot)
+    else:
+        snapshot = TermbaseSnapshot.from_mtf(str(WMT17 / "Scripts" / "iate.414.terminology.xml"),
+                                             {"en-gb": 306, "de-de": 314})
+    languageId = args.language_id
+    useStemmer = not args.no_stemmer
+
+    start = perf_counter()
+    prefilter = TermPrefilter(snapshot, languageCodes, errorRate=args.error_rate, useStemmer=useStemmer)
+    build_time = perf_counter() - start
+    bloom = prefilter.filters.get(languageId)
+    if bloom is None:
+        raise ValueError(f"No terms for language {languageId} in the snapshot")
+    index = StemIndex(snapshot, languageCodes)
+    print(f"{len(snapshot)} entries, {len(bloom)} keys for language {languageId}: {len(bloom.bits)} bytes, "
+          f"{bloom.hashCount} hashes, built in {build_time * 1000:.1f} ms")
+
+    keys = keys_of(prefilter, languageId, snapshot)
+    probes = set()
+    for path in args.dataset:
+        segments = [line.rstrip("\n") for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+        skipped = passed_without_term = false_negatives = 0
+        check_time = 0.0
+        for segment in segments:
+            start = perf_counter()
+            may_match = prefilter.may_match(segment, languageId)
+            check_time += perf_counter() - start
+            has_term = bool(index.recognize(segment, languageId, useStemmer=useStemmer))
+            if not may_match:
+                skipped += 1
+                false_negatives += has_term
+            elif not has_term:
+                passed_without_term += 1
+            for token, _, _ in tokenize(segment):
+                probes.update(prefilter.token_keys(token, languageId))
+        count = max(len(segments), 1)
+        print(f"\n{path.name}: {len(segments)} segments")
+        print(f"  retrieval calls eliminated:  {skipped / count:.1%} ({skipped})")
+        print(f"  passed without term:         {passed_without_term / count:.1%} ({passed_without_term})")
+        print(f"  false negatives:             {false_negatives}")
+        print(f"  check time per segment:      {check_time / count * 1e6:.1f} us")
+
+    negatives = probes - keys
+    false_positives = sum(probe in bloom for probe in negatives)
+    print(f"\nBloom filter false positive rate: {false_positives / max(len(negatives), 1):.3%} on {len(negatives)} "
+          f"corpus tokens that are not keys (expected {bloom.false_positive_rate():.3%})")
+
+
+if __name__ == "__main__":
+    main()
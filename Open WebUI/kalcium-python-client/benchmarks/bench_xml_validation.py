@@ -0,0 +1,87 @@
+"""Cost of `KalciumXML.ensure_valid_xml` on markup-heavy entries: the previous per-value parse and validation
+vs. the pre-scan, per-entry bulk validation and memo of `XMLValidator`.
+
+Usage: python benchmarks/bench_xml_validation.py [number of entries]
+"""
+import logging
+import random
+import sys
+from time import perf_counter
+
+from kalcium_client.xml_utils.KalciumXML import KalciumXML
+
+snippets = ["<em>legal</em> basis", "<strong>Note:</strong> see <a xref-type=\"ulink\" xref-ulink-url=\"https://iate.europa.eu\">IATE</a>",
+            "H<sub>2</sub>O &amp; CO<sub>2</sub>", "<ul><li>first</li><li>second</li></ul>", "Council <b>Regulation</b> (EU)",
+            "R&D department", "x < y", "<u>underlined</u> and <i>italic</i>", "plain definition text"]
+
+
+def entries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+
+    def value(idx):
+        # Half of the values repeat across entries (shared notes, subject fields), half are unique
+        text = " ".join(rng.sample(snippets, 2))
+        return text if rng.random() < 0.5 else f"{text} ({idx})"
+
+    return {f"concept-{idx}": {
+        "fields": {"definition": value(idx), "note": value(idx), "subject": rng.choice(snippets)},
+        "languages": {language: {"fields": {"context": value(idx)},
+                                 "terms": [{"term": rng.choice(["term <sup>2</sup>", "term &amp; co", f"term {idx}"]),
+                                            "fields": {"usage note": value(idx)}}]}
+                      for language in ["English|en-GB", "German|de-DE"]}} for idx in range(count)}
+
+
+def entry_values(kalciumXML: KalciumXML, entry: dict):
+    """(value, schema) pairs in the order `KalciumXML.create_entry` validates them."""
+    values = [(text, kalciumXML.field_xml_schema) for text in entry["fields"].values()]
+    for language in entry["languages"].values():
+        values += [(text, kalciumXML.field_xml_schema) for text in language["fields"].values()]
+        for term in language["terms"]:
+            values.append((term["term"], kalciumXML.term_xml_schema))
+            values += [(text, kalciumXML.field_xml_schema) for text in term["fields"].values()]
+    return values
+
+
+def baseline(kalciumXML: KalciumXML, entry_dictionary: dict):
+    # Previous behaviour: every value with < or & is parsed and validated on its own, every time
+    for entry in entry_dictionary.values():
+        for text, xml_schema in entry_values(kalciumXML, entry):
+            if "<" in text or "&" in text:
+                kalciumXML.validator(xml_schema)._validate(text)
+
+
+def engine(kalciumXML: KalciumXML, entry_dictionary: dict):
+    for entry in entry_dictionary.values():
+        kalciumXML.prevalidate_entry(entry)
+        for text, xml_schema in entry_values(kalciumXML, entry):
+            kalciumXML.ensure_valid_xml(text, xml_schema)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    logging.disable(logging.WARNING)
+    entry_dictionary = entries(count)
+    kalciumXML = KalciumXML()
+
+    start = perf_counter()
+    baseline(kalciumXML, entry_dictionary)
+    baseline_seconds = perf_counter() - start
+
+    kalciumXML.field_validator.memo.clear()
+    kalciumXML.term_validator.memo.clear()
+    start = perf_counter()
+    engine(kalciumXML, entry_dictionary)
+    engine_seconds = perf_counter() - start
+
+    start = perf_counter()
+    engine(kalciumXML, entry_dictionary)
+    warm_seconds = perf_counter() - start
+
+    print(f"{count} entries, {sum(len(entry_values(kalciumXML, entry)) for entry in entry_dictionary.values())} values")
+    print(f"per-value validation: {baseline_seconds:.2f}s")
+    print(f"validation engine:    {engine_seconds:.2f}s ({baseline_seconds / engine_seconds:.1f}x)")
+    print(f"warm memo:            {warm_seconds:.2f}s ({baseline_seconds / warm_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import base64
+import json
+import time
+import zlib
+from collections import deque
+from datetime import timedelta
+from threading import Lock
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+# Keys of JSON bodies and query parameters whose values are never written to a cassette (compared case-insensitively)
+scrubbedKeys = {"token", "urltoken", "password", "username", "email", "apikey", "api_key", "refreshtoken", "bearertoken"}
+placeholder = "***"
+
+
+def scrub(value):
+    """Copy of a JSON value with the values of credential keys replaced, and whether anything was replaced."""
+    if isinstance(value, dict):
+        scrubbed = {}
+        changed = False
+        for key, item in value.items():
+            if key.lower() in scrubbedKeys and isinstance(item, str) and item:
+                scrubbed[key] = placeholder
+                changed = True
+            else:
+                scrubbed[key], itemChanged = scrub(item)
+                changed = changed or itemChanged
+        return scrubbed, changed
+    if isinstance(value, list):
+        items = [scrub(item) for item in value]
+        return [item for item, _ in items], any(changed for _, changed in items)
+    return value, False
+
+
+def scrub_url(url: str):
+    """Path and query of a URL, without scheme and host (so a cassette replays against any base URL) and with
+    credential query parameters replaced."""
+    parts = urlsplit(url)
+    query = parts.query
+    parameters = parse_qsl(query, keep_blank_values=True)
+    if any(key.lower() in scrubbedKeys for key, _ in parameters):
+        query = urlencode([(key, placeholder if key.lower() in scrubbedKeys else value) for key, value in parameters])
+    return parts.path + ("?" + query if query else "")
+
+
+def interaction_key(method: str, url: str, json_body=None, data=None):
+    """Key under which a request is recorded and looked up: method, scrubbed URL and scrubbed body."""
+    if json_body is not None:
+        body = json.dumps(scrub(json_body)[0], sort_keys=True, ensure_ascii=False)
+    elif isinstance(data, bytes):
+        body = data.decode("utf-8", "replace")
+    else:
+        body = data if isinstance(data, str) else None
+    return method.upper(), scrub_url(url), body
+
+
+def scrub_content(content: bytes):
+    """Response body with credential values replaced, unchanged if it is not JSON or has no credentials."""
+    try:
+        value = json.loads(content)
+    except ValueError:
+        return content
+    value, changed = scrub(value)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8") if changed else content
+
+
+class RecordingSession(requests.Session):
+    def __init__(self, path: str, append: bool = False):
+        """requests session that writes every request/response pair to a cassette file, e.g. as `session` of
+        `KalciumClient`. A cassette is a JSON lines file with one interaction per line and the zlib-compressed,
+        base64-encoded response body, so it stays compact and readable up to the last complete request.
+        Credentials are scrubbed: request headers are not recorded, credential keys in JSON bodies and query
+        parameters are replaced (see `scrubbedKeys`).
+
+        Parameters
+        ----------
+        path : str, mandatory
+            cassette file
+        append : bool, optional
+            add to an existing cassette instead of overwriting it"""
+        super().__init__()
+        self.path = path
+        self._lock = Lock()
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def request(self, method, url, **kwargs):
+        start = time.perf_counter()
+        response = super().request(method, url, **kwargs)
+        elapsed = time.perf_counter() - start
+        method, recordedUrl, body = interaction_key(method, url, kwargs.get("json"), kwargs.get("data"))
+        line = json.dumps({"method": method, "url": recordedUrl, "body": body, "status": response.status_code,
+                           "contentType": response.headers.get("Content-Type"), "elapsed": round(elapsed, 6),
+                           "content": base64.b64encode(zlib.compress(scrub_content(response.content))).decode("ascii")},
+                          ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+        return response
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._file.close()
+
+
+class ReplaySession(requests.Session):
+    def __init__(self, path: str, timeScale: float = 1.0):
+        """requests session that serves the responses of a cassette recorded with `RecordingSession` instead of
+        sending requests. Requests are matched by method, URL path and query and body (credentials scrubbed on both
+        sides, so any credentials can be passed to `KalciumClient`). Repeated requests get their recorded responses
+        in order; once those are used up, the last one is served again.
+
+        Parameters
+        ----------
+        path : str, mandatory
+            cassette file
+        timeScale : float, optional
+            factor applied to the recorded response times, 0 serves responses without delay"""
+        super().__init__()
+        self.path = path
+        self.timeScale = timeScale
+        self.interactions = {}
+        self._lock = Lock()
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                interaction = json.loads(line)
+                key = (interaction["method"], interaction["url"], interaction["body"])
+                self.interactions.setdefault(key, deque()).append(interaction)
+
+    def request(self, method, url, **kwargs):
+        key = interaction_key(method, url, kwargs.get("json"), kwargs.get("data"))
+        with self._lock:
+            recorded = self.interactions.get(key)
+            if not recorded:
+                # A transport error, so callers and the circuit breaker handle it like an unreachable server
+                raise requests.ConnectionError(f"No recorded response for {key[0]} {key[1]} in {self.path}")
+            interaction = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        if self.timeScale:
+            time.sleep(interaction["elapsed"] * self.timeScale)
+
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        if interaction["contentType"]:
+            response.headers["Content-Type"] = interaction["contentType"]
+        response._content = zlib.decompress(base64.b64decode(interaction["content"]))
+        response.url = url
+        response.elapsed = timedelta(seconds=interaction["elapsed"])
+        return response
@@ -2,13 +2,21 @@ from typing import List
 import requests
 import json
 import re
-from html import escape
 # Troubleshooting
 import traceback 
 import sys
+import time
 
+from threading import Lock
+
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Todo: 
 # * Change "print" statements to "logging"
 # * Create proper field + value mapping function that can be optionally used by all search/analyze functions 
@@ -16,7 +24,8 @@ from urllib.parse import quote
 
 class KalciumClient:
     def __init__(self, baseUrl: str, tenantId: int, user:str = "", password:str = "",
-                 urlToken:str = "", getAliases: bool = False):
+                 urlToken:str = "", getAliases: bool = False, session: requests.Session = None, timeout: float = 30.0,
+                 circuitBreaker = None):
         """Initialize the Kalcium client.
 
         This constructor sets up the Kalcium client with the specified parameters,
@@ -37,6 +46,14 @@ class KalciumClient:
             generated token for authentication in Kalcium
         getAliases : bool, optional
             retrieve friendly names as a dictionary for fields and values when instancing Kalcium client.
+        session : requests.Session, optional
+            HTTP session used for all requests, e.g. a `cassette.RecordingSession` to record the Kalcium traffic
+            or a `cassette.ReplaySession` to replay it offline.
+        timeout : float, optional
+            seconds to wait for a connection and for each response, None waits indefinitely
+        circuitBreaker : CircuitBreaker, optional
+            stops sending requests after repeated failures (timeouts, connection errors, server errors) and
+            probes for recovery, defaults to `CircuitBreaker()`
 
             It is essential to provide either the `user` and `password` or URL token for login."""
         
@@ -44,6 +61,11 @@ class KalciumClient:
         self.tenantId = tenantId
         self.mappingAliasesPerTb = None
 
+        # Reuse connections, requests already negotiates compressed responses (gzip, deflate, and br/zstd if installed)
+        self.session = session if session is not None else requests.Session()
+        self.timeout = timeout
+        self.circuitBreaker = circuitBreaker if circuitBreaker is not None else CircuitBreaker()
+
         if user == "" and urlToken == "":
             raise Exception("Please provide user and pw or url token for login. See docstring for help.")
 
@@ -87,12 +109,32 @@ class KalciumClient:
         self.targetLanguageIds = [lang for lang in self.availableLanguagesPerTb[self.termbaseIds[0]].keys() if lang != "name"] # Default to first termbase 
 
 
+    def _send(self, method: str, endpoint: str, **kwargs):
+        """Send a request with the client timeout, unless the circuit breaker is open."""
+        if not self.circuitBreaker.allow():
+            raise Exception(f"Kalcium is unavailable after repeated failures, next attempt in {self.circuitBreaker.retry_in():.0f}s")
+        try:
+            response = self.session.request(method, endpoint, timeout=self.timeout, **kwargs)
+        except Exception:
+            self.circuitBreaker.failure()
+            raise
+        except BaseException:
+            # Interrupts and cancellations say nothing about the server, but must not leave a half-open probe
+            # pending, otherwise the circuit would never close again
+            self.circuitBreaker.release()
+            raise
+        if response.status_code >= 500:
+            self.circuitBreaker.failure()
+        else:
+            self.circuitBreaker.success()
+        return response
+
     def _login_by_url_token(self, urlToken:str):
         endpoint = self.baseUrl.rstrip("/") + "/kalcrest/authentication/url-token"
         payload = {"tenantId": self.tenantId, "token": urlToken}
-        response = requests.post(endpoint, json=payload)
+        response = self._send("POST", endpoint, json=payload)
         if response.status_code == 200:
-            jsonDict = json.loads(response.text)
+            jsonDict = loads(response.content)
             return jsonDict
         else:
             raise Exception(f"Error response returned: {response.status_code}\nError message: {response.text}")
@@ -104,9 +146,9 @@ class KalciumClient:
             "UserName": user,
             "Password": password,
         }
-        response = requests.post(endpoint, json=payload)
+        response = self._send("POST", endpoint, json=payload)
         if response.status_code == 200:
-            jsonDict = json.loads(response.text)
+            jsonDict = loads(response.content)
             return jsonDict
         else:
             raise Exception(f"Error response returned: {response.status_code}\nError message: {response.text}")
@@ -122,9 +164,9 @@ class KalciumClient:
                 endpoint = endpoint + f"?ids={tid}"
             else:
                 endpoint = endpoint + f"&ids={tid}"
-        response = requests.get(endpoint, headers=headers)
+        response = self._send("GET", endpoint, headers=headers)
         if response.status_code == 200:
-            termbaseDefinitions = json.loads(response.text)
+            termbaseDefinitions = loads(response.content)
             # print(termbaseDefinitions)
             nameAliasDictPerTb = {}
             for termbaseDefinition in termbaseDefinitions:
@@ -169,9 +211,9 @@ class KalciumClient:
             else:
                 endpoint = endpoint + f"&termbaseIds={tid}"
         headers = {"Authorization": "Bearer " + self.bearerToken}
-        response = requests.get(endpoint, headers=headers)
+        response = self._send("GET", endpoint, headers=headers)
         if response.status_code == 200:
-            jsonResponse = json.loads(response.text)
+            jsonResponse = loads(response.content)
             return jsonResponse
         else:
             raise Exception(f"Error response returned: {response.status_code}\nError message: {response.text}")
@@ -179,10 +221,10 @@ class KalciumClient:
     def get_language_ids(self):
         endpoint = self.baseUrl + "/kalcrest/terminology/languages"
         headers = {"Authorization": "Bearer " + self.bearerToken}
-        response = requests.get(endpoint, headers=headers)
+        response = self._send("GET", endpoint, headers=headers)
         if response.status_code == 200:
             try:
-                languages = json.loads(response.text)
+                languages = loads(response.content)
                 languageIdsDict = {language["id"]: {"name": language["name"], "code": language["code"]} for language in languages}
                 return languageIdsDict
             except KeyError as ke:
@@ -200,9 +242,10 @@ class KalciumClient:
         return languagesPerTb
 
     def search_in_kalcium(self, term: str, termbaseIds: List[int] = [], sourceLanguageIds: List[int] = [], targetLanguageIds: List[int] = [], searchMode: str = "fuzzy", similarityRate: float = 0.75, filterId: int = -1, useStemmer: bool = False,
-        ltsMode: bool = True):
+        ltsMode: bool = True, startIndex: int = 0, maxCount: int = 100):
         """
-        Search in Kalcium termbase
+        Search in Kalcium termbase. Returns one page of `maxCount` results starting at `startIndex`,
+        use `iter_search_in_kalcium` to iterate over all results.
         """
 
         # Default to system parameters if no Ids are passed
@@ -251,8 +294,8 @@ class KalciumClient:
             "mode": mode,
             "similarityRate": similarityRate,
             "useStemmer": useStemmer,
-            "startIndex": 0,
-            "maxCount": 100,
+            "startIndex": startIndex,
+            "maxCount": maxCount,
             "sourceLanguageIds": sourceLanguageIds,
             "targetLanguageIds": targetLanguageIds,
             "termbaseSettings": termbaseSettings,
@@ -274,34 +317,26 @@ class KalciumClient:
 
         # Transform the payload for the LTS endpoint
         if ltsMode:
-            for idx, queryParam in enumerate(queryParams):
+            separator = "?"
+            for queryParam in queryParams:
                 paramValue = payload[queryParam]
-                if paramValue is not None:
-                    if paramValue:
-                        paramValue = "true"
-                    elif not paramValue:
-                        paramValue = "false"
-                else:
+                if paramValue is None:
                     continue
-
-                if idx < 1:
-                    endpoint = endpoint + f"?{queryParam}={paramValue}"
-                else:
-                    if type(paramValue) == list:
-                        for param in paramValue:
-                            endpoint = endpoint + f"&{queryParam}={param}"
-                    else:
-                        endpoint = (endpoint + f"&{queryParam}={escape(str(payload[queryParam]))}")
+                if type(paramValue) == bool:
+                    paramValue = "true" if paramValue else "false"
+                for param in (paramValue if type(paramValue) == list else [paramValue]):
+                    endpoint = endpoint + f"{separator}{queryParam}={quote(str(param))}"
+                    separator = "&"
 
             print(endpoint)
-            response = requests.post(endpoint, headers=headers, json=termbaseSettings)  # only send the termbase settings as payload for LTS
+            response = self._send("POST", endpoint, headers=headers, json=termbaseSettings)  # only send the termbase settings as payload for LTS
         # Send payload as JSON to search-raw endpoint
         else:
-            response = requests.post(endpoint, headers=headers, json=payload)
+            response = self._send("POST", endpoint, headers=headers, json=payload)
         # Check response and return
         if response.status_code == 200:
             try:
-                jsonResponse = json.loads(response.text)
+                jsonResponse = loads(response.content)
                 return jsonResponse
             except:
                 print("Invalid JSON returned!")
@@ -309,6 +344,53 @@ class KalciumClient:
             print("Failed to make search request. Status code:", response.status_code)
             print(response.text)
 
+    def iter_search_in_kalcium(self, term: str, pageSize: int = 100, prefetch: bool = True, maxResults: int = None, **searchParams):
+        """
+        Iterate lazily over all results of a search in Kalcium, page by page.
+        While the caller consumes a page, the next page is already requested in the background.
+        Requests stop as soon as the caller stops iterating.
+        :param term: The search term.
+        :param pageSize: Number of results requested per page.
+        :param prefetch: Request the next page concurrently.
+        :param maxResults: Stop after this number of results.
+        :param searchParams: Further parameters of `search_in_kalcium`, e.g. searchMode or termbaseIds.
+        """
+        def fetch_page(startIndex):
+            searchResponse = self.search_in_kalcium(term, startIndex=startIndex, maxCount=pageSize, **searchParams)
+            if searchResponse is None:
+                # A failed page must not end the iteration as if it was the last one
+                raise Exception(f"Search for '{term}' failed at result {startIndex}")
+            return self._search_hits(searchResponse)
+
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            startIndex = 0
+            returned = 0
+            page = fetch_page(startIndex)
+            while page:
+                lastPage = len(page) < pageSize or (maxResults is not None and returned + len(page) >= maxResults)
+                nextPage = executor.submit(fetch_page, startIndex + pageSize) if executor and not lastPage else None
+                for hit in page:
+                    if maxResults is not None and returned >= maxResults:
+                        return
+                    returned += 1
+                    yield hit
+                if lastPage:
+                    return
+                startIndex += pageSize
+                page = nextPage.result() if nextPage else fetch_page(startIndex)
+        finally:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _search_hits(searchResponse: dict):
+        # Search responses hold the matched terms in "hits" and the full entries in "entries", like analyze_sentence
+        try:
+            return searchResponse["hits"]
+        except (KeyError, TypeError):
+            raise Exception(f"Invalid search response without hits: {str(searchResponse)[:200]}")
+
     def analyze_sentence(self, sentence: str, termbaseIds: List[int] = [], sourceLanguageIds: List[int] = [], targetLanguageIds: List[int] = [], searchMode: str = "fuzzy", similarityRate: float = 0.75, filterId: int = 0, useStemmer: bool = False, includeEntries: bool = True, enableShowNotMatchingCompounds: bool = False):
         """
         Analyze a segment or sentence with Kalcium. Maximum sequence length is 1000 characters.
@@ -368,11 +450,11 @@ class KalciumClient:
         }
         print(endpoint)
 
-        response = requests.post(endpoint, headers=headers, json=payload)
+        response = self._send("POST", endpoint, headers=headers, json=payload)
         jsonResponse = {}
         if response.status_code == 200:
             try:
-                jsonResponse = json.loads(response.text)
+                jsonResponse = loads(response.content)
             except Exception as e:
                 raise Exception("invalid JSON returned", response.text, e)
         else:
@@ -475,14 +557,201 @@ class KalciumClient:
             endpoint = endpoint + target_format
 
         headers = {"Authorization": "Bearer " + self.bearerToken}
-        response = requests.get(endpoint, headers=headers)
+        response = self._send("GET", endpoint, headers=headers)
         if response.status_code == 200:
-            entries = json.loads(response.text)
-            try:
-                content = json.loads(entries["content"])
-                return content
-            except:
-                pass
-            return entries["content"]
+            entries = loads(response.content)
+            # JSON profiles return the entries as JSON string inside the JSON response, XML profiles as XML string
+            content = entries["content"]
+            if isinstance(content, str) and content.lstrip()[:1] in ("[", "{"):
+                try:
+                    return loads(content)
+                except ValueError:
+                    pass
+            return content
         else:
-            raise Exception(f"Error response returned: {response.status_code}\nError message: {response.text}")
\ No newline at end of file
+            raise Exception(f"Error response returned: {response.status_code}\nError message: {response.text}")
+
+    def get_document_content_by_lang_id(self, text:str, profileId:int, sourceLanguageIds:List, targetLanguageIds:List=[],
+                                        maxChunkLength:int=1000, maxQueryLength:int=4000, maxWorkers:int=4):
+        """
+        Retrieve the entries for a text of any length with the retrieval endpoint.
+        Texts exceeding the endpoint limits are split into chunks of whole sentences, which are retrieved concurrently.
+        The results are merged and deduplicated by entry ID.
+        :param maxChunkLength: Maximum number of characters per chunk.
+        :param maxQueryLength: Maximum length of the URL-encoded chunk in the query string.
+        :param maxWorkers: Maximum number of concurrent requests.
+        :return: The merged content in the format of the retrieval profile (XML string or list of entries).
+        """
+        chunks = split_text(text, maxChunkLength, maxQueryLength)
+        if len(chunks) <= 1:
+            return self.get_entry_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
+        with ThreadPoolExecutor(max_workers=min(maxWorkers, len(chunks))) as executor:
+            contents = list(executor.map(lambda chunk: self.get_entry_content_by_lang_id(chunk, profileId, sourceLanguageIds, targetLanguageIds), chunks))
+        return merge_entry_contents(contents)
+
+
+class CircuitBreaker:
+    def __init__(self, failureThreshold: int = 5, recoveryTime: float = 30.0):
+        """Circuit breaker for the requests of a client.
+
+        After `failureThreshold` consecutive failures the circuit opens and requests fail immediately. After
+        `recoveryTime` seconds a single probe request is let through: if it succeeds the circuit closes again,
+        if it fails the circuit stays open for another `recoveryTime`.
+
+        Parameters
+        ----------
+        failureThreshold : int, optional
+            consecutive failures that open the circuit
+        recoveryTime : float, optional
+            seconds until an open circuit lets a probe request through"""
+        self.failureThreshold = failureThreshold
+        self.recoveryTime = recoveryTime
+        self.failures = 0
+        self.openedAt = None
+        self.probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.openedAt is None:
+                return "closed"
+            return "half-open" if self.probing or time.monotonic() - self.openedAt >= self.recoveryTime else "open"
+
+    def allow(self):
+        with self._lock:
+            if self.openedAt is None:
+                return True
+            if self.probing or time.monotonic() - self.openedAt < self.recoveryTime:
+                return False
+            self.probing = True
+            return True
+
+    def retry_in(self):
+        with self._lock:
+            if self.openedAt is None:
+                return 0.0
+            return max(0.0, self.recoveryTime - (time.monotonic() - self.openedAt))
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.openedAt = None
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failureThreshold:
+                self.openedAt = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """End a probe without a result, the next request is let through as a new probe."""
+        with self._lock:
+            self.probing = False
+
+
+def loads(data):
+    """Parse JSON directly from response bytes (or str), using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Helpers for document-level retrieval
+sentenceBoundary = re.compile(r"(?<=[.!?…:;])\s+|\n+")
+
+
+def split_text(text: str, maxChunkLength: int = 1000, maxQueryLength: int = 4000):
+    """Split a text into chunks of whole sentences that stay below the character and URL-encoded length limits."""
+    def fits(chunk):
+        return len(chunk) <= maxChunkLength and len(quote(chunk)) <= maxQueryLength
+
+    if fits(text):
+        return [text] if text.strip() else []
+    def hard_split(word):
+        size = maxChunkLength
+        while size > 1 and not fits(word[:size]):
+            size //= 2
+        return [word[i:i + size] for i in range(0, len(word), size)]
+
+    # Sentences that exceed the limit on their own are split at whitespace, overlong words at the limit
+    pieces = []
+    for sentence in sentenceBoundary.split(text):
+        if fits(sentence):
+            pieces.append(sentence)
+            continue
+        current = ""
+        for word in (part for word in sentence.split() for part in ([word] if fits(word) else hard_split(word))):
+            candidate = f"{current} {word}" if current else word
+            if current and not fits(candidate):
+                pieces.append(current)
+                candidate = word
+            current = candidate
+        pieces.append(current)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if not piece.strip():
+            continue
+        candidate = f"{current} {piece}" if current else piece
+        if current and not fits(candidate):
+            chunks.append(current)
+            candidate = piece
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_entry_contents(contents: list):
+    """Merge the retrieval results of several chunks, keeping the first occurrence of each entry."""
+    contents = [content for content in contents if content and not (isinstance(content, str) and not content.strip())]
+    if not contents:
+        return contents
+    if any(isinstance(content, list) for content in contents):
+        # Chunks without entries answer with a text message instead of an empty list
+        contents = [content for content in contents if not isinstance(content, str)]
+    if all(isinstance(content, list) for content in contents):
+        merged = []
+        seen = set()
+        for content in contents:
+            for entry in content:
+                key = json.dumps(entry["id"] if isinstance(entry, dict) and "id" in entry else entry, sort_keys=True)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(entry)
+        return merged
+    if all(isinstance(content, str) for content in contents):
+        from lxml import etree
+
+        roots = []
+        for content in contents:
+            try:
+                roots.append(etree.fromstring(content.encode("utf-8")))
+            except etree.XMLSyntaxError:
+                # Text messages of chunks without entries ("No information..."), not mixed into the XML
+                continue
+        if not roots:
+            # Plain text profiles cannot be merged structurally
+            return "\n".join(dict.fromkeys(contents))
+        def entry_key(e):
+            # Entries without an ID are compared by their content, as in the JSON branch
+            return ("id", e.find("id").get("id")) if e.find("id") is not None else \
+                ("content", etree.tostring(e, with_tail=False))
+
+        merged = roots[0]
+        seen = {entry_key(e) for e in merged.iter("e")}
+        first = next(merged.iter("e"), None)
+        parent = first.getparent() if first is not None else merged
+        for root in roots[1:]:
+            for e in list(root.iter("e")):
+                key = entry_key(e)
+                if key in seen:
+                    continue
+                seen.add(key)
+                parent.append(e)
+        return etree.tostring(merged, encoding="unicode")
+    raise Exception("Cannot merge retrieval results of different formats")
\ No newline at end of file
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from threading import Lock
+
+from .entry_cache import entry_hash
+
+
+def find_block(content: str, markers):
+    """Offset of the first appended block (e.g. "\\n\\n### TAG context:\\n") in a message, None if there is none."""
+    offsets = [content.find(marker) for marker in markers]
+    offsets = [offset for offset in offsets if offset >= 0]
+    return min(offsets) if offsets else None
+
+
+class Conversation:
+    __slots__ = ("turns", "scopes", "blocks", "maxTurns")
+
+    def __init__(self, maxTurns: int = 50):
+        self.turns = OrderedDict()  # turn key -> (TAG context, entries, fragments, origins)
+        self.scopes = {}  # turn key -> scope the TAG context is valid for (e.g. language pair, profile and format)
+        self.blocks = []  # per message index: (content length, block offset or None)
+        self.maxTurns = maxTurns
+
+    @staticmethod
+    def turn_key(text: str, **settings):
+        """Content hash of a user message together with everything its TAG context depends on."""
+        return entry_hash({"text": text, **{key: str(value) for key, value in settings.items()}})
+
+    def get_turn(self, key):
+        turn = self.turns.get(key)
+        if turn is not None:
+            self.turns.move_to_end(key)
+        return turn
+
+    def last_turn(self, scope=None):
+        """Most recently used turn of the conversation with the given scope (see `put_turn`), None if there is none."""
+        return next((turn for key, turn in reversed(self.turns.items()) if self.scopes.get(key) == scope), None)
+
+    def put_turn(self, key, translation, entries: dict, fragments: dict = None, origins: dict = None, scope=None):
+        """Remember the TAG context of a turn. `scope` holds the settings a context can be reused for by `last_turn`
+        in place of another text's context, e.g. (source language IDs, target language IDs, profile, format)."""
+        self.turns[key] = (translation, entries, fragments or {}, origins or {})
+        self.scopes[key] = scope
+        self.turns.move_to_end(key)
+        while len(self.turns) > self.maxTurns:
+            evicted, _ = self.turns.popitem(last=False)
+            self.scopes.pop(evicted, None)
+
+    def strip_blocks(self, messages: list, markers):
+        """Cut appended blocks off all messages. Messages seen on an earlier turn are cut at their
+        remembered offset, so only new or changed messages are searched."""
+        del self.blocks[len(messages):]
+        for idx, message in enumerate(messages):
+            content = message.get("content")
+            if not isinstance(content, str):
+                continue
+            known = self.blocks[idx] if idx < len(self.blocks) else None
+            if known is not None and known[0] == len(content) and \
+                    (known[1] is None or content.startswith(markers, known[1])):
+                offset = known[1]
+            else:
+                offset = find_block(content, markers)
+                if idx < len(self.blocks):
+                    self.blocks[idx] = (len(content), offset)
+                else:
+                    self.blocks.append((len(content), offset))
+            if offset is not None:
+                message["content"] = content[:offset]
+
+
+class ConversationMemo:
+    def __init__(self, maxConversations: int = 500, maxTurns: int = 50):
+        """Per-conversation memo of TAG contexts and stripped message blocks, least recently used conversations are dropped.
+
+        Parameters
+        ----------
+        maxConversations : int, optional
+            maximum number of remembered conversations
+        maxTurns : int, optional
+            maximum number of remembered TAG contexts per conversation"""
+        self.maxConversations = maxConversations
+        self.maxTurns = maxTurns
+        self._conversations = OrderedDict()
+        self._lock = Lock()
+
+    def conversation(self, chat_id):
+        with self._lock:
+            conversation = self._conversations.get(chat_id)
+            if conversation is None:
+                conversation = self._conversations[chat_id] = Conversation(self.maxTurns)
+            self._conversations.move_to_end(chat_id)
+            while len(self._conversations) > self.maxConversations:
+                self._conversations.popitem(last=False)
+            return conversation
+
+    def __len__(self):
+        return len(self._conversations)
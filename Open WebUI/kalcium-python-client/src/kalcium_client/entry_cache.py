@@ -0,0 +1,77 @@
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+
+
+def entry_hash(content):
+    """Content hash of a retrieved entry (serialized XML element as bytes, or JSON entry dict)."""
+    if not isinstance(content, (bytes, str)):
+        content = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class CachedConcept:
+    __slots__ = ("concept", "fragments")
+
+    def __init__(self, concept):
+        self.concept = concept  # parsed and filtered concept, None if the entry yields no concept
+        self.fragments = {}
+
+    def fragment(self, entry_id, task: str, format: str, render):
+        """Rendered TAG fragment of the concept, rendered with `render(entry_id, concept, task, format)` on first use."""
+        key = (entry_id, task, format)
+        if key not in self.fragments:
+            self.fragments[key] = render(entry_id, self.concept, task, format)
+        return self.fragments[key]
+
+
+class EntryCache:
+    def __init__(self, maxEntries: int = 10000):
+        """LRU cache of parsed concepts and their rendered TAG fragments.
+
+        Keys combine termbase, entry ID, entry content hash, source and target language and profile,
+        so a changed entry in the termbase is parsed again instead of being served stale.
+
+        Parameters
+        ----------
+        maxEntries : int, optional
+            maximum number of cached concepts"""
+        self.maxEntries = maxEntries
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(termbaseId, entryId, entryHash: str, sourceLanguageId, targetLanguageId, profileId):
+        return (termbaseId, entryId, entryHash, sourceLanguageId, targetLanguageId, profileId)
+
+    def get(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def put(self, key, concept):
+        cached = CachedConcept(concept)
+        with self._lock:
+            self._cache[key] = cached
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxEntries:
+                self._cache.popitem(last=False)
+        return cached
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
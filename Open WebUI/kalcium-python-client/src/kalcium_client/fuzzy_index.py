@@ -0,0 +1,206 @@
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import List
+
+
+# Search modes of KalciumClient.analyze_sentence that can be answered locally
+searchModes = {
+    "exact": 1,
+    "wildcard": 2,
+    "fuzzy": 3,
+    "suffix": 5,
+    "prefix": 6,
+    "concordance": 7,
+}
+
+
+def levenshtein(a: str, b: str, maxDistance: int = None):
+    """Edit distance between `a` and `b`. Stops early and returns `maxDistance + 1` once the distance exceeds `maxDistance`."""
+    if len(a) < len(b):
+        a, b = b, a
+    if maxDistance is not None and len(a) - len(b) > maxDistance:
+        return maxDistance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if maxDistance is not None and min(current) > maxDistance:
+            return maxDistance + 1
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str):
+    """Normalized Levenshtein similarity in [0, 1], the local equivalent of Kalcium's `similarityRate`."""
+    if not a and not b:
+        return 1.0
+    return 1 - levenshtein(a, b) / max(len(a), len(b))
+
+
+class FuzzyTermIndex:
+    def __init__(self, snapshot=None, n: int = 3, matchCase: bool = False):
+        """Character n-gram index for fuzzy, prefix and suffix term lookups without a server round trip.
+
+        Parameters
+        ----------
+        snapshot : TermbaseSnapshot, optional
+            termbase snapshot whose terms are indexed
+        n : int, optional
+            length of the character n-grams (default: trigrams)
+        matchCase : bool, optional
+            compare terms case-sensitively"""
+        self.n = n
+        self.matchCase = matchCase
+        self.terms = []  # (normalized term, term, entryId, languageId)
+        self.grams = {}  # languageId -> gram -> [(term index, gram count)]
+        self.lengths = {}  # languageId -> length -> [term index]
+        self.exact = {}  # languageId -> normalized term -> [term index]
+        self._sorted = {}  # languageId -> (sorted terms, sorted reversed terms), built on demand
+        if snapshot is not None:
+            for entryId, languageId, term, _ in snapshot.iter_terms():
+                self.add_term(entryId, languageId, term)
+
+    def _normalize(self, term: str):
+        term = " ".join(term.split())
+        return term if self.matchCase else term.lower()
+
+    def _ngrams(self, term: str):
+        padding = "\x00" * (self.n - 1)
+        padded = padding + term + padding
+        return Counter(padded[i:i + self.n] for i in range(len(padded) - self.n + 1))
+
+    def add_term(self, entryId, languageId, term: str):
+        normalized = self._normalize(term)
+        idx = len(self.terms)
+        self.terms.append((normalized, term, entryId, languageId))
+        grams = self.grams.setdefault(languageId, {})
+        for gram, count in self._ngrams(normalized).items():
+            grams.setdefault(gram, []).append((idx, count))
+        self.lengths.setdefault(languageId, {}).setdefault(len(normalized), []).append(idx)
+        self.exact.setdefault(languageId, {}).setdefault(normalized, []).append(idx)
+        self._sorted.pop(languageId, None)
+
+    def search(self, term: str, languageIds: List = None, searchMode: str = "fuzzy", similarityRate: float = 0.75, maxCount: int = 100):
+        """
+        Search the index. Mirrors the semantics of KalciumClient.search_in_kalcium for the supported modes.
+        :param term: The term or wildcard expression (`*`, `?`) to look up.
+        :param languageIds: Languages to search in. Defaults to all indexed languages.
+        :param searchMode: One of exact, wildcard, fuzzy, suffix, prefix, concordance.
+        :param similarityRate: Minimum normalized Levenshtein similarity for fuzzy hits.
+        :param maxCount: Maximum number of hits returned.
+        :return: Hits ordered by similarity, in the shape of the Kalcium "hits" list.
+        """
+        if searchMode not in searchModes:
+            print("Invalid search mode. Supported search-modes:", ", ".join(searchModes.keys()), "\nUsing 'fuzzy' search instead")
+            searchMode = "fuzzy"
+        query = self._normalize(term)
+        languageIds = languageIds or list(self.exact.keys())
+
+        scored = {}
+        for languageId in languageIds:
+            if languageId not in self.exact:
+                continue
+            if searchMode == "exact":
+                candidates = ((idx, 1.0) for idx in self.exact[languageId].get(query, []))
+            elif searchMode == "fuzzy":
+                candidates = self._fuzzy(query, languageId, similarityRate)
+            elif searchMode == "prefix":
+                candidates = self._prefix(query, languageId, reverse=False)
+            elif searchMode == "suffix":
+                candidates = self._prefix(query[::-1], languageId, reverse=True)
+            elif searchMode == "wildcard":
+                candidates = self._wildcard(query, languageId)
+            else:
+                candidates = self._concordance(query, languageId)
+            for idx, score in candidates:
+                scored[idx] = max(score, scored.get(idx, 0.0))
+
+        ranked = sorted(scored.items(), key=lambda item: (-item[1], self.terms[item[0]][0]))[:maxCount]
+        return [{"entryId": {"id": self.terms[idx][2]}, "languageId": self.terms[idx][3], "term": self.terms[idx][1], "similarity": score}
+                for idx, score in ranked]
+
+    def _fuzzy(self, query: str, languageId, similarityRate: float):
+        queryLength = len(query)
+        if queryLength == 0:
+            return
+        # Length filter: |len(a) - len(b)| <= (1 - rate) * max(len(a), len(b))
+        minLength = math.ceil(queryLength * similarityRate)
+        maxLength = math.floor(queryLength / similarityRate) if similarityRate > 0 else max(self.lengths[languageId], default=0)
+
+        def required_grams(length: int):
+            # q-gram lemma: k edits destroy at most k * n of the (length + n - 1) padded grams
+            longest = max(queryLength, length)
+            maxEdits = math.floor((1 - similarityRate) * longest + 1e-9)
+            return longest + self.n - 1 - maxEdits * self.n, maxEdits
+
+        # Count shared grams for all terms that share at least one gram
+        shared = {}
+        postings = self.grams[languageId]
+        for gram, queryCount in self._ngrams(query).items():
+            for idx, termCount in postings.get(gram, ()):
+                shared[idx] = shared.get(idx, 0) + min(queryCount, termCount)
+
+        # Lengths where the lemma gives no lower bound have to be scanned as a whole
+        candidates = set()
+        for length, indices in self.lengths[languageId].items():
+            if minLength <= length <= maxLength and required_grams(length)[0] <= 0:
+                candidates.update(indices)
+        for idx, count in shared.items():
+            length = len(self.terms[idx][0])
+            if minLength <= length <= maxLength and count >= required_grams(length)[0]:
+                candidates.add(idx)
+
+        for idx in candidates:
+            candidate = self.terms[idx][0]
+            longest = max(queryLength, len(candidate))
+            maxEdits = required_grams(len(candidate))[1]
+            distance = levenshtein(query, candidate, maxEdits)
+            if distance <= maxEdits:
+                score = 1 - distance / longest
+                if score >= similarityRate:
+                    yield idx, score
+
+    def _sorted_terms(self, languageId, reverse: bool):
+        if languageId not in self._sorted:
+            forward = sorted((normalized, idx) for normalized, idx_list in self.exact[languageId].items() for idx in idx_list)
+            backward = sorted((normalized[::-1], idx) for normalized, idx in forward)
+            self._sorted[languageId] = (forward, backward)
+        return self._sorted[languageId][1 if reverse else 0]
+
+    def _prefix(self, query: str, languageId, reverse: bool):
+        terms = self._sorted_terms(languageId, reverse)
+        position = bisect_left(terms, (query, -1))
+        while position < len(terms) and terms[position][0].startswith(query):
+            key, idx = terms[position]
+            yield idx, len(query) / max(len(key), 1)
+            position += 1
+
+    def _wildcard(self, query: str, languageId):
+        pattern = re.compile("".join(".*" if char == "*" else "." if char == "?" else re.escape(char) for char in query) + r"\Z", re.DOTALL)
+        literalPrefix = re.split(r"[*?]", query, maxsplit=1)[0]
+        candidates = self._prefix(literalPrefix, languageId, reverse=False) if literalPrefix else \
+            ((idx, 0.0) for idx_list in self.exact[languageId].values() for idx in idx_list)
+        for idx, _ in candidates:
+            if pattern.match(self.terms[idx][0]):
+                yield idx, 1.0
+
+    def _concordance(self, query: str, languageId):
+        # Every n-gram of the query (without padding) has to occur in a term containing it
+        inner = [query[i:i + self.n] for i in range(len(query) - self.n + 1)]
+        if not inner:
+            candidates = (idx for idx_list in self.exact[languageId].values() for idx in idx_list)
+        else:
+            postings = self.grams[languageId]
+            candidates = None
+            for gram in sorted(set(inner), key=lambda g: len(postings.get(g, ()))):
+                indices = {idx for idx, _ in postings.get(gram, ())}
+                candidates = indices if candidates is None else candidates & indices
+                if not candidates:
+                    return
+        for idx in candidates:
+            candidate = self.terms[idx][0]
+            if query in candidate:
+                yield idx, len(query) / max(len(candidate), 1)
@@ -0,0 +1,375 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import List
+
+# Names written to MTF and Kalcium XML for language codes without a name in the input
+languageNames = {
+    "en-gb": "English (United Kingdom)",
+    "en-us": "English (United States)",
+    "en": "English",
+    "de-de": "German (Germany)",
+    "de-at": "German (Austria)",
+    "de": "German",
+    "cs": "Czech",
+    "it-it": "Italian (Italy)",
+    "it": "Italian",
+    "fr-fr": "French (France)",
+    "fr": "French",
+}
+
+formats = ["tsv", "csv", "mtf", "kalcium", "tbx"]
+xmlNamespace = "{http://www.w3.org/XML/1998/namespace}"
+
+
+def open_glossary(path: str, mode: str = "rb", **options):
+    """Open a glossary file, gzip-compressed if the path ends with .gz."""
+    return (gzip.open if str(path).endswith(".gz") else open)(path, mode, **options)
+
+
+def delimited_dialect(delimiter: str):
+    """csv options of the TSV/CSV reader and writer. Both sides use the same ones, so that terms with tabs, quotes,
+    backslashes or line breaks survive a round trip: TSV escapes with a backslash, CSV quotes."""
+    if delimiter == "\t":
+        return {"delimiter": delimiter, "quoting": csv.QUOTE_NONE, "escapechar": "\\"}
+    return {"delimiter": delimiter, "quoting": csv.QUOTE_MINIMAL}
+
+
+def detect_format(path: str):
+    """Format of a glossary file from its extension, XML files by their root element. Inputs can be gzip-compressed."""
+    extension = os.path.splitext(path[:-3] if path.endswith(".gz") else path)[1].lower()
+    if extension in [".tsv", ".txt", ".tab"]:
+        return "tsv"
+    if extension == ".csv":
+        return "csv"
+    if extension == ".tbx":
+        return "tbx"
+    if extension == ".xml":
+        if not os.path.exists(path):
+            raise ValueError(f"Cannot tell the XML format of {path}, use --to mtf, kalcium or tbx")
+        with open_glossary(path) as file:
+            head = file.read(4096)
+        for tag, format in [(b"<mtf", "mtf"), (b"<kalciumEntries", "kalcium"), (b"<martif", "tbx"), (b"<tbx", "tbx")]:
+            if tag in head:
+                return format
+    raise ValueError(f"Unknown glossary format: {path}")
+
+
+def concept_key(languages: dict):
+    """Order-independent content hash of a concept, used for deduplication."""
+    content = "\x1e".join(f"{code.lower()}\x1f" + "\x1f".join(terms) for code, terms in sorted(languages.items(), key=lambda item: item[0].lower()))
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=12).digest()
+
+
+def deduplicate(concepts):
+    """Drop repeated concepts and keep the first occurrence, in input order. Only a 12-byte hash per concept is kept."""
+    seen = set()
+    for concept in concepts:
+        key = concept_key(concept["languages"])
+        if key not in seen:
+            seen.add(key)
+            yield concept
+
+
+# Readers yield concepts as {"id": str, "languages": {language code: [terms]}}; concepts without terms are skipped
+
+
+def read_delimited(path: str, delimiter: str = "\t", languages: List[str] = None, pairStart: int = None,
+                   synonymSeparator: str = None, names: dict = None):
+    """
+    Read a TSV/CSV glossary.
+    :param languages: Language codes of the columns. Without `pairStart`, the first row is read as header of language
+                      codes if `languages` is not given.
+    :param pairStart: Read alternating source/target term columns from this column on (e.g. 2 for the WMT17
+                      terminology TSV: source segment, target segment, source term, target term, ...). Every pair is a
+                      concept with the languages `languages[0]` and `languages[1]`.
+    :param synonymSeparator: Separator of several terms in one cell, e.g. "|".
+    """
+    with open_glossary(path, "rt", encoding="utf-8-sig", newline="") as file:
+        rows = csv.reader(file, **delimited_dialect(delimiter))
+        if pairStart is not None:
+            if not languages or len(languages) != 2:
+                raise ValueError("Term pairs need exactly two languages")
+            for rowIdx, row in enumerate(rows):
+                for idx in range(pairStart, len(row) - 1, 2):
+                    source, target = row[idx].strip(), row[idx + 1].strip()
+                    if source and target:
+                        yield {"id": f"{rowIdx + 1}.{(idx - pairStart) // 2 + 1}", "languages": {languages[0]: [source], languages[1]: [target]}}
+            return
+        if not languages:
+            languages = [cell.strip() for cell in next(rows)]
+        for rowIdx, row in enumerate(rows):
+            concept = {}
+            for code, cell in zip(languages, row):
+                terms = [term.strip() for term in (cell.split(synonymSeparator) if synonymSeparator else [cell])]
+                terms = [term for term in terms if term]
+                if code and terms:
+                    concept.setdefault(code, []).extend(terms)
+            if concept:
+                yield {"id": str(rowIdx + 1), "languages": concept}
+
+
+def read_mtf(path: str, names: dict = None):
+    from lxml import etree
+
+    with open_glossary(path) as file:
+        for _, conceptGrp in etree.iterparse(file, tag="conceptGrp"):
+            concept = {}
+            for languageGrp in conceptGrp.iterfind("languageGrp"):
+                language = languageGrp.find("language")
+                code = language.get("lang")
+                if names is not None and language.get("type"):
+                    names.setdefault(code, language.get("type"))
+                terms = [term.text.strip() for term in languageGrp.iterfind("termGrp/term") if term.text and term.text.strip()]
+                if terms:
+                    concept.setdefault(code, []).extend(terms)
+            if concept:
+                yield {"id": conceptGrp.findtext("concept") or "", "languages": concept}
+            conceptGrp.clear()
+            while conceptGrp.getprevious() is not None:
+                del conceptGrp.getparent()[0]
+
+
+def read_kalcium_xml(path: str, names: dict = None):
+    from lxml import etree
+
+    languageIds = {}
+    with open_glossary(path) as file:
+        for _, element in etree.iterparse(file, tag=("languageDefinitions", "e")):
+            if element.tag == "languageDefinitions":
+                for language in element.iterfind("l"):
+                    languageIds[language.get("id")] = language.get("c")
+                    if names is not None:
+                        names.setdefault(language.get("c"), language.get("n"))
+                continue
+            concept = {}
+            for language in element.iterfind("l"):
+                terms = [term.get("t") for term in language.iterfind("t") if term.get("t")]
+                if terms:
+                    concept.setdefault(languageIds.get(language.get("lid"), language.get("lid")), []).extend(terms)
+            entryId = element.find("id")
+            if concept:
+                yield {"id": entryId.get("id") if entryId is not None else "", "languages": concept}
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+def read_tbx(path: str, names: dict = None):
+    """Read TBX (v2 termEntry/langSet/tig and v3 conceptEntry/langSec/termSec, with or without namespace)."""
+    from lxml import etree
+
+    with open_glossary(path) as file:
+        for _, entry in etree.iterparse(file, tag=("{*}termEntry", "{*}conceptEntry")):
+            concept = {}
+            for langSet in entry:
+                if etree.QName(langSet).localname not in ["langSet", "langSec"]:
+                    continue
+                code = langSet.get(xmlNamespace + "lang") or langSet.get("lang")
+                for term in langSet.iter("{*}term"):
+                    if term.text and term.text.strip():
+                        concept.setdefault(code, []).append(term.text.strip())
+            if concept:
+                yield {"id": entry.get("id", ""), "languages": concept}
+            entry.clear()
+            while entry.getprevious() is not None:
+                del entry.getparent()[0]
+
+
+readers = {
+    "tsv": read_delimited,
+    "csv": lambda path, **options: read_delimited(path, delimiter=",", **options),
+    "mtf": read_mtf,
+    "kalcium": read_kalcium_xml,
+    "tbx": read_tbx,
+}
+
+
+def language_name(code: str, names: dict):
+    return names.get(code) or languageNames.get(code.lower(), code)
+
+
+def scan_languages(path: str, format: str):
+    """Language codes of a file in order of appearance, in one streaming pass (for writers that need them up front)."""
+    codes = {}
+    for concept in read(path, format):
+        for code in concept["languages"]:
+            codes.setdefault(code, None)
+    return list(codes)
+
+
+def read(path: str, format: str = None, names: dict = None, **options):
+    format = format or detect_format(path)
+    if format in ["tsv", "csv"]:
+        return readers[format](path, names=names, **options)
+    return readers[format](path, names=names)
+
+
+# Writers consume concepts and return the number of written concepts
+
+
+def write_delimited(path: str, concepts, languages: List[str], delimiter: str = "\t", synonymSeparator: str = "|", names: dict = None):
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file, lineterminator="\n", **delimited_dialect(delimiter))
+        writer.writerow(languages)
+        for concept in concepts:
+            writer.writerow([synonymSeparator.join(concept["languages"].get(code, [])) for code in languages])
+            count += 1
+    return count
+
+
+def write_mtf(path: str, concepts, languages: List[str] = None, names: dict = None):
+    from lxml import etree
+
+    names = names or {}
+    count = 0
+    with etree.xmlfile(path, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("mtf"):
+            xf.write("\n")
+            for concept in concepts:
+                count += 1
+                conceptGrp = etree.Element("conceptGrp")
+                etree.SubElement(conceptGrp, "concept").text = str(count)
+                for code, terms in concept["languages"].items():
+                    languageGrp = etree.SubElement(conceptGrp, "languageGrp")
+                    etree.SubElement(languageGrp, "language", type=language_name(code, names), lang=code)
+                    for term in terms:
+                        etree.SubElement(etree.SubElement(languageGrp, "termGrp"), "term").text = term
+                xf.write(conceptGrp, pretty_print=True)
+    return count
+
+
+def write_kalcium_xml(path: str, concepts, languages: List[str] = None, names: dict = None):
+    from .xml_utils.KalciumXML import KalciumXMLWriter
+
+    names = names or {}
+    keys = {code: f"{language_name(code, names)}|{code}" for code in languages} if languages else {}
+    with KalciumXMLWriter(path, languages=list(keys.values()) if languages else None, generate_uuid=True) as writer:
+        for concept in concepts:
+            entry = {"fields": {}, "languages": {}}
+            for code, terms in concept["languages"].items():
+                key = keys.get(code) or f"{language_name(code, names)}|{code}"
+                entry["languages"][key] = {"fields": {}, "terms": [{"term": term, "fields": {}} for term in terms]}
+            writer.write(concept["id"], entry)
+        return writer.count
+
+
+def write_tbx(path: str, concepts, languages: List[str] = None, names: dict = None, sourceLanguage: str = None):
+    from lxml import etree
+
+    count = 0
+    with etree.xmlfile(path, encoding="utf-8") as xf:
+        xf.write_declaration()
+        # The reserved xml prefix must be mapped explicitly, else xmlfile writes an ns0 prefix
+        with xf.element("martif", {"type": "TBX", xmlNamespace + "lang": sourceLanguage or (languages[0] if languages else "en")},
+                        nsmap={"xml": xmlNamespace[1:-1]}):
+            with xf.element("martifHeader"):
+                with xf.element("fileDesc"):
+                    with xf.element("sourceDesc"):
+                        xf.write(etree.Element("p"))
+            with xf.element("text"):
+                with xf.element("body"):
+                    xf.write("\n")
+                    for concept in concepts:
+                        count += 1
+                        termEntry = etree.Element("termEntry", id=f"c{count}")
+                        for code, terms in concept["languages"].items():
+                            langSet = etree.SubElement(termEntry, "langSet", {xmlNamespace + "lang": code})
+                            for term in terms:
+                                etree.SubElement(etree.SubElement(langSet, "tig"), "term").text = term
+                        xf.write(termEntry, pretty_print=True)
+    return count
+
+
+writers = {
+    "tsv": write_delimited,
+    "csv": lambda path, concepts, **options: write_delimited(path, concepts, delimiter=",", **options),
+    "mtf": write_mtf,
+    "kalcium": write_kalcium_xml,
+    "tbx": write_tbx,
+}
+
+
+def convert(inputPaths, outputPath: str, inputFormat: str = None, outputFormat: str = None, languages: List[str] = None,
+            dedup: bool = True, pairStart: int = None, synonymSeparator: str = None):
+    """
+    Stream one or more glossaries into one output file. Concepts are read, deduplicated and written one at a time.
+    :param inputPaths: A path or a list of paths, read in order.
+    :param languages: Language codes of the input columns (TSV/CSV) and of the output columns.
+    :param dedup: Drop repeated concepts, keeping the first occurrence.
+    :return: Number of written concepts.
+    """
+    if isinstance(inputPaths, str):
+        inputPaths = [inputPaths]
+    if outputPath.endswith(".gz"):
+        raise ValueError(f"Cannot write compressed glossaries, compress {outputPath[:-3]} after the conversion")
+    outputFormat = outputFormat or detect_format(outputPath)
+    names = {}
+    options = {"languages": languages, "pairStart": pairStart, "synonymSeparator": synonymSeparator}
+
+    def concepts():
+        for path in inputPaths:
+            format = inputFormat or detect_format(path)
+            yield from read(path, format, names, **(options if format in ["tsv", "csv"] else {}))
+
+    outputLanguages = languages
+    if outputFormat in ["tsv", "csv"] and not outputLanguages:
+        # Column layouts need all languages before the first row
+        outputLanguages = list(dict.fromkeys(code for path in inputPaths for code in scan_languages(path, inputFormat or detect_format(path))))
+    stream = deduplicate(concepts()) if dedup else concepts()
+    start = perf_counter()
+    count = writers[outputFormat](outputPath, stream, languages=outputLanguages, names=names)
+    elapsed = perf_counter() - start
+    print(f"Converted {', '.join(inputPaths)} to {outputPath}: {count} concepts in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} concepts/sec)")
+    return count
+
+
+def _convert_file(job):
+    inputPath, outputPath, options = job
+    return convert(inputPath, outputPath, **options)
+
+
+def convert_files(inputPaths: List[str], outputDir: str, outputFormat: str, maxWorkers: int = None, **options):
+    """Convert several glossaries into one output file each, in parallel processes."""
+    extension = {"tsv": ".tsv", "csv": ".csv", "mtf": ".xml", "kalcium": ".xml", "tbx": ".tbx"}[outputFormat]
+    os.makedirs(outputDir, exist_ok=True)
+    jobs = [(path, os.path.join(outputDir, os.path.splitext(os.path.basename(path))[0] + extension),
+             {"outputFormat": outputFormat, **options}) for path in inputPaths]
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        return sum(executor.map(_convert_file, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert glossaries between TSV/CSV, MTF, Kalcium XML and TBX.")
+    parser.add_argument("inputs", nargs="+", help="input files (TSV/CSV, MTF, Kalcium XML or TBX)")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("-o", "--output", help="output file; all inputs are merged into it")
+    output.add_argument("--output-dir", help="convert every input into its own file in this directory, in parallel")
+    parser.add_argument("--from", dest="inputFormat", choices=formats, help="input format (default: from the file)")
+    parser.add_argument("--to", dest="outputFormat", choices=formats, help="output format (default: from the output file)")
+    parser.add_argument("--languages", nargs="+", help="language codes of the TSV/CSV columns, e.g. EN-GB DE-DE")
+    parser.add_argument("--pairs-from", dest="pairStart", type=int,
+                        help="read alternating source/target term columns from this column on (WMT17 terminology TSVs: 2)")
+    parser.add_argument("--synonym-separator", dest="synonymSeparator", help="separator of several terms in one cell")
+    parser.add_argument("--keep-duplicates", action="store_true", help="do not drop repeated concepts")
+    parser.add_argument("--workers", type=int, default=None, help="parallel processes for --output-dir")
+    args = parser.parse_args()
+
+    options = {"inputFormat": args.inputFormat, "languages": args.languages, "dedup": not args.keep_duplicates,
+               "pairStart": args.pairStart, "synonymSeparator": args.synonymSeparator}
+    if args.output:
+        convert(args.inputs, args.output, outputFormat=args.outputFormat, **options)
+    else:
+        if not args.outputFormat:
+            parser.error("--output-dir needs --to")
+        convert_files(args.inputs, args.output_dir, args.outputFormat, maxWorkers=args.workers, **options)
+
+
+if __name__ == "__main__":
+    main()
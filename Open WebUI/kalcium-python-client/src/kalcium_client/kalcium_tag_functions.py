@@ -1,14 +1,18 @@
 def kalcium_tag_format(entry_dictionary, task="translation", format="markdown", add_codeblock=True):
-    tag_functions = {"translation": {"markdown": markdown_translation_tag,
-                                     "yaml": yaml_translation_tag},
-                     "revision" : {"markdown": markdown_revision_tag,
-                                   "yaml": yaml_revision_tag}}
-
     if len(entry_dictionary) < 1:
+        return assemble_tag([], format, add_codeblock)
+    return assemble_tag([tag_functions[task][format](entry_dictionary)], format, add_codeblock)
+
+def render_fragment(entry_id, concept, task="translation", format="markdown"):
+    # Concepts are rendered independently, so the TAG context is the concatenation of the fragments
+    return tag_functions[task][format]({entry_id: concept})
+
+def assemble_tag(fragments, format="markdown", add_codeblock=True):
+    if len(fragments) < 1:
         context = "No information found in termbase."
     else:
-        context = tag_functions[task][format](entry_dictionary)
-        
+        context = "".join(fragments)
+
     if add_codeblock:
         context = f"```{format}\n" + context.strip() + "\n```"
     else:
@@ -94,4 +98,9 @@ def markdown_revision_tag(entry_dictionary):
     return context
 
 def yaml_revision_tag():
-    pass
\ No newline at end of file
+    pass
+
+tag_functions = {"translation": {"markdown": markdown_translation_tag,
+                                 "yaml": yaml_translation_tag},
+                 "revision" : {"markdown": markdown_revision_tag,
+                               "yaml": yaml_revision_tag}}
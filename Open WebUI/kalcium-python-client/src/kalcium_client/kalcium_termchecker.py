@@ -1,21 +1,38 @@
 from kalcium_client.client import KalciumClient
+from kalcium_client.term_automaton import ForbiddenTermAutomaton
 from typing import List
 import json
 
 class Termchecker(KalciumClient):
-    def __init__(self, kalciumLoginDetails: dict = {}, get_aliases: bool = False):
-        super().__init__(kalciumLoginDetails, get_aliases)
+    def __init__(self, baseUrl: str, tenantId: int, user: str = "", password: str = "", urlToken: str = "",
+                 getAliases: bool = False, automaton: ForbiddenTermAutomaton = None):
+        """Initialize the termchecker with the login parameters of KalciumClient.
 
-    def check_terminology(self, text: str, sourceLanguageIds: List[int] = []) -> str:
+        If a ForbiddenTermAutomaton (built with `ForbiddenTermAutomaton.from_snapshot`) is passed,
+        texts are checked locally without requests to Kalcium."""
+        super().__init__(baseUrl, tenantId, user=user, password=password, urlToken=urlToken, getAliases=getAliases)
+        self.automaton = automaton
+
+    def check_terminology(self, text: str, sourceLanguageIds: List[int] = None) -> str:
         """
         Retrieve terminology from the termbase, by recognizing terminology in the full query of the user.
         :param text: The user query.
+        :param sourceLanguageIds: Languages of the query, defaults to the source languages of the client.
         :return: Context of the found terms as a markdown bullet list.
         """
 
         # Default to system parameters if no Ids are passed
         sourceLanguageIds = (sourceLanguageIds if sourceLanguageIds is not None else self.sourceLanguageIds)
 
+        if self.automaton is not None:
+            correction_dict = {}
+            for languageId in sourceLanguageIds:
+                for concept in self.automaton.corrections(text, languageId).values():
+                    correction_dict[f"concept{len(correction_dict) + 1}"] = concept
+            if not correction_dict:
+                return "No forbidden terms found."
+            return json.dumps(correction_dict, ensure_ascii=False, indent=2)
+
         search_results = self.analyze_sentence(text, includeEntries=True, searchMode="concordance", similarityRate=0.70, useStemmer=True, enableShowNotMatchingCompounds=False)
         if search_results:
             hits = {}
@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+def request_key(body: dict = None, metadata: dict = None):
+    """Key of a chat request: (chat ID, message ID) from the Open WebUI metadata, or from the outlet body
+    (which carries them as "chat_id" and "id"). None if either is missing: such requests cannot be told apart
+    from each other, so their context is not stored."""
+    metadata = metadata or {}
+    body = body or {}
+    chat_id = metadata.get("chat_id") or body.get("chat_id")
+    message_id = metadata.get("message_id") or body.get("id")
+    if chat_id is None or message_id is None:
+        return None
+    return (chat_id, message_id)
+
+
+class RequestContext:
+    __slots__ = ("sourceLanguage", "targetLanguage", "sourceLanguageIds", "targetLanguageIds",
+                 "profileId", "tag_format", "tag_context", "entries", "stream_checker", "created")
+
+    def __init__(self, sourceLanguage: str = None, targetLanguage: str = None, sourceLanguageIds: list = None,
+                 targetLanguageIds: list = None, profileId: int = None, tag_format: str = None, tag_context: str = None,
+                 entries: dict = None, stream_checker=None):
+        """Per-request state handed from a filter's inlet to its stream and outlet hooks."""
+        self.sourceLanguage = sourceLanguage
+        self.targetLanguage = targetLanguage
+        self.sourceLanguageIds = sourceLanguageIds or []
+        self.targetLanguageIds = targetLanguageIds or []
+        self.profileId = profileId
+        self.tag_format = tag_format
+        self.tag_context = tag_context
+        self.entries = entries or {}
+        self.stream_checker = stream_checker
+        self.created = time.monotonic()
+
+
+class RequestContextStore:
+    def __init__(self, ttl: float = 900, maxContexts: int = 1000):
+        """Thread-safe store of request contexts. Contexts are dropped after `ttl` seconds, and the oldest
+        contexts are dropped once more than `maxContexts` are stored, so requests whose outlet never runs
+        (e.g. aborted chats) do not accumulate.
+
+        Parameters
+        ----------
+        ttl : float, optional
+            lifetime of a context in seconds
+        maxContexts : int, optional
+            maximum number of stored contexts"""
+        self.ttl = ttl
+        self.maxContexts = maxContexts
+        self._contexts = OrderedDict()
+        self._lock = Lock()
+
+    def _evict(self, now: float):
+        while self._contexts:
+            key, context = next(iter(self._contexts.items()))
+            if len(self._contexts) <= self.maxContexts and now - context.created < self.ttl:
+                break
+            del self._contexts[key]
+
+    def put(self, key, context: RequestContext):
+        if key is None:
+            return context
+        with self._lock:
+            self._contexts.pop(key, None)
+            self._contexts[key] = context
+            self._evict(context.created)
+        return context
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            self._evict(time.monotonic())
+            return self._contexts.get(key)
+
+    def pop(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            self._evict(time.monotonic())
+            return self._contexts.pop(key, None)
+
+    def __len__(self):
+        return len(self._contexts)
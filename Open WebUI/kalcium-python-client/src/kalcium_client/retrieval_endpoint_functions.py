@@ -1,77 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
-from lxml import etree
 
 from . import kalcium_tag_functions as kalf
+from .entry_cache import EntryCache, entry_hash
+from .term_automaton import ExactTermMatcher
 
 # getting entries using xml retrieval profile
 def get_entries_xml(search_results, sourceLanguageId, targetLanguageId):
     if not search_results:
         return None
-    try:
-        root = etree.fromstring(search_results)
-    except Exception as e:
-        raise Exception(str(f"Invalid XML Format: {str(e)}"))
+    root = parse_xml(search_results)
 
     entry_dict = {}
     for e in root.findall('.//e'):
-        # get entry id
-        entry_id = e.find("id").get("id") if e.find("id") is not None else None
-        if entry_id and entry_id not in entry_dict.keys():
-            entry_dict[entry_id] = {"terms" : {}, "fields" : {}}
-        # get all entry level fields
-        for f in e.findall("f"):
-            e_field_name = f.get("n")
-            e_field_content = f.get("v")
-            if e_field_name is not None:
-                if e_field_name not in entry_dict[entry_id]["fields"].keys():
-                    entry_dict[entry_id]["fields"][e_field_name] = e_field_content
-
-        # get all language and term level fields
-        target_terms = []
-        source_terms = []
-        language_fields = {}
-        for l in e.findall("l"):
-            lid = l.attrib["lid"]
-            # get all language level fields
-            language_fields[int(lid)] = {}
-            for f in l.findall("f"):
-                l_field_name = f.get ("n")
-                l_field_content = f.get("v")
-                if l_field_name not in language_fields[int(lid)].keys():
-                    language_fields[int(lid)][l_field_name] = l_field_content
-            # get all terms
-            for t in l.findall("t"):
-                term_dict = {}
-                term = t.attrib["t"]
-                if term not in term_dict.keys():
-                    term_dict[term] = {}
-
-                # get all term level fields
-                for f in t.findall("f"):
-                    t_field_name = f.get("n")
-                    t_field_content = f.get("v")
-                    if t_field_name not in term_dict[term].keys():
-                        term_dict[term][t_field_name] = t_field_content
-                if int(lid) == targetLanguageId:
-                    target_terms.append(term_dict)
-                elif int(lid) == sourceLanguageId:
-                    source_terms.append(term)
-
-        if sourceLanguageId == targetLanguageId:
-            source_terms.append(next(iter(target_terms[0].keys())))
-        # add target language fields
-        try: 
-            entry_dict[entry_id]["fields"].update(language_fields[targetLanguageId])
-            # add source language fields if they don't exist as target fields
-            for field in language_fields[sourceLanguageId]:
-                if field not in entry_dict[entry_id]["fields"].keys():
-                    entry_dict[entry_id]["fields"][field] = language_fields[sourceLanguageId][field]
-            # add term fields
-            entry_dict[entry_id]["terms"][source_terms[0]] = target_terms
-        except KeyError:
-            entry_dict.pop(entry_id)
+        parse_entry_xml(e, sourceLanguageId, targetLanguageId, entry_dict)
     return entry_dict
 
+def parse_xml(search_results):
+    # lxml is only needed for XML retrieval profiles
+    from lxml import etree
+
+    try:
+        return etree.fromstring(search_results)
+    except Exception as e:
+        raise Exception(str(f"Invalid XML Format: {str(e)}"))
+
+def parse_entry_xml(e, sourceLanguageId, targetLanguageId, entry_dict):
+    """Add the concept of one <e> element to `entry_dict` and return its entry ID."""
+    # get entry id
+    entry_id = e.find("id").get("id") if e.find("id") is not None else None
+    if entry_id and entry_id not in entry_dict.keys():
+        entry_dict[entry_id] = {"terms" : {}, "fields" : {}}
+    # get all entry level fields
+    for f in e.findall("f"):
+        e_field_name = f.get("n")
+        e_field_content = f.get("v")
+        if e_field_name is not None:
+            if e_field_name not in entry_dict[entry_id]["fields"].keys():
+                entry_dict[entry_id]["fields"][e_field_name] = e_field_content
+
+    # get all language and term level fields
+    target_terms = []
+    source_terms = []
+    language_fields = {}
+    for l in e.findall("l"):
+        lid = l.attrib["lid"]
+        # get all language level fields
+        language_fields[int(lid)] = {}
+        for f in l.findall("f"):
+            l_field_name = f.get ("n")
+            l_field_content = f.get("v")
+            if l_field_name not in language_fields[int(lid)].keys():
+                language_fields[int(lid)][l_field_name] = l_field_content
+        # get all terms
+        for t in l.findall("t"):
+            term_dict = {}
+            term = t.attrib["t"]
+            if term not in term_dict.keys():
+                term_dict[term] = {}
+
+            # get all term level fields
+            for f in t.findall("f"):
+                t_field_name = f.get("n")
+                t_field_content = f.get("v")
+                if t_field_name not in term_dict[term].keys():
+                    term_dict[term][t_field_name] = t_field_content
+            if int(lid) == targetLanguageId:
+                target_terms.append(term_dict)
+            elif int(lid) == sourceLanguageId:
+                source_terms.append(term)
+
+    if sourceLanguageId == targetLanguageId:
+        source_terms.append(next(iter(target_terms[0].keys())))
+    # add target language fields
+    try: 
+        entry_dict[entry_id]["fields"].update(language_fields[targetLanguageId])
+        # add source language fields if they don't exist as target fields
+        for field in language_fields[sourceLanguageId]:
+            if field not in entry_dict[entry_id]["fields"].keys():
+                entry_dict[entry_id]["fields"][field] = language_fields[sourceLanguageId][field]
+        # add term fields
+        entry_dict[entry_id]["terms"][source_terms[0]] = target_terms
+    except KeyError:
+        entry_dict.pop(entry_id)
+    return entry_id
+
 # helper for json retrieval profile function
 def get_info(entry: dict, field: str):
     try:
@@ -85,54 +98,159 @@ def get_entries_json(search_results:list, sourceLanguageId:int, targetLanguageId
     
     entry_dict = {}
     for idx, entry in enumerate(search_results):
-        if value_map[profileId]["definition"]["level"] == "concept":
-            definition = get_info(entry, value_map[profileId]["definition"]["name"])
-        elif value_map[profileId]["definition"]["level"] == "language":
-            definition = get_info(entry, f"{language_map[targetLanguageId]}_"+value_map[profileId]["definition"]["name"])
-            if definition is None:
-                definition = get_info(entry, f"{language_map[sourceLanguageId]}_"+value_map[profileId]["definition"]["name"])
-        source_terms = []
-        target_terms = []
-        for i, term in enumerate(entry):
-            source_term = get_info(entry, f"{language_map[sourceLanguageId]}_term_{i+1}")
-            if source_term and get_info(entry, f"{language_map[sourceLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_status"]["name"]) != value_map[profileId]["usage_status"]["forbidden"]:
-                source_terms.append(source_term)
-            target_term = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}")
-            usage_note = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_note"]["name"])
-            usage_status = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_status"]["name"])
-            if target_term:
-                target_dict = {target_term : {}}
-                if usage_note:
-                    target_dict[target_term]["usage_note"] = usage_note
-                if usage_status:
-                    target_dict[target_term]["usage_status"] = usage_status
-                target_terms.append(target_dict)
-        if idx not in entry_dict.keys():
-            entry_dict[idx] = {"terms" : {}, "fields" : {}}
-
-        if source_terms[0] not in entry_dict[idx]["terms"].keys():
-            entry_dict[idx]["terms"][source_terms[0]] = []
-        entry_dict[idx]["terms"][source_terms[0]].extend(target_terms)
-        if definition:
-            entry_dict[idx]["fields"] = {"definition" : definition}
+        parse_entry_json(entry, idx, sourceLanguageId, targetLanguageId, language_map, profileId, value_map, entry_dict)
     return entry_dict
 
+def parse_entry_json(entry:dict, idx:int, sourceLanguageId:int, targetLanguageId:int, language_map:dict, profileId:int, value_map:dict, entry_dict:dict):
+    """Add the concept of one entry of a JSON retrieval profile to `entry_dict` under `idx`."""
+    if value_map[profileId]["definition"]["level"] == "concept":
+        definition = get_info(entry, value_map[profileId]["definition"]["name"])
+    elif value_map[profileId]["definition"]["level"] == "language":
+        definition = get_info(entry, f"{language_map[targetLanguageId]}_"+value_map[profileId]["definition"]["name"])
+        if definition is None:
+            definition = get_info(entry, f"{language_map[sourceLanguageId]}_"+value_map[profileId]["definition"]["name"])
+    source_terms = []
+    target_terms = []
+    for i, term in enumerate(entry):
+        source_term = get_info(entry, f"{language_map[sourceLanguageId]}_term_{i+1}")
+        if source_term and get_info(entry, f"{language_map[sourceLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_status"]["name"]) != value_map[profileId]["usage_status"]["forbidden"]:
+            source_terms.append(source_term)
+        target_term = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}")
+        usage_note = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_note"]["name"])
+        usage_status = get_info(entry, f"{language_map[targetLanguageId]}_term_{i+1}_" + value_map[profileId]["usage_status"]["name"])
+        if target_term:
+            target_dict = {target_term : {}}
+            if usage_note:
+                target_dict[target_term]["usage_note"] = usage_note
+            if usage_status:
+                target_dict[target_term]["usage_status"] = usage_status
+            target_terms.append(target_dict)
+    if idx not in entry_dict.keys():
+        entry_dict[idx] = {"terms" : {}, "fields" : {}}
+
+    if source_terms[0] not in entry_dict[idx]["terms"].keys():
+        entry_dict[idx]["terms"][source_terms[0]] = []
+    entry_dict[idx]["terms"][source_terms[0]].extend(target_terms)
+    if definition:
+        entry_dict[idx]["fields"] = {"definition" : definition}
+    return idx
+
+
+def remove_forbidden_terms(concept:dict, profileId:int, value_map:dict):
+    """
+    Return the concept without forbidden target terms. Concepts of profiles without usage status are returned unchanged.
+    XML entries hold the usage status under the field name of the profile, JSON entries under "usage_status".
+    """
+    usage_status = value_map.get(profileId, {}).get("usage_status", {})
+    if "forbidden" not in usage_status or "terms" not in concept:
+        return concept
 
-def find_translation(kalc, text:str, profileId:int, sourceLanguageIds:List, targetLanguageIds:List, value_map:dict, tag_format:str="markdown", exact_matches_only:bool=False):
+    def forbidden(fields):
+        return isinstance(fields, dict) and \
+            fields.get(usage_status["name"], fields.get("usage_status")) == usage_status["forbidden"]
+
+    return {**concept, "terms": {source_term: [term for term in terms if not any(forbidden(fields) for fields in term.values())]
+                                 for source_term, terms in concept["terms"].items()}}
+
+def exact_matches(entries:dict, text:str, casePolicy:str="smart"):
+    """
+    Keep the concepts whose source term occurs in the text as a whole word, dropping fuzzy matches.
+    All source terms are compiled into one matcher that scans the text once, see `ExactTermMatcher`.
+    """
+    if not entries:
+        return entries
+    matcher = ExactTermMatcher((term for concept in entries.values() for term in concept["terms"]), casePolicy)
+    found = matcher.find(text)
+    return {entry_id: concept for entry_id, concept in entries.items() if any(term in found for term in concept["terms"])}
+
+def entry_items(search_results):
+    """(entry ID, content hash, entry) of each entry of a retrieval result. XML results are parsed once here,
+    so several views of the same result (e.g. per target language) share the parse and the hashes."""
+    if isinstance(search_results, str):
+        from lxml import etree
+
+        return [(e.find("id").get("id") if e.find("id") is not None else None, entry_hash(etree.tostring(e)), e)
+                for e in parse_xml(search_results).findall(".//e")]
+    return [(idx, entry_hash(entry), entry) for idx, entry in enumerate(search_results)]
+
+def get_cached_entries(search_results, sourceLanguageId:int, targetLanguageId:int, profileId:int, value_map:dict, entry_cache,
+                       termbaseId:int=None, tag_format:str="markdown", fragments:dict=None, stats:dict=None, items:list=None,
+                       concepts:dict=None):
+    """
+    Parse, filter and render the entries of a retrieval result, reusing concepts that are already in the entry cache.
+    :param entry_cache: EntryCache holding parsed concepts and rendered fragments.
+    :param fragments: Optional dictionary that receives the rendered fragment of each entry ID (e.g. for citations).
+    :param stats: Optional dictionary that receives the number of entry cache "hits" and "misses".
+    :param items: The result as returned by `entry_items`, if it is already parsed.
+    :param concepts: Optional dictionary that receives the `CachedConcept` of each entry ID, e.g. to render it under another ID.
+    :return: The assembled TAG context and the entry dictionary.
+    """
+    if items is None:
+        items = entry_items(search_results)
+
+    entries = {}
+    fragments = {} if fragments is None else fragments
+    for entry_id, content_hash, entry in items:
+        # JSON entries have no entry ID, so they are identified by content only
+        key = entry_cache.key(termbaseId, entry_id if isinstance(search_results, str) else None, content_hash,
+                              sourceLanguageId, targetLanguageId, profileId)
+        cached = entry_cache.get(key)
+        if stats is not None:
+            outcome = "misses" if cached is None else "hits"
+            stats[outcome] = stats.get(outcome, 0) + 1
+        if cached is None:
+            parsed = {}
+            if isinstance(search_results, str):
+                parse_entry_xml(entry, sourceLanguageId, targetLanguageId, parsed)
+            else:
+                parse_entry_json(entry, entry_id, sourceLanguageId, targetLanguageId, value_map[profileId]["languages"], profileId, value_map, parsed)
+            cached = entry_cache.put(key, remove_forbidden_terms(parsed[entry_id], profileId, value_map) if entry_id in parsed else None)
+        # keep the first occurrence of an entry ID, as for merged document results
+        if cached.concept is None or entry_id in entries:
+            continue
+        entries[entry_id] = cached.concept
+        fragments[entry_id] = cached.fragment(entry_id, "translation", tag_format, kalf.render_fragment)
+        if concepts is not None:
+            concepts[entry_id] = cached
+
+    return kalf.assemble_tag([fragments[entry_id] for entry_id in entries], format=tag_format), entries
+
+def find_translation(kalc, text:str, profileId:int, sourceLanguageIds:List, targetLanguageIds:List, value_map:dict, tag_format:str="markdown", exact_matches_only:bool=False,
+                     entry_cache=None, termbaseId:int=None, fragments:dict=None, stats:dict=None, casePolicy:str="smart",
+                     prefilter=None, concepts:dict=None):
     if not text:
         raise Exception("Text cannot be empty")
     if profileId < 0:
         raise Exception("Invalid profile ID")
 
+    # Texts without any token that starts a term are not sent to the retrieval endpoint (see `TermPrefilter`)
+    if prefilter is not None and not prefilter.may_match(text, sourceLanguageIds[0]):
+        if stats is not None:
+            stats["skipped"] = stats.get("skipped", 0) + 1
+        if tag_format == "unchanged":
+            return "No information found in the termbase.", {}
+        return "```markdown\nNo information found in the termbase.\n```", {}
+
     entries = {}
     try:
-        search_results = kalc.get_entry_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
+        search_results = kalc.get_document_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
     except Exception as e:
         print("Error retrieving terms", e)
         raise Exception(str(e) + text)
     # Return search results as unchanged text or convert to Dictionary from XML/JSON
     if tag_format == "unchanged":
         return search_results if search_results else "No information found in the termbase.", {}
+    if entry_cache is not None and search_results and isinstance(search_results, (str, list)):
+        fragments = {} if fragments is None else fragments
+        context, entries = get_cached_entries(search_results, sourceLanguageIds[0], targetLanguageIds[0], profileId, value_map,
+                                              entry_cache, termbaseId=termbaseId, tag_format=tag_format, fragments=fragments,
+                                              stats=stats, concepts=concepts)
+        if exact_matches_only:
+            entries = exact_matches(entries, text, casePolicy)
+            context = kalf.assemble_tag([fragments[entry_id] for entry_id in entries], format=tag_format)
+        if not entries:
+            return "```markdown\nNo information found in the termbase.\n```", {}
+        return context, entries
     if isinstance(search_results, str):
         entries = get_entries_xml(search_results, sourceLanguageIds[0], targetLanguageIds[0])
     elif isinstance(search_results, list):
@@ -142,37 +260,165 @@ def find_translation(kalc, text:str, profileId:int, sourceLanguageIds:List, targ
         return "```markdown\nNo information found in the termbase.\n```", {}
 
     # removing forbidden terms (in case usage status is enabled)
-    try:
-        final_entries = {}
-        for entry_id in entries.keys():
-            final_entries[entry_id] = {}
-            for concept in entries[entry_id]["terms"].keys():
-                final_entries[entry_id]["terms"] = {}
-                final_entries[entry_id]["terms"][concept] = []
-                for term in entries[entry_id]["terms"][concept]:
-                    for field in term.keys():
-                        if term[field][value_map[profileId]["usage_status"]["name"]] != value_map[profileId]["usage_status"]["forbidden"]:
-                            final_entries[entry_id]["terms"][concept].append(term)
-            final_entries[entry_id]["fields"] = entries[entry_id]["fields"]
-        entries = final_entries
-        if not entries:
-            return "```markdown\nNo information found in the termbase.\n```", {}
-    except KeyError:
-        pass
+    entries = {entry_id: remove_forbidden_terms(entries[entry_id], profileId, value_map) for entry_id in entries.keys()}
     
     # checking for exact matches
-    #if exact_matches_only:
-    #    exact_matches = {}
-    #    for entry_id in entries:
-    #        term = (next(iter(entries[entry_id]["terms"])))
-    #        if term in text:
-    #            exact_matches[entry_id] = entries[entry_id]
-    #    entries = exact_matches
+    if exact_matches_only:
+        entries = exact_matches(entries, text, casePolicy)
+        if not entries:
+            return "```markdown\nNo information found in the termbase.\n```", {}
 
+    if fragments is not None:
+        fragments.update({entry_id: kalf.render_fragment(entry_id, entries[entry_id], "translation", tag_format) for entry_id in entries})
+        return kalf.assemble_tag([fragments[entry_id] for entry_id in entries], format=tag_format), entries
     return kalf.kalcium_tag_format(entries, task="translation", format=tag_format), entries
 
+def find_translation_multi_target(kalc, text:str, profileId:int, sourceLanguageIds:List, targetLanguageIds:List, value_map:dict,
+                                  tag_format:str="markdown", exact_matches_only:bool=False, entry_cache=None, termbaseId:int=None,
+                                  fragments:dict=None, stats:dict=None, casePolicy:str="smart", prefilter=None):
+    """
+    TAG contexts for several target languages from a single retrieval. All target languages are requested in one
+    call, the response is parsed once and each target language gets its own view of the entries.
+    :param entry_cache: EntryCache shared with `find_translation`. Without it, a cache for this call only is used.
+    :param fragments: Optional dictionary that receives the rendered fragments per target language ID.
+    :param stats: Optional dictionary that receives the number of entry cache "hits" and "misses" of all views.
+    :param prefilter: Optional `TermPrefilter`, the retrieval is skipped if the text cannot contain a term.
+    :return: {target language ID: (TAG context, entries)}
+    """
+    if not text:
+        raise Exception("Text cannot be empty")
+    if profileId < 0:
+        raise Exception("Invalid profile ID")
+    if not targetLanguageIds:
+        targetLanguageIds = sourceLanguageIds
+    if prefilter is not None and not prefilter.may_match(text, sourceLanguageIds[0]):
+        if stats is not None:
+            stats["skipped"] = stats.get("skipped", 0) + 1
+        return {targetLanguageId: ("No information found in the termbase." if tag_format == "unchanged" else
+                                   "```markdown\nNo information found in the termbase.\n```", {}) for targetLanguageId in targetLanguageIds}
+
+    try:
+        search_results = kalc.get_document_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
+    except Exception as e:
+        print("Error retrieving terms", e)
+        raise Exception(str(e) + text)
+    if tag_format == "unchanged":
+        return {targetLanguageId: (search_results if search_results else "No information found in the termbase.", {})
+                for targetLanguageId in targetLanguageIds}
+    if not search_results or not isinstance(search_results, (str, list)):
+        return {targetLanguageId: ("```markdown\nNo information found in the termbase.\n```", {}) for targetLanguageId in targetLanguageIds}
+
+    items = entry_items(search_results)
+    entry_cache = EntryCache() if entry_cache is None else entry_cache
+    results = {}
+    for targetLanguageId in targetLanguageIds:
+        target_fragments = {} if fragments is None else fragments.setdefault(targetLanguageId, {})
+        context, entries = get_cached_entries(search_results, sourceLanguageIds[0], targetLanguageId, profileId, value_map,
+                                              entry_cache, termbaseId=termbaseId, tag_format=tag_format,
+                                              fragments=target_fragments, stats=stats, items=items)
+        if exact_matches_only:
+            entries = exact_matches(entries, text, casePolicy)
+            context = kalf.assemble_tag([target_fragments[entry_id] for entry_id in entries], format=tag_format)
+        if not entries:
+            context = "```markdown\nNo information found in the termbase.\n```"
+        results[targetLanguageId] = (context, entries)
+    return results
+
+def merge_entries(results: List[dict], labels: List = None):
+    """
+    Merge the entries of several retrievals in order of precedence. A concept is dropped if a retrieval with higher
+    precedence already returned a concept for one of its source terms (compared case-insensitively).
+    :param results: Entry dictionaries, highest precedence first.
+    :param labels: Prefix of the merged entry IDs per retrieval (e.g. the termbase ID), defaults to the position.
+    :return: The merged entries with IDs "{label}:{entry ID}" and the origin (position, entry ID) of each merged ID.
+    """
+    if labels is None:
+        labels = list(range(1, len(results) + 1))
+    merged = {}
+    origins = {}
+    claimed = set()
+    for idx, entries in enumerate(results):
+        # Concepts of the same retrieval never replace each other, only retrievals with lower precedence are deduplicated
+        terms = set()
+        for entry_id, concept in (entries or {}).items():
+            source_terms = {term.casefold() for term in concept.get("terms", {})}
+            if source_terms & claimed:
+                continue
+            terms |= source_terms
+            merged_id = f"{labels[idx]}:{entry_id}"
+            merged[merged_id] = concept
+            origins[merged_id] = (idx, entry_id)
+        claimed |= terms
+    return merged, origins
+
+def find_translation_multi(kalc, text:str, sources:List[dict], value_map:dict, tag_format:str="markdown", exact_matches_only:bool=False,
+                           entry_cache=None, fragments:dict=None, stats:dict=None, origins:dict=None, maxWorkers:int=4,
+                           casePolicy:str="smart", prefilter=None):
+    """
+    Retrieve the entries of several retrieval profiles/termbases concurrently and merge them, e.g. a customer termbase
+    that overrides a general one. The latency is that of the slowest retrieval instead of the sum.
+    :param sources: Dictionaries with "profileId", "sourceLanguageIds", "targetLanguageIds" and optionally "termbaseId",
+                    highest precedence first. Language IDs are per source, as they can differ between profiles.
+    :param fragments: Optional dictionary that receives the rendered fragment of each merged entry ID.
+    :param stats: Optional dictionary that receives the summed entry cache "hits" and "misses".
+    :param origins: Optional dictionary that receives (source, entry ID) of each merged entry ID.
+    :param maxWorkers: Maximum number of concurrent retrievals.
+    :param prefilter: Optional `TermPrefilter`, each source is skipped if the text cannot contain a term of its source language.
+    :return: The TAG context and the merged entries, see `merge_entries`.
+    """
+    if not sources:
+        raise Exception("Please provide at least one retrieval source")
+
+    def retrieve(source):
+        source_stats = {}
+        concepts = {}
+        context, entries = find_translation(kalc, text, source["profileId"], source["sourceLanguageIds"], source["targetLanguageIds"],
+                                            value_map, tag_format=tag_format, exact_matches_only=exact_matches_only,
+                                            entry_cache=entry_cache, termbaseId=source.get("termbaseId"), stats=source_stats,
+                                            casePolicy=casePolicy, prefilter=prefilter, concepts=concepts)
+        return context, entries, source_stats, concepts
+
+    with ThreadPoolExecutor(max_workers=min(maxWorkers, len(sources))) as executor:
+        futures = [executor.submit(retrieve, source) for source in sources]
+    results = []
+    errors = []
+    for source, future in zip(sources, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            # A failing source does not hide the entries of the others
+            print(f"Error retrieving terms from profile {source['profileId']}", e)
+            errors.append(e)
+            results.append((None, {}, {}, {}))
+    if len(errors) == len(sources):
+        raise errors[0]
+
+    if stats is not None:
+        for _, _, source_stats, _ in results:
+            for outcome, count in source_stats.items():
+                stats[outcome] = stats.get(outcome, 0) + count
+    if tag_format == "unchanged":
+        return "\n\n".join(context for context, _, _, _ in results if context), {}
+
+    labels = [source.get("termbaseId") or source["profileId"] for source in sources]
+    if len(set(labels)) < len(labels):
+        labels = None
+    entries, entry_origins = merge_entries([entries for _, entries, _, _ in results], labels)
+    if origins is not None:
+        origins.update({merged_id: (sources[idx], entry_id) for merged_id, (idx, entry_id) in entry_origins.items()})
+    if not entries:
+        return "```markdown\nNo information found in the termbase.\n```", {}
+
+    # Merged IDs differ from the entry IDs of a source, their fragments are memoized in the entry cache as well
+    fragments = {} if fragments is None else fragments
+    for merged_id, (idx, entry_id) in entry_origins.items():
+        cached = results[idx][3].get(entry_id)
+        fragments[merged_id] = cached.fragment(merged_id, "translation", tag_format, kalf.render_fragment) if cached is not None else \
+            kalf.render_fragment(merged_id, entries[merged_id], "translation", tag_format)
+    return kalf.assemble_tag([fragments[entry_id] for entry_id in entries], format=tag_format), entries
+
 def check_terminology(kalc, text: str, profileId: int, sourceLanguageIds: List, targetLanguageIds: List, value_map: dict,
-                     tag_format: str = "markdown", exact_matches_only: bool = False):
+                     tag_format: str = "markdown", exact_matches_only: bool = False, casePolicy: str = "smart"):
     if not text:
         raise Exception("Text cannot be empty")
     if profileId < 0:
@@ -182,7 +428,7 @@ def check_terminology(kalc, text: str, profileId: int, sourceLanguageIds: List,
 
     entries = {}
     try:
-        search_results = kalc.get_entry_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
+        search_results = kalc.get_document_content_by_lang_id(text, profileId, sourceLanguageIds, targetLanguageIds)
     except Exception as e:
         print("Error retrieving terms", e)
         raise Exception(str(e) + text)
@@ -192,6 +438,9 @@ def check_terminology(kalc, text: str, profileId: int, sourceLanguageIds: List,
         entries = get_entries_json(search_results, sourceLanguageIds[0], targetLanguageIds[0],
                                    value_map[profileId]["languages"], profileId, value_map)
 
+    # checking for exact matches
+    if exact_matches_only:
+        entries = exact_matches(entries, text, casePolicy)
     if not entries:
         return "```markdown\nNo information found in the termbase.\n```", {}
 
@@ -224,13 +473,4 @@ def check_terminology(kalc, text: str, profileId: int, sourceLanguageIds: List,
     if not final_entries:
         return "```markdown\nNo information found in the termbase.\n```", {}
 
-    # checking for exact matches
-    # if exact_matches_only:
-    #    exact_matches = {}
-    #    for entry_id in entries:
-    #        term = (next(iter(entries[entry_id]["terms"])))
-    #        if term in text:
-    #            exact_matches[entry_id] = entries[entry_id]
-    #    entries = exact_matches
-
     return kalf.kalcium_tag_format(final_entries, task="revision", format=tag_format), final_entries
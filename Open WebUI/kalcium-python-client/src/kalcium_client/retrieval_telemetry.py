@@ -0,0 +1,119 @@
+import sqlite3
+import time
+from threading import Lock
+
+from .entry_cache import entry_hash
+
+
+class RetrievalTelemetry:
+    def __init__(self, path: str):
+        """Append-only SQLite log of retrievals: which segments were sent, which concepts came back, how long it took
+        and whether the caches answered it. Only a hash of the segment text is stored.
+
+        Parameters
+        ----------
+        path : str
+            path of the SQLite database, created if it does not exist"""
+        self.path = path
+        self._lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS retrievals (
+                id INTEGER PRIMARY KEY,
+                timestamp REAL NOT NULL,
+                textHash TEXT NOT NULL,
+                sourceLanguageId INTEGER,
+                targetLanguageId INTEGER,
+                profileId INTEGER,
+                termbaseId INTEGER,
+                latency REAL,
+                cacheOutcome TEXT,
+                entryCount INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS concepts (
+                retrievalId INTEGER NOT NULL REFERENCES retrievals(id),
+                entryId TEXT,
+                term TEXT
+            );
+            CREATE INDEX IF NOT EXISTS concepts_term ON concepts(term);
+        """)
+
+    def record(self, text: str, sourceLanguageId: int, targetLanguageId: int, profileId: int, entries: dict,
+               latency: float, cacheOutcome: str, termbaseId: int = None):
+        """
+        Log one retrieval.
+        :param text: The segment sent to the retrieval endpoint (only its hash is stored).
+        :param entries: The entry dictionary returned by `find_translation`.
+        :param latency: Retrieval time in seconds.
+        :param cacheOutcome: e.g. "memo" (reused from an earlier turn), "hit", "partial" or "miss" (entry cache).
+        """
+        with self._lock:
+            cursor = self.connection.execute("BEGIN")
+            cursor.execute("INSERT INTO retrievals (timestamp, textHash, sourceLanguageId, targetLanguageId, profileId, termbaseId, "
+                           "latency, cacheOutcome, entryCount) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (time.time(), entry_hash(text), sourceLanguageId, targetLanguageId, profileId, termbaseId,
+                            latency, cacheOutcome, len(entries or {})))
+            retrievalId = cursor.lastrowid
+            # JSON profiles number their entries per result, so the source term identifies a concept across requests
+            cursor.executemany("INSERT INTO concepts (retrievalId, entryId, term) VALUES (?, ?, ?)",
+                               [(retrievalId, str(entry_id), next(iter(concept.get("terms", {})), None))
+                                for entry_id, concept in (entries or {}).items()])
+            cursor.execute("COMMIT")
+
+    def hot_concepts(self, limit: int = 100, since: float = None):
+        """Most frequently retrieved concepts as (term, sourceLanguageId, targetLanguageId, profileId, termbaseId, count)."""
+        query = ("SELECT c.term, r.sourceLanguageId, r.targetLanguageId, r.profileId, r.termbaseId, COUNT(*) AS hits "
+                 "FROM concepts c JOIN retrievals r ON r.id = c.retrievalId WHERE c.term IS NOT NULL")
+        params = []
+        if since is not None:
+            query += " AND r.timestamp >= ?"
+            params.append(since)
+        query += " GROUP BY c.term, r.sourceLanguageId, r.targetLanguageId, r.profileId, r.termbaseId ORDER BY hits DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def summary(self):
+        """Number of retrievals, mean latency and count per cache outcome."""
+        with self._lock:
+            count, latency = self.connection.execute("SELECT COUNT(*), AVG(latency) FROM retrievals").fetchone()
+            outcomes = dict(self.connection.execute("SELECT cacheOutcome, COUNT(*) FROM retrievals GROUP BY cacheOutcome").fetchall())
+        return {"retrievals": count, "meanLatency": latency, "cacheOutcomes": outcomes}
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+def warm_up(kalc, telemetry: RetrievalTelemetry, value_map: dict, entry_cache, topN: int = 100, timeBudget: float = 10.0,
+            tag_format: str = "markdown", batchSize: int = 25):
+    """
+    Pre-populate the entry cache with the most frequently retrieved concepts of the telemetry log.
+    Hot terms of the same language pair and profile are retrieved together, one line per term.
+    Only the entry cache is warmed: the log stores hashes instead of segment texts, so hot segments cannot be retrieved
+    again, and there is no cache of whole retrieval results. A hot segment is still sent to Kalcium, its concepts are
+    then parsed and rendered from the cache.
+    :param timeBudget: Seconds after which no further retrievals are started.
+    :return: Number of concepts in the entry cache after the warmup.
+    """
+    from . import retrieval_endpoint_functions as ft
+
+    start = time.monotonic()
+    groups = {}
+    for term, sourceLanguageId, targetLanguageId, profileId, termbaseId, _ in telemetry.hot_concepts(topN):
+        if profileId in value_map:
+            groups.setdefault((sourceLanguageId, targetLanguageId, profileId, termbaseId), []).append(term)
+    for (sourceLanguageId, targetLanguageId, profileId, termbaseId), terms in groups.items():
+        for i in range(0, len(terms), batchSize):
+            if time.monotonic() - start > timeBudget:
+                print(f"Warmup stopped after {timeBudget}s with {len(entry_cache)} cached concepts")
+                return len(entry_cache)
+            try:
+                ft.find_translation(kalc, "\n".join(terms[i:i + batchSize]), profileId, [sourceLanguageId], [targetLanguageId],
+                                    value_map, tag_format=tag_format, entry_cache=entry_cache, termbaseId=termbaseId)
+            except Exception as e:
+                print("Error warming up the entry cache", e)
+    print(f"Warmup cached {len(entry_cache)} concepts in {time.monotonic() - start:.2f}s")
+    return len(entry_cache)
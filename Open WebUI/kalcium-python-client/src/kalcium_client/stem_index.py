@@ -0,0 +1,143 @@
+import re
+
+tokenPattern = re.compile(r"\w+(?:[-'’]\w+)*")
+
+
+def tokenize(text: str):
+    """Return (token, start, end) for all word tokens in `text`."""
+    return [(match.group(), match.start(), match.end()) for match in tokenPattern.finditer(text)]
+
+
+def stem_english(word: str):
+    """Light English stemmer: plural, possessive and -ed/-ing suffixes ("Embassies" -> "embassy")."""
+    word = word.lower()
+    if word.endswith(("'s", "’s")):
+        word = word[:-2]
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith(("sses", "ches", "shes", "xes", "zes")):
+        word = word[:-2]
+    elif word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        word = word[:-3]
+    elif word.endswith("ed") and len(word) > 4:
+        word = word[:-2]
+    else:
+        if word.endswith("e") and len(word) > 4:
+            word = word[:-1]
+        return word
+    # undouble final consonant after removing -ing/-ed ("planned" -> "plan")
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeiouls":
+        word = word[:-1]
+    return word
+
+
+def stem_german(word: str):
+    """CISTEM stemmer (Weissweiler & Fraser, 2017) in its case-insensitive variant."""
+    word = word.lower().replace("ü", "u").replace("ö", "o").replace("ä", "a").replace("ß", "ss")
+    word = re.sub(r"^ge(.{4,})", r"\1", word)
+    word = word.replace("sch", "$").replace("ei", "%").replace("ie", "&")
+    word = re.sub(r"(.)\1", r"\1*", word)
+    while len(word) > 3:
+        if len(word) > 5:
+            word, success = re.subn(r"e[mr]$", "", word)
+            if success:
+                continue
+            word, success = re.subn(r"nd$", "", word)
+            if success:
+                continue
+        word, success = re.subn(r"[tesn]$", "", word)
+        if not success:
+            break
+    word = re.sub(r"(.)\*", r"\1\1", word)
+    return word.replace("$", "sch").replace("%", "ei").replace("&", "ie")
+
+
+stemmers = {"en": stem_english, "de": stem_german}
+
+
+def get_stemmer(languageCode: str):
+    """Stemmer for a language code such as "en-gb" or "de-at".
+
+    Uses the Snowball stemmers if `snowballstemmer` is installed, the light stemmers above otherwise.
+    Languages without a stemmer are only lowercased."""
+    language = str(languageCode).lower().split("-")[0]
+    try:
+        import snowballstemmer
+        algorithm = {"en": "english", "de": "german", "cs": "czech", "it": "italian"}.get(language)
+        if algorithm in snowballstemmer.algorithms():
+            snowball = snowballstemmer.stemmer(algorithm)
+            return lambda word: snowball.stemWord(word.lower())
+    except ImportError:
+        pass
+    return stemmers.get(language, str.lower)
+
+
+class StemIndex:
+    def __init__(self, snapshot=None, languageCodes: dict = None):
+        """Precomputed lowercased and stemmed keys for every term of a termbase snapshot.
+
+        Parameters
+        ----------
+        snapshot : TermbaseSnapshot, optional
+            termbase snapshot whose terms are indexed
+        languageCodes : dict, optional
+            maps language IDs to language codes, e.g. `value_map[profileId]["languages"]` of the TAG filter.
+            Without a mapping, the language ID itself is used as code (as for MTF snapshots)."""
+        self.languageCodes = languageCodes or {}
+        self.stemmers = {}
+        self.stemCache = {}  # languageId -> token -> stem
+        self.lowercased = {}  # languageId -> first token -> [(lowercased tokens, entryId, term)]
+        self.stemmed = {}  # languageId -> first stem -> [(stemmed tokens, entryId, term)]
+        if snapshot is not None:
+            for entryId, languageId, term, _ in snapshot.iter_terms():
+                self.add_term(entryId, languageId, term)
+
+    def stem(self, token: str, languageId):
+        cache = self.stemCache.setdefault(languageId, {})
+        try:
+            return cache[token]
+        except KeyError:
+            if languageId not in self.stemmers:
+                self.stemmers[languageId] = get_stemmer(self.languageCodes.get(languageId, languageId))
+            stem = cache[token] = self.stemmers[languageId](token)
+            return stem
+
+    def add_term(self, entryId, languageId, term: str):
+        tokens = [token.lower() for token, _, _ in tokenize(term)]
+        if not tokens:
+            return
+        stems = tuple(self.stem(token, languageId) for token in tokens)
+        self.lowercased.setdefault(languageId, {}).setdefault(tokens[0], []).append((tuple(tokens), entryId, term))
+        self.stemmed.setdefault(languageId, {}).setdefault(stems[0], []).append((stems, entryId, term))
+
+    def recognize(self, text: str, languageId, useStemmer: bool = True):
+        """
+        Find all termbase terms in a segment, including inflected forms.
+        :param text: The segment to analyze.
+        :param languageId: The language of the segment.
+        :param useStemmer: Also match on stems, not only on lowercased tokens (mirrors `useStemmer` of analyze_sentence).
+        :return: Hits in the shape of the Kalcium "hits" list, with the matched span of the segment.
+        """
+        tokens = tokenize(text)
+        lowered = [token.lower() for token, _, _ in tokens]
+        # Each token of the segment is stemmed once
+        stems = [self.stem(token, languageId) for token in lowered] if useStemmer else []
+        hits = []
+        seen = set()
+        for position in range(len(tokens)):
+            candidates = [(key, entryId, term, False, lowered) for key, entryId, term in self.lowercased.get(languageId, {}).get(lowered[position], [])]
+            if useStemmer:
+                candidates += [(key, entryId, term, True, stems) for key, entryId, term in self.stemmed.get(languageId, {}).get(stems[position], [])]
+            for key, entryId, term, stemmed, keys in candidates:
+                end = position + len(key)
+                if tuple(keys[position:end]) != key or (entryId, term, position) in seen:
+                    continue
+                seen.add((entryId, term, position))
+                hits.append({"entryId": {"id": entryId}, "languageId": languageId, "term": term,
+                             "source": text[tokens[position][1]:tokens[end - 1][2]],
+                             "start": tokens[position][1], "end": tokens[end - 1][2], "stemmed": stemmed})
+        return hits
@@ -0,0 +1,305 @@
+import json
+import re
+from collections import deque
+
+
+def normalize(text: str, matchCase: bool = False):
+    """Lowercase `text` without changing its length, so match offsets stay valid for the original text."""
+    if matchCase:
+        return text
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+
+def is_word_char(char: str):
+    return char.isalnum() or char == "_"
+
+
+# Scripts written without spaces between words: Thai, Lao, Myanmar, Khmer, Japanese kana, CJK ideographs
+unsegmentedRanges = [(0x0E00, 0x0EFF), (0x1000, 0x109F), (0x1780, 0x17FF), (0x3040, 0x30FF), (0x3400, 0x4DBF),
+                     (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0xFF66, 0xFF9F), (0x20000, 0x2FFFF)]
+unsegmentedPattern = re.compile("[" + "".join(f"{chr(start)}-{chr(end)}" for start, end in unsegmentedRanges) + "]")
+
+
+def is_unsegmented(char: str):
+    """Character of a script without word separators, where a word boundary can fall between any two characters."""
+    return unsegmentedPattern.match(char) is not None
+
+
+def has_unsegmented(text: str):
+    """True if a text contains characters of scripts without word separators."""
+    return unsegmentedPattern.search(text) is not None
+
+
+def joins_words(left: str, right: str):
+    """True if two adjacent characters belong to the same word, i.e. there is no word boundary between them."""
+    return is_word_char(left) and is_word_char(right) and not (is_unsegmented(left) or is_unsegmented(right))
+
+
+class AhoCorasick:
+    def __init__(self):
+        """Multi-pattern string matcher: all patterns are found in one linear scan of the text."""
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.maxLength = 0
+
+    def add(self, pattern: str, payload):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].append((len(pattern), payload))
+        self.maxLength = max(self.maxLength, len(pattern))
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def scan(self, text: str, state: int = 0, offset: int = 0):
+        """Return all pattern occurrences as (start, end, payload) and the final state.
+        Passing the returned state and the text offset continues the scan on the next part of a text."""
+        goto, fail, output = self.goto, self.fail, self.output
+        matches = []
+        for position, char in enumerate(text, offset):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, payload in output[state]:
+                matches.append((position + 1 - length, position + 1, payload))
+        return matches, state
+
+
+casePolicies = ["smart", "sensitive", "insensitive"]
+
+
+class ExactTermMatcher:
+    def __init__(self, terms, casePolicy: str = "smart"):
+        """Finds which of a set of terms occur in a text as whole words, in one scan of the text.
+
+        Parameters
+        ----------
+        terms : iterable of str
+            terms to find, e.g. all source terms of a retrieval result
+        casePolicy : str, optional
+            "insensitive", "sensitive", or "smart": terms with a capital letter after the first character
+            (acronyms such as "EU", "iPhone") are matched case-sensitively, all others case-insensitively"""
+        if casePolicy not in casePolicies:
+            raise ValueError(f"Invalid case policy {casePolicy}, use one of {casePolicies}")
+        self.casePolicy = casePolicy
+        self.matchCase = casePolicy == "sensitive"
+        self.automaton = AhoCorasick()
+        for term in set(terms):
+            if not term or not term.strip():
+                continue
+            caseSensitive = casePolicy == "smart" and any(char.isupper() for char in term[1:])
+            self.automaton.add(normalize(term, self.matchCase), (term, caseSensitive))
+        self.automaton.build()
+
+    def find(self, text: str):
+        """Return the set of terms that occur in `text` as whole words."""
+        matches, _ = self.automaton.scan(normalize(text, self.matchCase))
+        found = set()
+        for start, end, (term, caseSensitive) in matches:
+            if term in found:
+                continue
+            # Word boundaries only apply to terms that start or end with a word character (e.g. not to "C++")
+            if start > 0 and joins_words(text[start - 1], text[start]):
+                continue
+            if end < len(text) and joins_words(text[end - 1], text[end]):
+                continue
+            if caseSensitive and text[start:end] != term:
+                continue
+            found.add(term)
+        return found
+
+
+class ForbiddenTermAutomaton:
+    def __init__(self, matchCase: bool = False):
+        """Maps forbidden terms to their preferred replacement and finds them in a text in one linear scan.
+
+        Parameters
+        ----------
+        matchCase : bool, optional
+            match forbidden terms case-sensitively"""
+        self.matchCase = matchCase
+        self.automata = {}  # languageId -> AhoCorasick
+
+    @classmethod
+    def from_snapshot(cls, snapshot, profileId: int, value_map: dict, matchCase: bool = False):
+        """Compile all forbidden terms of a termbase snapshot, using the usage status definition of `value_map[profileId]`."""
+        usage_status = value_map[profileId]["usage_status"]
+        definition = value_map[profileId].get("definition", {}).get("name", "definition")
+        automaton = cls(matchCase)
+        for entryId, entry in snapshot.entries.items():
+            for language in entry["languages"]:
+                status = {}
+                for term in language.get("terms", []):
+                    status[term["term"]] = next((field.get("value") for field in term.get("fields", [])
+                                                 if field.get("name") == usage_status["name"]), None)
+                def has_status(value, type):
+                    return bool(value) and type in usage_status and usage_status[type] in value
+
+                forbidden = [term for term, value in status.items() if has_status(value, "forbidden")]
+                if not forbidden:
+                    continue
+                # Preferred terms replace forbidden ones, allowed terms if the profile has no preferred status
+                replacement = next((term for term, value in status.items() if has_status(value, "preferred")), None) or \
+                    next((term for term, value in status.items() if has_status(value, "allowed")), None)
+                fields = language.get("fields", []) + entry.get("fields", [])
+                entryDefinition = next((field.get("value") for field in fields if definition in field.get("name", "")), "")
+                for term in forbidden:
+                    automaton.add_term(language["languageId"], term, replacement, entryId, entryDefinition)
+        automaton.build()
+        return automaton
+
+    def add_term(self, languageId, forbiddenTerm: str, replacement: str, entryId=None, definition: str = ""):
+        automaton = self.automata.setdefault(languageId, AhoCorasick())
+        automaton.add(normalize(forbiddenTerm, self.matchCase),
+                      {"entryId": entryId, "term": forbiddenTerm, "replacement": replacement, "definition": definition})
+
+    def build(self):
+        for automaton in self.automata.values():
+            automaton.build()
+
+    def check(self, text: str, languageId):
+        """
+        Find all forbidden terms in a text.
+        :param text: The text to check, e.g. the LLM output.
+        :param languageId: The language of the text.
+        :return: A list of hits with the forbidden term, its replacement and the position in the text.
+        """
+        automaton = self.automata.get(languageId)
+        if automaton is None:
+            return []
+        matches, _ = automaton.scan(normalize(text, self.matchCase))
+        return self._whole_word_hits(text, matches)
+
+    @staticmethod
+    def _whole_word_hits(text: str, matches: list, offset: int = 0):
+        # Only whole words count as hits, and terms inside a longer hit (e.g. "Computer" in "Personal Computer") are dropped
+        hits = []
+        lastEnd = -1
+        for start, end, payload in sorted(matches, key=lambda match: (match[0], -match[1])):
+            if end <= lastEnd:
+                continue
+            before, after = start - offset - 1, end - offset
+            if (before >= 0 and joins_words(text[before], text[before + 1])) or \
+                    (after < len(text) and joins_words(text[after - 1], text[after])):
+                continue
+            hits.append({**payload, "source": text[start - offset:end - offset], "start": start, "end": end})
+            lastEnd = end
+        return hits
+
+    def corrections(self, text: str, languageId):
+        """Forbidden terms of the text in the format of `Termchecker.check_terminology`."""
+        correction_dict = {}
+        concepts = {}
+        for hit in self.check(text, languageId):
+            if hit["entryId"] not in concepts:
+                concepts[hit["entryId"]] = f"concept{len(concepts) + 1}"
+                correction_dict[concepts[hit["entryId"]]] = {"Forbidden terms": {}}
+                if hit["definition"]:
+                    correction_dict[concepts[hit["entryId"]]]["Definition"] = str(hit["definition"])
+            correction_dict[concepts[hit["entryId"]]]["Forbidden terms"][hit["source"]] = hit["replacement"]
+        return correction_dict
+
+    def check_terminology(self, text: str, languageId) -> str:
+        correction_dict = self.corrections(text, languageId)
+        if not correction_dict:
+            return "No forbidden terms found."
+        return json.dumps(correction_dict, ensure_ascii=False, indent=2)
+
+
+class StreamScanner:
+    def __init__(self, automaton: AhoCorasick, matchCase: bool = False):
+        """Runs an automaton over a text that arrives in chunks. Each chunk is scanned once, the automaton state
+        and a carry-over suffix of `maxLength + 2` characters connect it to the previous chunks.
+        A match is reported once no longer match starting at the same position can still appear."""
+        self.automaton = automaton
+        self.matchCase = matchCase
+        self.state = 0
+        self.length = 0
+        self.suffix = ""
+        self.pending = []
+        self.lastEnd = -1
+
+    def feed(self, delta: str, final: bool = False):
+        matches, self.state = self.automaton.scan(normalize(delta, self.matchCase), self.state, self.length)
+        window = self.suffix + delta
+        windowStart = self.length - len(self.suffix)
+        self.length += len(delta)
+        self.pending.extend(matches)
+        if final:
+            ready, self.pending = self.pending, []
+        else:
+            # A longer match starting at the same position would have ended within maxLength characters
+            ready = [match for match in self.pending if match[0] + self.automaton.maxLength < self.length]
+            self.pending = [match for match in self.pending if match[0] + self.automaton.maxLength >= self.length]
+        hits = [hit for hit in ForbiddenTermAutomaton._whole_word_hits(window, ready, windowStart) if hit["end"] > self.lastEnd]
+        if hits:
+            self.lastEnd = max(hit["end"] for hit in hits)
+        self.suffix = window[-(self.automaton.maxLength + 2):]
+        return hits
+
+
+class StreamingTermChecker:
+    def __init__(self, automaton: ForbiddenTermAutomaton, languageId, entries: dict = None):
+        """Incremental terminology check of streamed LLM output.
+
+        Parameters
+        ----------
+        automaton : ForbiddenTermAutomaton
+            compiled forbidden terms
+        languageId : int
+            language of the output
+        entries : dict, optional
+            TAG entries as returned by `find_translation`; the target terms of each concept are expected in the output"""
+        self.forbidden = StreamScanner(automaton.automata.get(languageId, AhoCorasick()), automaton.matchCase)
+        self.concepts = {}
+        expected = AhoCorasick()
+        for entry_id, concept in (entries or {}).items():
+            for translations in concept["terms"].values():
+                for translation in translations:
+                    for target_term in translation:
+                        expected.add(normalize(target_term, automaton.matchCase), {"entryId": entry_id, "term": target_term})
+                        self.concepts.setdefault(entry_id, []).append(target_term)
+        expected.build()
+        self.expected = StreamScanner(expected, automaton.matchCase)
+        self.found = set()
+
+    def feed(self, delta: str, final: bool = False):
+        """
+        Check the next chunk of the output.
+        :param delta: The new text of the output.
+        :param final: The output is complete.
+        :return: New forbidden term hits, concepts whose expected term appeared, and (when final) concepts still missing.
+        """
+        forbidden = self.forbidden.feed(delta, final)
+        found = []
+        for hit in self.expected.feed(delta, final):
+            if hit["entryId"] not in self.found:
+                self.found.add(hit["entryId"])
+                found.append(hit)
+        result = {"forbidden": forbidden, "found": found}
+        if final:
+            result["missing"] = {entry_id: terms for entry_id, terms in self.concepts.items() if entry_id not in self.found}
+        return result
+
+    def finish(self):
+        return self.feed("", final=True)
@@ -0,0 +1,130 @@
+import hashlib
+import math
+
+from .stem_index import get_stemmer, tokenize
+from .term_automaton import has_unsegmented
+
+maxCachedStems = 100000
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, errorRate: float = 0.01):
+        """Compact probabilistic set of strings: a key that was added is always found, a key that was not
+        added is found with a probability of about `errorRate` once `capacity` keys are added.
+
+        Parameters
+        ----------
+        capacity : int, mandatory
+            expected number of keys
+        errorRate : float, optional
+            false positive rate at `capacity` keys"""
+        capacity = max(1, capacity)
+        self.size = max(64, math.ceil(-capacity * math.log(errorRate) / math.log(2) ** 2))
+        self.hashCount = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashCount)]
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str):
+        return all(self.bits[position >> 3] >> (position & 7) & 1 for position in self._positions(key))
+
+    def false_positive_rate(self):
+        """Expected false positive rate for the number of added keys."""
+        return (1 - math.exp(-self.hashCount * self.count / self.size)) ** self.hashCount
+
+    def __len__(self):
+        return self.count
+
+
+class TermPrefilter:
+    def __init__(self, snapshot=None, languageCodes: dict = None, errorRate: float = 0.01, useStemmer: bool = True):
+        """Per-language Bloom filters over the first token of every term of a termbase snapshot, lowercased and
+        stemmed. A text in which no token (or stem) can start a term has no match in the termbase, so its retrieval
+        call can be skipped. Terms added to the termbase after the snapshot, and matches the retrieval endpoint
+        finds only fuzzily (e.g. misspellings), are not seen by the prefilter. Texts in scripts without word separators
+        (Chinese, Japanese, Thai, ...) cannot be split into tokens and always pass.
+
+        Parameters
+        ----------
+        snapshot : TermbaseSnapshot, optional
+            termbase snapshot whose terms are added
+        languageCodes : dict, optional
+            maps language IDs to language codes for the stemmers, e.g. `value_map[profileId]["languages"]`.
+            Without a mapping, the language ID itself is used as code (as for MTF snapshots).
+        errorRate : float, optional
+            false positive rate of each Bloom filter
+        useStemmer : bool, optional
+            also add and look up stems, so inflected forms of a term's first token pass"""
+        self.languageCodes = languageCodes or {}
+        self.errorRate = errorRate
+        self.useStemmer = useStemmer
+        self.stemmers = {}
+        self.stemCache = {}  # languageId -> token -> stem
+        self.filters = {}  # languageId -> BloomFilter
+        if snapshot is not None:
+            keys = {}
+            for _, languageId, term, _ in snapshot.iter_terms():
+                keys.setdefault(languageId, set()).update(self.term_keys(term, languageId))
+            for languageId, languageKeys in keys.items():
+                self.add_keys(languageId, languageKeys)
+
+    def stem(self, token: str, languageId):
+        # Stemming dominates the check, each token is stemmed once. The tokens of user texts are unbounded,
+        # so the cache of a language starts over once it reaches `maxCachedStems`.
+        cache = self.stemCache.setdefault(languageId, {})
+        try:
+            return cache[token]
+        except KeyError:
+            if languageId not in self.stemmers:
+                self.stemmers[languageId] = get_stemmer(self.languageCodes.get(languageId, languageId))
+            if len(cache) >= maxCachedStems:
+                cache.clear()
+            stem = cache[token] = self.stemmers[languageId](token)
+            return stem
+
+    def token_keys(self, token: str, languageId):
+        token = token.lower()
+        return {token, self.stem(token, languageId)} if self.useStemmer else {token}
+
+    def term_keys(self, term: str, languageId):
+        tokens = tokenize(term)
+        return self.token_keys(tokens[0][0], languageId) if tokens else set()
+
+    def add_keys(self, languageId, keys):
+        """Create the filter of a language from all of its keys (see `term_keys`), sized for their number."""
+        keys = set(keys)
+        bloom = self.filters[languageId] = BloomFilter(len(keys), self.errorRate)
+        for key in keys:
+            bloom.add(key)
+
+    def may_match(self, text: str, languageId):
+        """
+        Check whether a text can contain a term of the termbase.
+        :param text: The text to retrieve terms for.
+        :param languageId: The source language of the text.
+        :return: False if no token of the text starts a term, True otherwise (also for languages without a filter
+                 and for texts in scripts without word separators, where a token is a whole run of words).
+        """
+        bloom = self.filters.get(languageId)
+        if bloom is None or has_unsegmented(text):
+            return True
+        seen = set()
+        for token, _, _ in tokenize(text):
+            token = token.lower()
+            if token in seen:
+                continue
+            seen.add(token)
+            if token in bloom or (self.useStemmer and self.stem(token, languageId) in bloom):
+                return True
+        return False
@@ -0,0 +1,206 @@
+import argparse
+import gzip
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from .client import KalciumClient
+from .termbase_snapshot import TermbaseSnapshot, open_snapshot
+
+
+def page_entries(searchResponse, startIndex: int = 0):
+    """
+    Entries of a search response page and the number of its hits. Searches page by hits (matched terms), and an entry
+    with several matching terms has several hits, so only the hit count tells whether a page was the last one.
+    Raises for failed requests, which would otherwise end the export early.
+    """
+    if searchResponse is None:
+        raise Exception(f"Search request failed at result {startIndex}, the export can be resumed")
+    try:
+        return searchResponse["entries"], len(searchResponse["hits"])
+    except (KeyError, TypeError):
+        raise Exception(f"Invalid search response without hits and entries at result {startIndex}: {str(searchResponse)[:200]}")
+
+
+def restore_snapshot(snapshotPath: str, entries: int):
+    """
+    Cut a snapshot back to its first `entries` lines, the state recorded in the progress file.
+    An interrupted export can leave a partial line behind, and in a gzip-compressed snapshot a gzip member without its
+    end, which makes the file unreadable once more data is appended. Compressed snapshots are therefore rewritten,
+    plain ones truncated.
+    :return: The IDs of the kept entries.
+    """
+    seen = set()
+    if str(snapshotPath).endswith(".gz"):
+        restoredPath = snapshotPath + ".restore.gz"
+        with gzip.open(snapshotPath, "rt", encoding="utf-8") as source, open_snapshot(restoredPath, "w") as target:
+            try:
+                for line in source:
+                    if len(seen) == entries or not line.endswith("\n"):
+                        break
+                    seen.add(TermbaseSnapshot.entry_id(json.loads(line)))
+                    target.write(line)
+            except (EOFError, zlib.error, gzip.BadGzipFile):
+                pass
+        if len(seen) == entries:
+            os.replace(restoredPath, snapshotPath)
+        else:
+            os.remove(restoredPath)
+    else:
+        offset = 0
+        with open(snapshotPath, "rb") as file:
+            for line in file:
+                if len(seen) == entries or not line.endswith(b"\n"):
+                    break
+                seen.add(TermbaseSnapshot.entry_id(json.loads(line)))
+                offset += len(line)
+        if len(seen) == entries:
+            os.truncate(snapshotPath, offset)
+    if len(seen) != entries:
+        raise Exception(f"{snapshotPath} holds {len(seen)} of the {entries} exported entries, restart the export")
+    return seen
+
+
+def export_termbase(kalc: KalciumClient, termbaseId: int, outputPath: str, format: str = "jsonl", pageSize: int = 200,
+                    maxWorkers: int = 4, resume: bool = True, term: str = "*", searchMode: str = "wildcard"):
+    """
+    Export all entries of a termbase to a local snapshot.
+    Pages of entries are requested in parallel and streamed to a JSONL snapshot (gzip-compressed if `outputPath` ends with .gz),
+    so memory stays bounded by `maxWorkers` pages. Progress is recorded next to the snapshot and an interrupted export
+    continues where it stopped. With `format="xml"`, the finished snapshot is converted to Kalcium XML.
+    :param termbaseId: The ID of the termbase to export.
+    :param outputPath: Path of the snapshot (or of the Kalcium XML file for format "xml").
+    :param format: "jsonl" or "xml".
+    :param pageSize: Number of hits per search request, a page holds fewer entries if entries match with several terms.
+    :param maxWorkers: Number of pages requested concurrently.
+    :param resume: Continue an interrupted export instead of starting over.
+    :return: Number of exported entries.
+    """
+    if format not in ["jsonl", "xml"]:
+        raise ValueError(f"Unsupported export format: {format}")
+    snapshotPath = outputPath if format == "jsonl" else outputPath + ".jsonl.gz"
+    progressPath = snapshotPath + ".progress"
+    languageIds = [lang for lang in kalc.availableLanguagesPerTb[termbaseId].keys() if lang != "name"]
+
+    # Resume from the last completely written page, a failed page raises and leaves the progress as it is
+    progress = {"termbaseId": termbaseId, "pageSize": pageSize, "nextStartIndex": 0, "entries": 0, "done": False}
+    seen = set()
+    if resume and os.path.exists(progressPath) and os.path.exists(snapshotPath):
+        with open(progressPath, "r", encoding="utf-8") as file:
+            saved = json.load(file)
+        if saved["termbaseId"] == termbaseId and saved["pageSize"] == pageSize:
+            progress = saved
+            if not progress["done"]:
+                seen = restore_snapshot(snapshotPath, progress["entries"])
+            print(f"Resuming export of termbase {termbaseId} at result {progress['nextStartIndex']} ({progress['entries']} entries written)")
+
+    def fetch_page(startIndex):
+        searchResponse = kalc.search_in_kalcium(term, termbaseIds=[termbaseId], sourceLanguageIds=list(languageIds),
+                                                targetLanguageIds=list(languageIds), searchMode=searchMode,
+                                                startIndex=startIndex, maxCount=pageSize)
+        return page_entries(searchResponse, startIndex)
+
+    def save_progress():
+        with open(progressPath, "w", encoding="utf-8") as file:
+            json.dump(progress, file)
+
+    start = perf_counter()
+    written = 0
+    if not progress["done"]:
+        with open_snapshot(snapshotPath, "a" if progress["nextStartIndex"] else "w") as snapshot, \
+                ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            startIndex = progress["nextStartIndex"]
+            pending = [executor.submit(fetch_page, startIndex + idx * pageSize) for idx in range(maxWorkers)]
+            nextIndex = startIndex + maxWorkers * pageSize
+            while pending:
+                entries, hitCount = pending.pop(0).result()
+                for entry in entries:
+                    entryId = TermbaseSnapshot.entry_id(entry)
+                    if entryId in seen:
+                        continue
+                    seen.add(entryId)
+                    snapshot.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                    written += 1
+                    progress["entries"] += 1
+                snapshot.flush()
+                progress["nextStartIndex"] += pageSize
+                if hitCount < pageSize:
+                    for future in pending:
+                        future.cancel()
+                    break
+                save_progress()
+                pending.append(executor.submit(fetch_page, nextIndex))
+                nextIndex += pageSize
+                elapsed = perf_counter() - start
+                print(f"{progress['entries']} entries exported ({written / max(elapsed, 1e-9):.0f} entries/sec)")
+        progress["done"] = True
+        save_progress()
+
+    elapsed = perf_counter() - start
+    print(f"Exported {written} entries in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} entries/sec) to {snapshotPath}")
+
+    if format == "xml":
+        languageNames = {languageId: f"{kalc.systemLanguageIds[languageId]['name']}|{kalc.systemLanguageIds[languageId]['code']}"
+                         for languageId in languageIds}
+        snapshot_to_kalcium_xml(snapshotPath, outputPath, languageNames)
+    return progress["entries"]
+
+
+def to_kalcium_dict(entry: dict, languageNames: dict):
+    """Convert an entry in Kalcium JSON shape into the dictionary shape of `KalciumXML.from_dict`."""
+    def fields_to_dict(fields: list):
+        field_dict = {}
+        for field in fields or []:
+            if field.get("name") in field_dict:
+                values = field_dict[field["name"]]
+                field_dict[field["name"]] = (values if isinstance(values, list) else [values]) + [field.get("value", "")]
+            else:
+                field_dict[field.get("name")] = field.get("value", "")
+        return field_dict
+
+    return {"fields": fields_to_dict(entry.get("fields")),
+            "languages": {languageNames[language["languageId"]]: {
+                "fields": fields_to_dict(language.get("fields")),
+                "terms": [{"term": term["term"], "fields": fields_to_dict(term.get("fields"))} for term in language.get("terms", [])]}
+                for language in entry["languages"] if language["languageId"] in languageNames}}
+
+
+def snapshot_to_kalcium_xml(snapshotPath: str, xmlPath: str, languageNames: dict):
+    """Stream a JSONL snapshot into a Kalcium XML file, one <e> element at a time."""
+    from .xml_utils.KalciumXML import KalciumXMLWriter
+
+    with KalciumXMLWriter(xmlPath, languages=list(languageNames.values()), generate_entry_ID=False) as writer:
+        with open_snapshot(snapshotPath, "r") as snapshot:
+            for line in snapshot:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                entryId = TermbaseSnapshot.entry_id(entry)
+                writer.write(entryId, {**to_kalcium_dict(entry, languageNames), "entry_ID": entryId})
+    print(f"Converted {snapshotPath} to {xmlPath}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a Kalcium termbase to a local JSONL snapshot or Kalcium XML file.")
+    parser.add_argument("termbaseId", type=int, help="ID of the termbase to export")
+    parser.add_argument("output", help="output path (.jsonl, .jsonl.gz or .xml)")
+    parser.add_argument("--format", choices=["jsonl", "xml"], help="defaults to xml for .xml outputs, jsonl otherwise")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--restart", action="store_true", help="ignore the progress of an interrupted export")
+    parser.add_argument("--base-url", default=os.getenv("KALCIUM_BASE_URL", ""))
+    parser.add_argument("--tenant-id", type=int, default=int(os.getenv("KALCIUM_TENANT_ID", "1")))
+    parser.add_argument("--api-key", default=os.getenv("KALCIUM_API_KEY", ""), help="URL token, or set KALCIUM_USER/KALCIUM_PASSWORD")
+    args = parser.parse_args()
+
+    kalc = KalciumClient(args.base_url, args.tenant_id, user=os.getenv("KALCIUM_USER", ""),
+                         password=os.getenv("KALCIUM_PASSWORD", ""), urlToken=args.api_key)
+    format = args.format or ("xml" if args.output.endswith(".xml") else "jsonl")
+    export_termbase(kalc, args.termbaseId, args.output, format=format, pageSize=args.page_size,
+                    maxWorkers=args.workers, resume=not args.restart)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import gzip
+import json
+from typing import List
+
+
+def open_snapshot(path: str, mode: str = "r"):
+    """Open a JSONL snapshot as text, gzip-compressed if the path ends with .gz."""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class TermbaseSnapshot:
+    def __init__(self, entries: List[dict] = None):
+        """Local, read-only copy of termbase entries.
+
+        Entries are stored in the JSON shape returned by Kalcium (e.g. the "entries" of `analyze_sentence`):
+
+            {"id": {"id": 1}, "fields": [...],
+             "languages": [{"languageId": 306, "fields": [...], "terms": [{"term": "embassy", "fields": [...]}]}]}
+
+        Parameters
+        ----------
+        entries : list, optional
+            entries in Kalcium JSON shape"""
+        self.entries = {}
+        for entry in entries or []:
+            self.add_entry(entry)
+
+    def add_entry(self, entry: dict):
+        self.entries[self.entry_id(entry)] = entry
+
+    @staticmethod
+    def entry_id(entry: dict):
+        entryId = entry["id"] if "id" in entry else entry["entryId"]
+        if isinstance(entryId, dict):
+            entryId = entryId["id"]
+        return entryId
+
+    @classmethod
+    def from_jsonl(cls, path: str):
+        """Load a snapshot with one Kalcium JSON entry per line (optionally gzip-compressed)."""
+        snapshot = cls()
+        with open_snapshot(path, "r") as file:
+            for line in file:
+                if line.strip():
+                    snapshot.add_entry(json.loads(line))
+        return snapshot
+
+    @classmethod
+    def from_mtf(cls, path: str, language_map: dict = None):
+        """Load a snapshot from a MultiTerm (MTF) XML export, e.g. `Datasets/WMT17/Scripts/iate.414.terminology.xml`.
+
+        :param language_map: maps lowercased MTF language codes (e.g. "en-gb") to Kalcium language IDs.
+                             Without a map the lowercased code is used as language ID.
+        """
+        from lxml import etree
+
+        language_map = language_map or {}
+        snapshot = cls()
+        for _, conceptGrp in etree.iterparse(path, tag="conceptGrp"):
+            concept = conceptGrp.findtext("concept")
+            entryId = int(concept) if concept and concept.isdigit() else concept
+            languages = []
+            for languageGrp in conceptGrp.findall("languageGrp"):
+                code = languageGrp.find("language").get("lang", "").lower()
+                terms = [{"term": term.text, "fields": []} for term in languageGrp.iterfind("termGrp/term") if term.text]
+                languages.append({"languageId": language_map.get(code, code), "fields": [], "terms": terms})
+            snapshot.add_entry({"id": {"id": entryId}, "fields": [], "languages": languages})
+            conceptGrp.clear()
+        return snapshot
+
+    def to_jsonl(self, path: str):
+        with open_snapshot(path, "w") as file:
+            for entry in self.entries.values():
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def languages(self):
+        return {language["languageId"] for entry in self.entries.values() for language in entry["languages"]}
+
+    def iter_terms(self, languageIds: List = None):
+        """Yield (entryId, languageId, term, termDict) for all terms, optionally restricted to `languageIds`."""
+        for entryId, entry in self.entries.items():
+            for language in entry["languages"]:
+                if languageIds and language["languageId"] not in languageIds:
+                    continue
+                for term in language.get("terms", []):
+                    yield entryId, language["languageId"], term["term"], term
+
+    def __len__(self):
+        return len(self.entries)
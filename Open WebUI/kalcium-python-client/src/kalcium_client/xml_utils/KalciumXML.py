@@ -1,80 +1,318 @@
+import hashlib
+import heapq
 import logging
+import os
 from lxml import etree as ET
 import re
+import random
+import shutil
+import tempfile
 import uuid
-import chardet
-from collections import Counter
-from xml.sax.saxutils import escape, unescape
+from contextlib import ExitStack
+from functools import lru_cache
+
+schema_dir = os.path.dirname(os.path.abspath(__file__))
+schema_files = {"field": "Kalcium-v3-fields.xsd", "term": "Kalcium-v3-terms.xsd"}
+
+
+# Same as xml.sax.saxutils.escape/unescape, which would import urllib.request on import
+def escape(text: str):
+    return text.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+
+
+def unescape(text: str):
+    return text.replace("&lt;", "<").replace("&gt;", ">").replace("&amp;", "&")
+
+
+markupPattern = re.compile(r"<(/?)([A-Za-z_][\w.-]*)?")
+entityPattern = re.compile(r"&(?:amp|lt|gt|quot|apos);")
+
+
+class XMLValidator:
+    def __init__(self, xml_schema, schema_root, maxCache: int = 100000):
+        """Validation of field and term values against a Kalcium XSD, with a memo of validated values.
+
+        Values are classified by a pre-scan of their markup before anything is parsed: plain text and text with
+        predefined entities only are valid as is, markup with tags the schema does not define can only end up
+        fully escaped. Only the remaining values are parsed and validated.
+
+        Parameters
+        ----------
+        xml_schema : XMLSchema
+            schema the values have to validate against inside an <f> element
+        schema_root : Element
+            parsed XSD, used to collect the element names the schema defines
+        maxCache : int, optional
+            maximum number of memoized values"""
+        self.xml_schema = xml_schema
+        self.schema_root = schema_root
+        self.tags = {element.get("name") for element in schema_root.iter("{http://www.w3.org/2001/XMLSchema}element")} - {"f"}
+        self.maxCache = maxCache
+        self.memo = {}
+        self.hits = 0
+
+    def classify(self, text: str):
+        """Return "plain" (valid as is), "escape" (can only be valid fully escaped) or "markup" (has to be validated)."""
+        if "<" not in text:
+            if "&" not in text or text.count("&") == len(entityPattern.findall(text)):
+                return "plain"
+            return "markup"
+        if "<!" in text or "<?" in text:
+            return "markup"
+        for match in markupPattern.finditer(text):
+            if match.group(2) is None or match.group(2) not in self.tags:
+                return "escape"
+        return "markup"
+
+    def validate(self, text: str):
+        try:
+            result = self.memo[text]
+            self.hits += 1
+            return result
+        except KeyError:
+            pass
+        kind = self.classify(text)
+        if kind == "plain":
+            return text
+        if kind == "escape":
+            result = escape(text)
+            logging.warning(f"XML fully escaped (potential loss of formatting) to: '{result}'")
+        else:
+            result = self._validate(text)
+        self._remember(text, result)
+        return result
+
+    def _remember(self, text: str, result: str):
+        if len(self.memo) >= self.maxCache:
+            del self.memo[next(iter(self.memo))]
+        self.memo[text] = result
+
+    def _validate(self, text: str):
+        unmodified_text = text
+        try:
+            try:
+                text = unescape(escape(text))
+                xml_doc = ET.XML("<f>" + text + "</f>")
+            except ET.XMLSyntaxError:
+                logging.warning(f"Invalid XML provided: '{text}'")
+                logging.info(f"Attempting to fix by double-escaping &.")
+                text = unescape(escape(text).replace("&amp;", "&amp;amp;"))
+                xml_doc = ET.XML("<f>" + text + "</f>")
+            # Validate the XML
+            self.xml_schema.assertValid(xml_doc)
+            logging.info(f"XML successfully validated as:'{text}'")
+            return text
+        except (ET.XMLSyntaxError, ET.DocumentInvalid) as err:
+            text = escape(unmodified_text)
+            logging.warning(err)
+            logging.warning(f"XML fully escaped (potential loss of formatting) to: '{text}'")
+            return text
+
+    def prevalidate(self, texts):
+        """Validate the values of an entry in bulk: all values with markup are parsed as one document,
+        each <f> element is validated and the results are memoized. Falls back to validating values one by one
+        if the joint document is not well-formed."""
+        pending = []
+        for text in dict.fromkeys(texts):
+            if isinstance(text, str) and text not in self.memo:
+                kind = self.classify(text)
+                if kind == "markup" and "<!" not in text and "<?" not in text:
+                    pending.append(text)
+                elif kind != "plain":
+                    self.validate(text)
+        if len(pending) < 2:
+            for text in pending:
+                self.validate(text)
+            return
+        candidates = [unescape(escape(text)) for text in pending]
+        try:
+            fields = ET.XML("<fields>" + "".join("<f>" + text + "</f>" for text in candidates) + "</fields>")
+        except ET.XMLSyntaxError:
+            fields = None
+        if fields is None or len(fields) != len(pending):
+            for text in pending:
+                self.validate(text)
+            return
+        for text, candidate, field in zip(pending, candidates, fields):
+            if self.xml_schema.validate(field):
+                self._remember(text, candidate)
+            else:
+                # Well-formed but invalid values are fully escaped, as in `_validate`
+                self._remember(text, self._validate(text))
+
+
+class FieldStatistics:
+    __slots__ = ("count", "entries", "maxPerEntry", "empty", "totalLength", "maxLength", "_hashes", "_heap", "_lastEntry",
+                 "_inEntry", "sampleSize")
+
+    def __init__(self, sampleSize: int = 1024):
+        """Occurrence and value statistics of one field. The number of distinct values is exact up to `sampleSize`
+        distinct values and estimated from the `sampleSize` smallest value hashes (k minimum values) beyond that,
+        so memory does not grow with the termbase."""
+        self.count = 0
+        self.entries = 0
+        self.maxPerEntry = 0
+        self.empty = 0
+        self.totalLength = 0
+        self.maxLength = 0
+        self.sampleSize = sampleSize
+        self._hashes = set()
+        self._heap = []  # negated smallest hashes, largest kept hash on top
+        self._lastEntry = None
+        self._inEntry = 0
+
+    def add(self, value: str, entry: int):
+        self.count += 1
+        if entry != self._lastEntry:
+            self._lastEntry = entry
+            self.entries += 1
+            self._inEntry = 0
+        self._inEntry += 1
+        self.maxPerEntry = max(self.maxPerEntry, self._inEntry)
+        value = value or ""
+        if not value:
+            self.empty += 1
+        self.totalLength += len(value)
+        self.maxLength = max(self.maxLength, len(value))
+        value_hash = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        if value_hash in self._hashes:
+            return
+        if len(self._heap) < self.sampleSize:
+            heapq.heappush(self._heap, -value_hash)
+            self._hashes.add(value_hash)
+        elif value_hash < -self._heap[0]:
+            self._hashes.discard(-heapq.heapreplace(self._heap, -value_hash))
+            self._hashes.add(value_hash)
+
+    def distinct(self):
+        if len(self._heap) < self.sampleSize:
+            return len(self._heap)
+        return round((self.sampleSize - 1) * 2 ** 64 / -self._heap[0])
+
+    def to_dict(self):
+        return {"count": self.count, "entries": self.entries, "maxPerEntry": self.maxPerEntry, "empty": self.empty,
+                "distinct": self.distinct(), "distinctExact": len(self._heap) < self.sampleSize,
+                "meanLength": self.totalLength / self.count if self.count else 0, "maxLength": self.maxLength}
+
+
+@lru_cache(maxsize=None)
+def load_validator(kind: str):
+    """Parse and compile the "field" or "term" schema next to this module, once per process on first use."""
+    with open(os.path.join(schema_dir, schema_files[kind]), "rb") as schema_file:
+        schema_root = ET.XML(schema_file.read())
+    return XMLValidator(ET.XMLSchema(schema_root), schema_root)
 
 
 class KalciumXML:
-    # Parse the schema
-    field_xml_schema_root = ET.XML(open("./Kalcium-v3-fields.xsd", "rb").read())
-    field_xml_schema = ET.XMLSchema(field_xml_schema_root)
-    term_xml_schema_root = ET.XML(open("./Kalcium-v3-terms.xsd", "rb").read())
-    term_xml_schema = ET.XMLSchema(term_xml_schema_root)
+    # The schemas are compiled on first use, not on import
+    field_validator = property(lambda self: load_validator("field"))
+    term_validator = property(lambda self: load_validator("term"))
+    field_xml_schema = property(lambda self: self.field_validator.xml_schema)
+    term_xml_schema = property(lambda self: self.term_validator.xml_schema)
+    field_xml_schema_root = property(lambda self: self.field_validator.schema_root)
+    term_xml_schema_root = property(lambda self: self.term_validator.schema_root)
+
     def __init__(self):
         pass
 
+    def validator(self, xml_schema):
+        return self.term_validator if xml_schema is self.term_xml_schema else self.field_validator
+
     def from_dict(self, entry_dictionary: dict, generate_entry_ID=True, start_ID: int = 0, generate_uuid=False):
         root = ET.fromstring("<kalciumEntries/>")
 
         all_langs = {lang for key in entry_dictionary.keys() for lang in entry_dictionary[key]["languages"]}
 
-        languages = [(str(idx + 1), l) for idx, l in enumerate(all_langs)]
         languageDefinitions = ET.SubElement(root, "languageDefinitions")
-        language_dict = {}
-        for language in languages:
-            language_dict[language[1]] = {"id": language[0],
-                                          "n": language[1].split("|")[0],
-                                          "c": language[1].split("|")[1]}
-            l = ET.SubElement(languageDefinitions, "l")
-            for key in language_dict[language[1]]:
-                l.attrib[key] = language_dict[language[1]][key]
-
-        term_count = 0
+        language_dict = self.language_definitions(all_langs)
+        for language in language_dict.values():
+            ET.SubElement(languageDefinitions, "l", **language)
+
         for idx, key in enumerate(entry_dictionary.keys()):
-            # generate entry_element
-            entry_ele = ET.SubElement(root, "e", ec="Unspecified", ver="3")
-            entry = entry_dictionary[key]
             # Create id element
             if generate_entry_ID or ("entry_ID" not in entry_dictionary[key].keys()):
                 entry_ID = str(start_ID + idx + 1)
             else:
                 entry_ID = entry_dictionary[key]["entry_ID"]
-            if generate_uuid:
-                uuid_str = str(uuid.uuid4())
-            else:
-                uuid_str = key
-            id_ele = ET.SubElement(entry_ele, "id", id=entry_ID, uuid=uuid_str)
-            # Add entry level fields
-            fields = entry.get("fields",[])
-            entry_fields = self.add_fields(entry_ele, fields)
-            # Add languages
-            for language in entry["languages"].keys():
-                language_ele = ET.SubElement(entry_ele, "l", lid=language_dict[language]["id"])
-                # Add language-level fields
-                fields = entry["languages"][language].get("fields",[])
-                language_fields = self.add_fields(language_ele, fields)
-                terms = entry["languages"][language]["terms"]
-                for term in terms:
-                    term_uuid = str(uuid.uuid4())
-                    term_ele = ET.SubElement(language_ele, "t",
-                                             head="false",
-                                             id="1" + "/" + entry_ID + "/" + term_uuid,
-                                             xid=term_uuid)
-                    try:
-                        term_ele.attrib["t"] = self.ensure_valid_xml(term["term"], self.term_xml_schema)
-                    except TypeError as err:
-                        logging.error(err)
-                        logging.error(term)
-                    # Add term-level fields
-                    fields = term.get("fields",[])
-                    term_fields = self.add_fields(term_ele, fields)
+            self.create_entry(key, entry_dictionary[key], entry_ID, language_dict, generate_uuid, parent=root)
 
         return root, entry_ID
 
-    def add_fields(self, parent, fields, field_elements:list = []):
+    @staticmethod
+    def language_definitions(languages):
+        """Map "Name|code" language keys to the attributes of their <l> language definition."""
+        return {language: {"id": str(idx + 1), "n": language.split("|")[0], "c": language.split("|")[1]}
+                for idx, language in enumerate(languages)}
+
+    def create_entry(self, key, entry: dict, entry_ID: str, language_dict: dict, generate_uuid=False, parent=None,
+                     uuid_factory=None):
+        if uuid_factory is None:
+            uuid_factory = lambda: str(uuid.uuid4())
+        # generate entry_element
+        if parent is not None:
+            entry_ele = ET.SubElement(parent, "e", ec="Unspecified", ver="3")
+        else:
+            entry_ele = ET.Element("e", ec="Unspecified", ver="3")
+        if generate_uuid:
+            uuid_str = uuid_factory()
+        else:
+            uuid_str = str(key)
+        id_ele = ET.SubElement(entry_ele, "id", id=entry_ID, uuid=uuid_str)
+        # Validate all field values and terms of the entry in one parse each
+        self.prevalidate_entry(entry)
+        # Add entry level fields
+        fields = entry.get("fields",[])
+        entry_fields = self.add_fields(entry_ele, fields)
+        # Add languages
+        for language in entry["languages"].keys():
+            language_ele = ET.SubElement(entry_ele, "l", lid=language_dict[language]["id"])
+            # Add language-level fields
+            fields = entry["languages"][language].get("fields",[])
+            language_fields = self.add_fields(language_ele, fields)
+            terms = entry["languages"][language]["terms"]
+            for term in terms:
+                term_uuid = uuid_factory()
+                term_ele = ET.SubElement(language_ele, "t",
+                                         head="false",
+                                         id="1" + "/" + entry_ID + "/" + term_uuid,
+                                         xid=term_uuid)
+                try:
+                    term_ele.attrib["t"] = self.ensure_valid_xml(term["term"], self.term_xml_schema)
+                except TypeError as err:
+                    logging.error(err)
+                    logging.error(term)
+                # Add term-level fields
+                fields = term.get("fields",[])
+                term_fields = self.add_fields(term_ele, fields)
+        return entry_ele
+
+    def prevalidate_entry(self, entry: dict):
+        field_values = []
+        terms = []
+
+        def collect(fields):
+            for values in (fields or {}).values():
+                if type(values) == dict:
+                    nested_values = values["values"]
+                    field_values.append(nested_values if type(nested_values) == str else "|".join(nested_values))
+                    collect(values.get("fields"))
+                elif type(values) == list:
+                    field_values.append("|".join(values))
+                else:
+                    field_values.append(values)
+
+        collect(entry.get("fields"))
+        for language in entry["languages"].values():
+            collect(language.get("fields"))
+            for term in language["terms"]:
+                terms.append(term["term"])
+                collect(term.get("fields"))
+        self.field_validator.prevalidate(field_values)
+        self.term_validator.prevalidate(terms)
+
+    def add_fields(self, parent, fields, field_elements:list = None):
+        if field_elements is None:
+            field_elements = []
         if len(fields) != 0:
             for field, values in fields.items():
                 if type(values) == str:
@@ -97,18 +335,67 @@ class KalciumXML:
         else:
             return []
 
-    def readXML(self, XML_path: str, return_fields=True):
+    def readXML(self, XML_path: str, return_fields=True, streaming=False):
+        """Parse a Kalcium XML termbase and collect the names of its entry-, language- and term-level fields.
+        With `streaming`, the file is not kept in memory: only the field names are collected (see `field_inventory`)
+        and no tree is returned."""
+        if streaming:
+            inventory = self.field_inventory(XML_path)
+            return None, {level: sorted(inventory[level]) for level in ["entry", "language", "term"]} if return_fields else {}
         termbase = ET.parse(XML_path)
         field_dict = {}
         if return_fields:
             field_dict["entry"] = sorted({field.attrib["n"] for field in \
                                           termbase.xpath("//f[not(ancestor::l)]")})
-            field_dict["language"] = sorted({field.attrib["type"] for field in \
+            field_dict["language"] = sorted({field.get("type", field.get("n")) for field in \
                                              termbase.xpath("//f[ancestor::l and not(ancestor::t)]")})
-            field_dict["term"] = sorted({field.attrib["type"] for field in \
+            field_dict["term"] = sorted({field.get("type", field.get("n")) for field in \
                                          termbase.xpath("//t//f")})
         return termbase, field_dict
 
+    def field_inventory(self, XML_path: str, sampleSize: int = 1024):
+        """
+        Classify every <f> of a Kalcium XML file by the level it belongs to, in one streaming pass with bounded memory.
+        :param sampleSize: Number of value hashes kept per field for the distinct value count.
+        :return: {"entries": number of entries, "entry"/"language"/"term": {field name: statistics}}, see `FieldStatistics`.
+        """
+        inventory = {"entry": {}, "language": {}, "term": {}}
+        entries = 0
+        in_language = in_term = 0
+        for event, element in ET.iterparse(XML_path, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == "l":
+                    in_language += 1
+                elif tag == "t":
+                    in_term += 1
+                elif tag == "e":
+                    entries += 1
+                continue
+            if tag == "f":
+                if in_term:
+                    level, name = "term", element.get("type", element.get("n"))
+                elif in_language:
+                    level, name = "language", element.get("type", element.get("n"))
+                else:
+                    level, name = "entry", element.get("n")
+                if name not in inventory[level]:
+                    inventory[level][name] = FieldStatistics(sampleSize)
+                inventory[level][name].add(element.get("v", element.text), entries)
+            elif tag == "l":
+                in_language -= 1
+            elif tag == "t":
+                in_term -= 1
+            elif tag == "e":
+                # Drop finished entries, so only the current entry is held in memory
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+        result = {"entries": entries}
+        for level, fields in inventory.items():
+            result[level] = {name: statistics.to_dict() for name, statistics in sorted(fields.items(), key=lambda item: str(item[0]))}
+        return result
+
     def create_field(self, parent, name: str, value: str):
         # Check if value is valid Kalcium XML
         valid_value = self.ensure_valid_xml(value, self.field_xml_schema)
@@ -128,32 +415,120 @@ class KalciumXML:
         validates against the schema after escaping and then unescaping.
         If not, we try to replace &amp; with &amp;amp; in the escaped version and unescape again.
         Finally, all major XML (&, <, >) entitities are fully double-escaped to make sure it is valid.
-        This may result in a loss of formatting"""
-        if "<" not in text and "&" not in text:
-            return text
-        else:
-            unmodified_text = text
-            try:
-                try:
-                    text = unescape(escape(text))
-                    xml_doc = ET.XML("<f>" + text + "</f>")
-                except ET.XMLSyntaxError:
-                    logging.warning(f"Invalid XML provided: '{text}'")
-                    logging.info(f"Attempting to fix by double-escaping &.")
-                    text = unescape(escape(text).replace("&amp;", "&amp;amp;"))
-                    xml_doc = ET.XML("<f>" + text + "</f>")
-                # Validate the XML
-                xml_schema.assertValid(xml_doc)
-                logging.info(f"XML successfully validated as:'{text}'")
-                return text
-            except (ET.XMLSyntaxError, ET.DocumentInvalid) as err:
-                text = escape(unmodified_text)
-                logging.warning(err)
-                logging.warning(f"XML fully escaped (potential loss of formatting) to: '{text}'")
-                return text
+        This may result in a loss of formatting.
+        Results are memoized per schema, see `XMLValidator`."""
+        return self.validator(xml_schema).validate(text)
 
     def create_crossreference(self, parent, language, term, text):
         pass
 
     def create_system_details(self, parent, user: str, date: str, transac_type: str):
-        pass
\ No newline at end of file
+        pass
+
+
+class KalciumXMLWriter:
+    def __init__(self, path: str, languages=None, generate_entry_ID=True, start_ID: int = 0, generate_uuid=False,
+                 kalcium_xml: KalciumXML = None):
+        """Incremental writer of Kalcium XML files: entries are converted and written one <e> element at a time,
+        so memory use does not grow with the number of entries.
+
+        Language definitions precede the entries in Kalcium XML. If `languages` is not given, entries are spooled
+        to a temporary file while their languages are collected, and copied behind the language definitions on close.
+
+        Parameters
+        ----------
+        path : str
+            path of the XML file
+        languages : list, optional
+            "Name|code" keys of all languages of the entries, in the order of their language IDs
+        generate_entry_ID : bool, optional
+            number entries from `start_ID + 1` instead of using their "entry_ID"
+        start_ID : int, optional
+            entry ID offset
+        generate_uuid : bool, optional
+            generate entry UUIDs instead of using the entry keys
+        kalcium_xml : KalciumXML, optional
+            converter used for the entries"""
+        self.path = path
+        self.generate_entry_ID = generate_entry_ID
+        self.generate_uuid = generate_uuid
+        self.kalcium_xml = kalcium_xml or KalciumXML()
+        self.fixed_languages = languages is not None
+        self.language_dict = KalciumXML.language_definitions(languages or [])
+        self.entry_ID = start_ID
+        self.count = 0
+        # Term UUIDs share a random prefix and count up, which is unique per file and much cheaper than uuid4()
+        self._uuid_base = random.getrandbits(128) & ~((1 << 62) - 1)
+        self._uuid_count = 0
+        self._stack = None
+
+    def new_uuid(self):
+        self._uuid_count += 1
+        return str(uuid.UUID(int=self._uuid_base | self._uuid_count, version=4))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        if self.fixed_languages:
+            _, self._output = self._open_document()
+        else:
+            self._output = self._stack.enter_context(tempfile.TemporaryFile())
+        return self
+
+    def _open_document(self):
+        out = self._stack.enter_context(open(self.path, "wb"))
+        xf = self._stack.enter_context(ET.xmlfile(out, encoding="utf-8"))
+        xf.write_declaration()
+        self._stack.enter_context(xf.element("kalciumEntries"))
+        with xf.element("languageDefinitions"):
+            for language in self.language_dict.values():
+                xf.write(ET.Element("l", **language))
+        return out, xf
+
+    def write(self, key, entry: dict):
+        """Convert and write one entry in the dictionary shape of `KalciumXML.from_dict`."""
+        for language in entry["languages"]:
+            if language not in self.language_dict:
+                if self.fixed_languages:
+                    raise Exception(f"Language {language} is missing from the language definitions")
+                self.language_dict[language] = {"id": str(len(self.language_dict) + 1),
+                                                "n": language.split("|")[0], "c": language.split("|")[1]}
+        self.count += 1
+        if self.generate_entry_ID or "entry_ID" not in entry:
+            self.entry_ID += 1
+            entry_ID = str(self.entry_ID)
+        else:
+            entry_ID = str(entry["entry_ID"])
+        entry_ele = self.kalcium_xml.create_entry(key, entry, entry_ID, self.language_dict, self.generate_uuid,
+                                                  uuid_factory=self.new_uuid)
+        if self.fixed_languages:
+            self._output.write(entry_ele)
+        else:
+            self._output.write(ET.tostring(entry_ele, encoding="utf-8"))
+        return entry_ID
+
+    def write_entries(self, entries):
+        """Write all (key, entry) pairs of an iterable, e.g. `dictionary.items()` or a generator."""
+        for key, entry in entries:
+            self.write(key, entry)
+        return self.count
+
+    def close(self, discard: bool = False):
+        """Finish the file. With `discard` (e.g. after an error while writing), no partial file that looks complete
+        is left behind: spooled entries are dropped, and a file written directly is removed."""
+        if self._stack is None:
+            return
+        with self._stack:
+            if not self.fixed_languages and not discard:
+                # All languages are known now: write the language definitions, then copy the spooled entries behind them
+                spool = self._output
+                spool.seek(0)
+                out, xf = self._open_document()
+                xf.flush()
+                shutil.copyfileobj(spool, out)
+        self._stack = None
+        if discard and self.fixed_languages and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(discard=exc_type is not None)
+        return False
@@ -0,0 +1,46 @@
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+from fake_kalcium import Glossary, glossary_path, kalcium_handler, load_filter, serve
+
+
+@pytest.fixture(scope="session")
+def kalcium_url():
+    server, url = serve(kalcium_handler(Glossary(glossary_path), 0.0))
+    yield url
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def filter_module(kalcium_url):
+    return load_filter(kalcium_url)
+
+
+@pytest.fixture
+def tag_filter(filter_module):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return filter_module.Filter()
+
+
+def run_inlet(tag_filter, text: str, message_id: str = "1", chat_id: str = "chat", direction: str = "from German to English",
+              emitted: list = None, **user_valves):
+    """Run the inlet on one user message, return the request context it stored and the emitted events."""
+    emitted = [] if emitted is None else emitted
+
+    async def emit(event):
+        emitted.append(event)
+
+    async def run():
+        user_valves.setdefault("show_citation", False)
+        user = {"role": "user", "valves": tag_filter.UserValves(**user_valves)}
+        body = {"messages": [{"role": "user", "content": f"Translate {direction}: {text}"}]}
+        metadata = {"chat_id": chat_id, "message_id": message_id}
+        with contextlib.redirect_stdout(io.StringIO()):
+            await tag_filter.inlet(body, __user__=user, __event_emitter__=emit, __metadata__=metadata)
+            await asyncio.gather(*tag_filter.citation_tasks, *tag_filter.telemetry_tasks)
+        return tag_filter.request_contexts.get((chat_id, message_id))
+
+    return asyncio.run(run()), emitted
@@ -0,0 +1,115 @@
+"""Fake Kalcium server for the tests and benchmarks of the Open WebUI filter.
+
+It serves the IATE glossary of the WMT17 evaluation (MTF) to the real `KalciumClient`: profile 17 as JSON retrieval
+profile, profile 7 as Kalcium XML. `load_filter` imports the filter configured for such a server.
+"""
+import importlib.util
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from kalcium_client.glossary_convert import read_mtf
+
+tests = os.path.dirname(os.path.abspath(__file__))
+repository = os.path.dirname(os.path.dirname(os.path.dirname(tests)))
+filter_path = os.path.join(repository, "Open WebUI", "retrieval_functions", "translate_with_tag_with_retrieval_endpoint.py")
+wmt17 = os.path.join(repository, "Datasets", "WMT17")
+glossary_path = os.path.join(wmt17, "Scripts", "iate.414.terminology.xml")
+
+languages = [{"id": 306, "name": "English", "code": "en-GB"}, {"id": 314, "name": "German", "code": "de-DE"},
+             {"id": 352, "name": "German (Austria)", "code": "de-AT"}]
+# Glossary language per language ID, and the language codes of the JSON profile
+glossary_languages = {306: "EN-GB", 314: "DE-DE", 352: "DE-DE"}
+json_codes = {306: "en-gb", 314: "de-de", 352: "de-at"}
+
+
+class Glossary:
+    def __init__(self, path: str):
+        self.concepts = [concept["languages"] for concept in read_mtf(path)]
+        self.patterns = {}
+        for language in set(glossary_languages.values()):
+            terms = sorted({term for concept in self.concepts for term in concept.get(language, [])}, key=len, reverse=True)
+            self.patterns[language] = re.compile(r"(?<!\w)(" + "|".join(map(re.escape, terms)) + r")(?!\w)", re.IGNORECASE)
+
+    def search(self, text: str, sourceLanguageId: int):
+        language = glossary_languages[sourceLanguageId]
+        found = {match.group(1).lower() for match in self.patterns[language].finditer(text)}
+        return [(idx, concept) for idx, concept in enumerate(self.concepts)
+                if any(term.lower() in found for term in concept.get(language, []))]
+
+    def content(self, text: str, profileId: int, sourceLanguageId: int, targetLanguageIds: list):
+        hits = self.search(text, sourceLanguageId)
+        if profileId == 7:
+            def terms(languageId, concept):
+                return "".join(f'<t t="{term}"><f n="Usage" v="Preferred"/></t>' for term in concept.get(glossary_languages[languageId], []))
+            return "<kalciumEntries>" + "".join(
+                f'<e><id id="{idx}"/><f n="definition" v="IATE concept {idx}"/>'
+                + "".join(f'<l lid="{languageId}">{terms(languageId, concept)}</l>' for languageId in [sourceLanguageId] + targetLanguageIds)
+                + "</e>" for idx, concept in hits) + "</kalciumEntries>"
+        entries = []
+        for idx, concept in hits:
+            entry = {}
+            for languageId in [sourceLanguageId] + targetLanguageIds:
+                for i, term in enumerate(concept.get(glossary_languages[languageId], [])):
+                    entry[f"{json_codes[languageId]}_term_{i + 1}"] = term
+                    entry[f"{json_codes[languageId]}_term_{i + 1}_usageStatus"] = "preferred"
+            entries.append(entry)
+        return json.dumps(entries, ensure_ascii=False)
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def kalcium_handler(glossary: Glossary, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.reply({"token": "bench", "groups": [{"termbases": [{"termbaseId": 14, "isEnabled": {"value": True}}]}]})
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path.endswith("/terminology/languages"):
+                return self.reply(languages)
+            if url.path.endswith("/terminology/termbases"):
+                return self.reply([{"id": 14, "name": "IATE (WMT17)", "languageIds": [language["id"] for language in languages]}])
+            if url.path.endswith("/definition/v1"):
+                return self.reply([{"termbaseId": 14}])
+            profile = re.search(r"content-of-entries-by-langId\((\d+)\)", url.path)
+            if profile:
+                time.sleep(latency)
+                content = glossary.content(query.get("text", [""])[0], int(profile.group(1)), int(query["sourceLanguageIds"][0]),
+                                           [int(languageId) for languageId in query.get("targetLanguageIds", [])])
+                return self.reply({"content": content})
+            self.send_error(404)
+
+    return Handler
+
+
+def load_filter(kalciumUrl: str):
+    # The filter reads its defaults from the environment on import
+    os.environ.update({"KALCIUM_BASE_URL_TAG_EVALUATION": kalciumUrl, "KALCIUM_API_KEY_TAG_EVALUATION": "bench",
+                       "KALCIUM_TERMBASE_IDS_TAG_EVALUATION": "14", "KALCIUM_TENANT_ID_TAG_EVALUATION": "1",
+                       "KALCIUM_TELEMETRY_PATH_TAG_EVALUATION": ""})
+    spec = importlib.util.spec_from_file_location("tag_filter", filter_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,41 @@
+
+import pytest
+import requests
+
+from kalcium_client.cassette import RecordingSession, ReplaySession, interaction_key, scrub, scrub_url
+
+
+def test_scrub_replaces_credentials_at_any_depth():
+    value = {"tenantId": 1, "token": "secret", "user": {"Password": "pw", "name": "x"}, "items": [{"apiKey": "k"}]}
+    scrubbed, changed = scrub(value)
+    assert changed and scrubbed == {"tenantId": 1, "token": "***", "user": {"Password": "***", "name": "x"},
+                                    "items": [{"apiKey": "***"}]}
+    assert scrub({"token": ""}) == ({"token": ""}, False)
+    assert scrub_url("https://host/kalcrest/x?text=a%20b&urlToken=abc") == "/kalcrest/x?text=a+b&urlToken=%2A%2A%2A"
+    assert scrub_url("https://host/kalcrest/x?text=a") == "/kalcrest/x?text=a"
+
+
+def test_interaction_key_ignores_host_and_credentials():
+    assert interaction_key("post", "https://a/login", {"token": "one"}) == interaction_key("POST", "http://b/login", {"token": "two"})
+
+
+def test_replay_serves_recorded_responses(kalcium_url, tmp_path):
+    cassette = str(tmp_path / "kalcium.jsonl")
+    with RecordingSession(cassette) as session:
+        login = session.post(f"{kalcium_url}/kalcrest/authentication/url-token", json={"tenantId": 1, "token": "secret"})
+        languages = session.get(f"{kalcium_url}/kalcrest/terminology/languages")
+    recorded = open(cassette, encoding="utf-8").read()
+    assert "secret" not in recorded and '"bench"' not in recorded
+
+    replay = ReplaySession(cassette, timeScale=0)
+    replayed = replay.get("http://elsewhere/kalcrest/terminology/languages")
+    assert replayed.status_code == 200 and replayed.json() == languages.json()
+    assert replay.post("http://elsewhere/kalcrest/authentication/url-token", json={"tenantId": 1, "token": "other"}).json()["token"] == "***"
+    assert login.json()["token"] == "bench"
+
+
+def test_missing_interaction_is_a_connection_error(tmp_path):
+    cassette = tmp_path / "empty.jsonl"
+    cassette.write_text("")
+    with pytest.raises(requests.ConnectionError, match="No recorded response"):
+        ReplaySession(str(cassette), timeScale=0).get("http://host/kalcrest/terminology/languages")
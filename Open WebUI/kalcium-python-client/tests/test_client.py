@@ -0,0 +1,147 @@
+import time
+
+import pytest
+import requests
+from lxml import etree
+
+from kalcium_client.client import merge_entry_contents, split_text
+
+NO_INFORMATION = "No information found in the termbase."
+
+
+def entries_xml(*entryIds):
+    return "<entries>" + "".join(f'<e><id id="{entryId}"/><t>{entryId}</t></e>' for entryId in entryIds) + "</entries>"
+
+
+def test_split_text_keeps_sentences_below_limits():
+    text = "One sentence here. Another one follows! " * 20
+    chunks = split_text(text, maxChunkLength=100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+    assert split_text("short") == ["short"]
+    assert split_text("   ") == []
+
+
+def test_merge_json_entries_keeps_first_occurrence():
+    merged = merge_entry_contents([[{"id": 1, "v": "a"}, {"id": 2}], [{"id": 1, "v": "b"}, {"id": 3}]])
+    assert merged == [{"id": 1, "v": "a"}, {"id": 2}, {"id": 3}]
+
+
+def test_merge_xml_entries_deduplicates_by_id():
+    merged = etree.fromstring(merge_entry_contents([entries_xml(1, 2), entries_xml(2, 3)]))
+    assert [e.find("id").get("id") for e in merged.iter("e")] == ["1", "2", "3"]
+
+
+def test_merge_xml_entries_without_id_by_content():
+    chunks = ["<entries><e><t>a</t></e><e><t>b</t></e></entries>", "<entries><e><t>b</t></e><e><t>c</t></e></entries>"]
+    merged = etree.fromstring(merge_entry_contents(chunks))
+    assert [e.findtext("t") for e in merged.iter("e")] == ["a", "b", "c"]
+
+
+def test_merge_drops_text_chunks_without_entries():
+    merged = merge_entry_contents([entries_xml(1), NO_INFORMATION, "", entries_xml(2)])
+    assert [e.find("id").get("id") for e in etree.fromstring(merged).iter("e")] == ["1", "2"]
+    assert merge_entry_contents([[{"id": 1}], NO_INFORMATION, [{"id": 2}]]) == [{"id": 1}, {"id": 2}]
+    # Without any entries the message is kept once
+    assert merge_entry_contents([NO_INFORMATION, NO_INFORMATION]) == NO_INFORMATION
+    assert merge_entry_contents(["", None]) == []
+
+
+def make_client(pages):
+    """Client without login whose search returns the given pages (None for a failed request)."""
+    from kalcium_client.client import KalciumClient
+
+    kalc = KalciumClient.__new__(KalciumClient)
+    requested = []
+
+    def search_in_kalcium(term, startIndex=0, maxCount=100, **searchParams):
+        requested.append(startIndex)
+        return pages.get(startIndex, {"hits": [], "entries": []})
+
+    kalc.search_in_kalcium = search_in_kalcium
+    return kalc, requested
+
+
+def test_iter_search_pages_through_hits():
+    pages = {0: {"hits": [1, 2], "entries": []}, 2: {"hits": [3, 4], "entries": []}, 4: {"hits": [5], "entries": []}}
+    kalc, requested = make_client(pages)
+    assert list(kalc.iter_search_in_kalcium("*", pageSize=2, prefetch=False)) == [1, 2, 3, 4, 5]
+    assert requested == [0, 2, 4]
+    assert list(kalc.iter_search_in_kalcium("*", pageSize=2, maxResults=3)) == [1, 2, 3]
+
+
+def test_iter_search_raises_on_failed_page():
+    kalc, _ = make_client({0: {"hits": [1, 2], "entries": []}, 2: None})
+    results = kalc.iter_search_in_kalcium("*", pageSize=2, prefetch=False)
+    assert [next(results), next(results)] == [1, 2]
+    with pytest.raises(Exception, match="failed at result 2"):
+        next(results)
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    from kalcium_client.client import CircuitBreaker
+
+    breaker = CircuitBreaker(failureThreshold=2, recoveryTime=0.05)
+    breaker.failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow() and breaker.retry_in() > 0
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    # Only one probe at a time
+    assert breaker.allow() and not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_probe_with_any_error_reopens_the_circuit():
+    from kalcium_client.client import CircuitBreaker, KalciumClient
+
+    class FailingSession:
+        def __init__(self, error):
+            self.error = error
+
+        def request(self, method, endpoint, **kwargs):
+            raise self.error
+
+    kalc = KalciumClient.__new__(KalciumClient)
+    kalc.timeout = 1.0
+    kalc.circuitBreaker = CircuitBreaker(failureThreshold=1, recoveryTime=0.05)
+    kalc.session = FailingSession(requests.ConnectionError("down"))
+    with pytest.raises(requests.ConnectionError):
+        kalc._send("GET", "http://kalcium/x")
+    time.sleep(0.06)
+    # The probe fails with an error that is not a RequestException, e.g. a decode error of a custom session
+    kalc.session = FailingSession(ValueError("invalid response"))
+    with pytest.raises(ValueError):
+        kalc._send("GET", "http://kalcium/x")
+    assert kalc.circuitBreaker.state == "open"
+    time.sleep(0.06)
+    assert kalc.circuitBreaker.allow()
+
+
+def test_interrupted_requests_are_not_failures():
+    from kalcium_client.client import CircuitBreaker, KalciumClient
+
+    class InterruptedSession:
+        def request(self, method, endpoint, **kwargs):
+            raise KeyboardInterrupt
+
+    kalc = KalciumClient.__new__(KalciumClient)
+    kalc.timeout = 1.0
+    kalc.circuitBreaker = CircuitBreaker(failureThreshold=1, recoveryTime=0.05)
+    kalc.session = InterruptedSession()
+    with pytest.raises(KeyboardInterrupt):
+        kalc._send("GET", "http://kalcium/x")
+    assert kalc.circuitBreaker.state == "closed" and kalc.circuitBreaker.failures == 0
+
+    # An interrupted probe leaves the circuit half-open for the next request
+    kalc.circuitBreaker.failure()
+    time.sleep(0.06)
+    with pytest.raises(KeyboardInterrupt):
+        kalc._send("GET", "http://kalcium/x")
+    assert kalc.circuitBreaker.allow()
@@ -0,0 +1,42 @@
+from kalcium_client.conversation_memo import Conversation, ConversationMemo
+
+DE_EN = ((314,), (306,), 17, "markdown")
+EN_DE = ((306,), (314,), 17, "markdown")
+
+
+def test_turns_are_found_by_key():
+    conversation = Conversation()
+    key = Conversation.turn_key("Text", profileId=17, tag_format="markdown")
+    assert key == Conversation.turn_key("Text", tag_format="markdown", profileId=17)
+    assert key != Conversation.turn_key("Text", profileId=17, tag_format="yaml")
+    conversation.put_turn(key, "context", {"1": {}})
+    assert conversation.get_turn(key) == ("context", {"1": {}}, {}, {})
+
+
+def test_last_turn_is_scoped():
+    conversation = Conversation()
+    conversation.put_turn("a", "German to English", {}, scope=DE_EN)
+    conversation.put_turn("b", "English to German", {}, scope=EN_DE)
+    assert conversation.last_turn(EN_DE)[0] == "English to German"
+    assert conversation.last_turn(DE_EN)[0] == "German to English"
+    assert conversation.last_turn(((314,), (306,), 17, "yaml")) is None
+
+
+def test_turns_and_conversations_are_bounded():
+    conversation = Conversation(maxTurns=2)
+    for key in "abc":
+        conversation.put_turn(key, key, {}, scope=DE_EN)
+    assert conversation.get_turn("a") is None and set(conversation.scopes) == {"b", "c"}
+    memo = ConversationMemo(maxConversations=2)
+    first = memo.conversation("1")
+    memo.conversation("2")
+    memo.conversation("3")
+    assert len(memo) == 2 and memo.conversation("1") is not first
+
+
+def test_strip_blocks_removes_appended_blocks():
+    markers = ("\n\n### TAG context:\n",)
+    messages = [{"content": "Translate: Text"}, {"content": "Translation\n\n### TAG context:\n```markdown```"}]
+    conversation = Conversation()
+    conversation.strip_blocks(messages, markers)
+    assert [message["content"] for message in messages] == ["Translate: Text", "Translation"]
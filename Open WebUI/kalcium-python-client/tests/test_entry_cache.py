@@ -0,0 +1,44 @@
+from kalcium_client.entry_cache import EntryCache, entry_hash
+
+
+def test_entry_hash_is_stable_and_content_based():
+    assert entry_hash({"a": 1, "b": 2}) == entry_hash({"b": 2, "a": 1})
+    assert entry_hash("<e/>") == entry_hash(b"<e/>")
+    assert entry_hash({"a": 1}) != entry_hash({"a": 2})
+
+
+def test_get_put_counts_hits_and_misses():
+    cache = EntryCache()
+    key = EntryCache.key(14, 1, entry_hash({"id": 1}), 306, 314, 17)
+    assert cache.get(key) is None
+    cache.put(key, {"terms": {}})
+    assert cache.get(key).concept == {"terms": {}}
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+    # A changed entry has a different hash and is not served stale
+    assert cache.get(EntryCache.key(14, 1, entry_hash({"id": 1, "changed": True}), 306, 314, 17)) is None
+    cache.clear()
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EntryCache(maxEntries=2)
+    for key in "ab":
+        cache.put(key, key)
+    cache.get("a")
+    cache.put("c", "c")
+    assert cache.get("b") is None
+    assert cache.get("a").concept == "a" and cache.get("c").concept == "c"
+
+
+def test_fragments_are_rendered_once_per_task_and_format():
+    calls = []
+
+    def render(entry_id, concept, task, format):
+        calls.append((entry_id, task, format))
+        return f"{format}:{concept}"
+
+    cached = EntryCache().put("key", "concept")
+    assert cached.fragment(1, "translation", "markdown", render) == "markdown:concept"
+    assert cached.fragment(1, "translation", "markdown", render) == "markdown:concept"
+    assert cached.fragment(1, "translation", "yaml", render) == "yaml:concept"
+    assert calls == [(1, "translation", "markdown"), (1, "translation", "yaml")]
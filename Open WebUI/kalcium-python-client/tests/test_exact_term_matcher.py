@@ -0,0 +1,46 @@
+import pytest
+
+from kalcium_client.retrieval_endpoint_functions import exact_matches
+from kalcium_client.term_automaton import ExactTermMatcher
+
+
+def test_terms_match_as_whole_words_only():
+    matcher = ExactTermMatcher(["contract", "tract"], "insensitive")
+    assert matcher.find("The Contract was signed.") == {"contract"}
+    assert matcher.find("contracts and contractors") == set()
+
+
+def test_smart_case_policy_matches_acronyms_case_sensitively():
+    matcher = ExactTermMatcher(["EU", "iPhone", "Embassy"], "smart")
+    assert matcher.find("the eu and the embassy") == {"Embassy"}
+    assert matcher.find("the EU bought an iPhone") == {"EU", "iPhone"}
+    assert matcher.find("an IPHONE") == set()
+
+
+def test_sensitive_and_insensitive_case_policies():
+    assert ExactTermMatcher(["Embassy"], "sensitive").find("the embassy") == set()
+    assert ExactTermMatcher(["EU"], "insensitive").find("the eu") == {"EU"}
+
+
+def test_terms_with_non_word_characters_at_their_ends():
+    matcher = ExactTermMatcher(["C++", "C#"], "smart")
+    assert matcher.find("written in C++.") == {"C++"}
+    assert matcher.find("C#, mostly") == {"C#"}
+    assert matcher.find("ABC++") == set()
+
+
+def test_terms_in_scripts_without_word_separators():
+    matcher = ExactTermMatcher(["契約", "สัญญา"], "smart")
+    assert matcher.find("この契約は無効です") == {"契約"}
+    assert matcher.find("ฉันอ่านสัญญาแล้ว") == {"สัญญา"}
+
+
+def test_invalid_case_policy():
+    with pytest.raises(ValueError):
+        ExactTermMatcher(["EU"], "upper")
+
+
+def test_exact_matches_drops_concepts_without_an_exact_match():
+    entries = {1: {"terms": {"Vertrag": []}}, 2: {"terms": {"Vertragspartner": [], "Partei": []}}}
+    assert list(exact_matches(entries, "Der Vertrag ist nichtig.")) == [1]
+    assert exact_matches({}, "Der Vertrag") == {}
@@ -0,0 +1,45 @@
+from kalcium_client.xml_utils.KalciumXML import FieldStatistics, KalciumXML
+
+ENTRY = """<e><id id="{idx}"/><f n="subject" v="{subject}"/><f n="note" v="first"/><f n="note" v="{note}"/>
+<l lid="1"><f n="definition" v="Definition {idx}"/><t t="term {idx}"><f n="usageStatus" v="preferred"/></t>
+<t t="synonym {idx}"><f n="usageStatus" v="admitted"/></t></l></e>"""
+
+
+def write_entries(path, count, notes=""):
+    with open(path, "w", encoding="utf-8") as file:
+        file.write('<kalciumEntries><languageDefinitions><l id="1" c="en-GB" n="English"/></languageDefinitions>')
+        for idx in range(count):
+            file.write(ENTRY.format(idx=idx, subject=f"subject {idx % 3}", note=notes if idx % 2 else f"note {idx}"))
+        file.write("</kalciumEntries>")
+
+
+def test_field_counts_per_level_and_entry(tmp_path):
+    path = str(tmp_path / "entries.xml")
+    write_entries(path, 4)
+    inventory = KalciumXML().field_inventory(path)
+    assert inventory["entries"] == 4
+    assert sorted(inventory["entry"]) == ["note", "subject"] and list(inventory["language"]) == ["definition"]
+    assert list(inventory["term"]) == ["usageStatus"]
+
+    note = inventory["entry"]["note"]
+    assert (note["count"], note["entries"], note["maxPerEntry"], note["empty"]) == (8, 4, 2, 2)
+    assert note["distinct"] == 4 and note["distinctExact"]  # "first", "", "note 0", "note 2"
+    assert inventory["entry"]["subject"]["distinct"] == 3
+    usage = inventory["term"]["usageStatus"]
+    assert (usage["count"], usage["entries"], usage["maxPerEntry"], usage["distinct"]) == (8, 4, 2, 2)
+    assert inventory["language"]["definition"]["maxLength"] == len("Definition 0")
+
+
+def test_distinct_values_are_estimated_beyond_the_sample(tmp_path):
+    statistics = FieldStatistics(sampleSize=256)
+    for idx in range(20000):
+        statistics.add(f"value {idx % 10000}", idx)
+    result = statistics.to_dict()
+    assert not result["distinctExact"]
+    assert abs(result["distinct"] - 10000) < 2000
+
+    # The same estimate for a streamed file, with the memory of 256 hashes per field
+    path = str(tmp_path / "entries.xml")
+    write_entries(path, 3000)
+    definition = KalciumXML().field_inventory(path, sampleSize=256)["language"]["definition"]
+    assert not definition["distinctExact"] and abs(definition["distinct"] - 3000) < 600
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from kalcium_client.fuzzy_index import FuzzyTermIndex, levenshtein, similarity
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+TERMS = {306: ["embassy", "embargo", "ambassador", "trade deficit", "budget deficit", "Federal Reserve"],
+         314: ["Botschaft", "Botschafter", "Handelsdefizit", "Haushaltsdefizit"]}
+
+
+@pytest.fixture
+def snapshot():
+    entries = []
+    for languageId, terms in TERMS.items():
+        for idx, term in enumerate(terms):
+            entries.append({"id": {"id": languageId * 100 + idx},
+                            "languages": [{"languageId": languageId, "terms": [{"term": term}]}]})
+    return TermbaseSnapshot(entries)
+
+
+@pytest.fixture
+def index(snapshot):
+    return FuzzyTermIndex(snapshot)
+
+
+def terms(hits):
+    return [hit["term"] for hit in hits]
+
+
+def test_levenshtein():
+    assert levenshtein("kitten", "sitting") == 3
+    assert levenshtein("", "abc") == 3
+    assert levenshtein("abc", "abc") == 0
+    # Early exit returns maxDistance + 1
+    assert levenshtein("kitten", "sitting", maxDistance=1) == 2
+    assert similarity("", "") == 1.0
+    assert similarity("abcd", "abce") == 0.75
+
+
+def test_exact_is_case_insensitive_by_default(index):
+    assert terms(index.search("EMBASSY", searchMode="exact")) == ["embassy"]
+    assert FuzzyTermIndex(TermbaseSnapshot([{"id": 1, "languages": [{"languageId": 306, "terms": [{"term": "Embassy"}]}]}]),
+                          matchCase=True).search("embassy", searchMode="exact") == []
+
+
+def test_fuzzy_ranks_by_similarity(index):
+    hits = index.search("embasy", [306], similarityRate=0.75)
+    assert terms(hits) == ["embassy"]
+    assert hits[0]["similarity"] == pytest.approx(1 - 1 / 7)
+    assert hits[0]["entryId"] == {"id": 30600}
+    assert index.search("embasy", [314]) == []
+
+
+def test_prefix_suffix_wildcard_concordance(index):
+    assert terms(index.search("botschaft", searchMode="prefix")) == ["Botschaft", "Botschafter"]
+    assert set(terms(index.search("defizit", [314], searchMode="suffix"))) == {"Handelsdefizit", "Haushaltsdefizit"}
+    assert terms(index.search("emba*", searchMode="wildcard")) == ["embargo", "embassy"]
+    assert terms(index.search("emba??o", searchMode="wildcard")) == ["embargo"]
+    assert set(terms(index.search("deficit", searchMode="concordance"))) == {"trade deficit", "budget deficit"}
+
+
+def test_unknown_search_mode_falls_back_to_fuzzy(index, capsys):
+    assert terms(index.search("embasy", searchMode="unknown")) == ["embassy"]
+    assert "Invalid search mode" in capsys.readouterr().out
+
+
+def test_fuzzy_matches_brute_force(snapshot, index):
+    rng = random.Random(7)
+    for _, languageId, term, _ in snapshot.iter_terms():
+        chars = list(term.lower())
+        chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        query = "".join(chars)
+        for similarityRate in (0.6, 0.75, 0.9):
+            expected = {candidate for _, _, candidate, _ in snapshot.iter_terms([languageId])
+                        if similarity(query, candidate.lower()) >= similarityRate}
+            assert set(terms(index.search(query, [languageId], similarityRate=similarityRate))) == expected
@@ -0,0 +1,58 @@
+import contextlib
+import gzip
+import io
+import shutil
+
+import pytest
+
+from kalcium_client.glossary_convert import concept_key, convert, deduplicate, detect_format, read, writers
+
+CONCEPTS = [
+    {"id": "1", "languages": {"en-gb": ["embassy", "legation"], "de-de": ["Botschaft"]}},
+    {"id": "2", "languages": {"en-gb": ["C:\\temp\\file"], "de-de": ['Vertrag "A"\tAnhang']}},
+    {"id": "3", "languages": {"en-gb": ["trade, deficit"], "de-de": ["Handelsdefizit"]}},
+]
+
+
+def terms_of(concepts):
+    return [concept["languages"] for concept in concepts]
+
+
+@pytest.mark.parametrize("format, name", [("tsv", "glossary.tsv"), ("csv", "glossary.csv"), ("mtf", "glossary.xml"),
+                                          ("kalcium", "glossary.xml"), ("tbx", "glossary.tbx")])
+def test_round_trip(tmp_path, format, name):
+    path = str(tmp_path / name)
+    assert writers[format](path, iter(CONCEPTS), languages=["en-gb", "de-de"]) == len(CONCEPTS)
+    options = {"synonymSeparator": "|"} if format in ["tsv", "csv"] else {}
+    assert detect_format(path) == format
+    assert terms_of(read(path, format, **options)) == terms_of(CONCEPTS)
+
+
+def test_compressed_inputs(tmp_path):
+    for name, format in [("glossary.tsv", "tsv"), ("glossary.xml", "mtf")]:
+        path = str(tmp_path / name)
+        writers[format](path, iter(CONCEPTS), languages=["en-gb", "de-de"])
+        with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+            shutil.copyfileobj(source, target)
+        assert detect_format(path + ".gz") == format
+        options = {"synonymSeparator": "|"} if format == "tsv" else {}
+        assert terms_of(read(path + ".gz", **options)) == terms_of(CONCEPTS)
+    with pytest.raises(ValueError, match="compressed"):
+        convert(str(tmp_path / "glossary.tsv"), str(tmp_path / "converted.tbx.gz"))
+
+
+def test_concept_key_ignores_language_order():
+    assert concept_key({"en-gb": ["embassy"], "de-de": ["Botschaft"]}) == concept_key({"DE-DE": ["Botschaft"], "en-gb": ["embassy"]})
+    assert concept_key({"en-gb": ["embassy", "legation"]}) != concept_key({"en-gb": ["legation", "embassy"]})
+    concepts = [CONCEPTS[0], CONCEPTS[1], {"id": "4", "languages": {"de-de": ["Botschaft"], "en-gb": ["embassy", "legation"]}}]
+    assert [concept["id"] for concept in deduplicate(concepts)] == ["1", "2"]
+
+
+def test_convert_merges_and_deduplicates_inputs(tmp_path):
+    first, second, output = str(tmp_path / "first.tbx"), str(tmp_path / "second.xml"), str(tmp_path / "merged.tsv")
+    writers["tbx"](first, iter(CONCEPTS[:2]), languages=["en-gb", "de-de"])
+    writers["mtf"](second, iter(CONCEPTS[1:]), languages=["en-gb", "de-de"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert convert([first, second], output) == 3
+        assert convert([first, second], str(tmp_path / "all.tsv"), dedup=False) == 4
+    assert terms_of(read(output, synonymSeparator="|")) == terms_of(CONCEPTS)
@@ -0,0 +1,51 @@
+import pytest
+from lxml import etree
+
+from kalcium_client.xml_utils.KalciumXML import KalciumXML, KalciumXMLWriter
+
+ENTRIES = {
+    "embassy": {"fields": {"definition": "Diplomatic mission"},
+                "languages": {"English|en-GB": {"terms": [{"term": "embassy", "fields": {"usageStatus": "preferred"}}]},
+                              "German|de-DE": {"terms": [{"term": "Botschaft"}]}}},
+    "deficit": {"languages": {"English|en-GB": {"terms": [{"term": "trade deficit"}]}}},
+}
+
+
+def normalized(root):
+    # Term IDs contain generated UUIDs, and from_dict numbers the languages in set order
+    codes = {language.get("id"): language.get("c") for language in root.find("languageDefinitions")}
+    root.remove(root.find("languageDefinitions"))
+    for term in root.iter("t"):
+        del term.attrib["id"], term.attrib["xid"]
+    for language in root.iter("l"):
+        language.set("lid", codes[language.get("lid")])
+    return etree.tostring(root), sorted(codes.values())
+
+
+@pytest.mark.parametrize("languages", [None, ["English|en-GB", "German|de-DE"]])
+def test_writer_output_matches_from_dict(tmp_path, languages):
+    path = tmp_path / "entries.xml"
+    with KalciumXMLWriter(str(path), languages=languages) as writer:
+        assert writer.write_entries(ENTRIES.items()) == 2
+    expected, _ = KalciumXML().from_dict(ENTRIES)
+    assert normalized(etree.parse(str(path)).getroot()) == normalized(expected)
+
+
+def test_fixed_languages_reject_unknown_language(tmp_path):
+    with pytest.raises(Exception, match="missing from the language definitions"):
+        with KalciumXMLWriter(str(tmp_path / "entries.xml"), languages=["English|en-GB"]) as writer:
+            writer.write_entries(ENTRIES.items())
+
+
+@pytest.mark.parametrize("languages", [None, ["English|en-GB", "German|de-DE"]])
+def test_no_file_is_left_after_an_error(tmp_path, languages):
+    path = tmp_path / "entries.xml"
+
+    def entries():
+        yield from ENTRIES.items()
+        raise RuntimeError("source failed")
+
+    with pytest.raises(RuntimeError):
+        with KalciumXMLWriter(str(path), languages=languages) as writer:
+            writer.write_entries(entries())
+    assert not path.exists()
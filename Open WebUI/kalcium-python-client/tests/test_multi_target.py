@@ -0,0 +1,61 @@
+from kalcium_client.retrieval_endpoint_functions import EntryCache, find_translation_multi_target
+
+VALUE_MAP = {
+    7: {"languages": {306: "en-gb", 352: "de-at", 318: "cs"},
+        "usage_status": {"name": "Usage", "preferred": "Preferred", "allowed": "Allowed", "forbidden": "Forbidden"},
+        "definition": {"name": "definition", "level": "concept"}, "usage_note": {"name": "usage note"}},
+    17: {"languages": {306: "en-gb", 314: "de-de", 318: "cs"},
+         "usage_status": {"name": "usageStatus", "preferred": "preferred", "allowed": "admitted", "forbidden": "deprecated"},
+         "definition": {"name": "definition", "level": "language"}, "usage_note": {"name": "note"}},
+}
+
+XML_ENTRIES = """<kalciumEntries><e><id id="1"/><f n="definition" v="Diplomatic mission"/>
+<l lid="352"><t t="Botschaft"><f n="Usage" v="Preferred"/></t></l>
+<l lid="306"><t t="embassy"><f n="Usage" v="Preferred"/></t><t t="legation"><f n="Usage" v="Forbidden"/></t></l>
+<l lid="318"><t t="velvyslanectví"><f n="Usage" v="Preferred"/></t><t t="vyslanectví"><f n="Usage" v="Forbidden"/></t></l>
+</e></kalciumEntries>"""
+
+JSON_ENTRIES = [{
+    "de-de_term_1": "Botschaft", "de-de_term_1_usageStatus": "preferred",
+    "en-gb_term_1": "embassy", "en-gb_term_1_usageStatus": "preferred",
+    "en-gb_term_2": "legation", "en-gb_term_2_usageStatus": "deprecated",
+    "cs_term_1": "velvyslanectví", "cs_term_1_usageStatus": "preferred",
+    "cs_term_2": "vyslanectví", "cs_term_2_usageStatus": "deprecated",
+}]
+
+
+class FakeKalc:
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def get_document_content_by_lang_id(self, text, profileId, sourceLanguageIds, targetLanguageIds):
+        self.calls.append((text, profileId, sourceLanguageIds, targetLanguageIds))
+        return self.response
+
+
+def target_terms(entries):
+    return [[next(iter(term)) for term in terms] for entry in entries.values() for terms in entry["terms"].values()]
+
+
+def check_targets(profileId, sourceLanguageId, response):
+    kalc = FakeKalc(response)
+    fragments, stats = {}, {}
+    results = find_translation_multi_target(kalc, "Die Botschaft ist geschlossen.", profileId, [sourceLanguageId], [306, 318],
+                                            VALUE_MAP, entry_cache=EntryCache(), fragments=fragments, stats=stats)
+    assert kalc.calls == [("Die Botschaft ist geschlossen.", profileId, [sourceLanguageId], [306, 318])]
+    assert list(results) == [306, 318]
+    assert target_terms(results[306][1]) == [["embassy"]]
+    assert target_terms(results[318][1]) == [["velvyslanectví"]]
+    assert "legation" not in results[306][0] and "embassy" in results[306][0]
+    assert "vyslanectví" not in results[318][0].replace("velvyslanectví", "")
+    assert sorted(fragments) == [306, 318] and all(fragments[target] for target in fragments)
+    assert stats["misses"] == 2
+
+
+def test_xml_profile_gets_concepts_per_target_language():
+    check_targets(7, 352, XML_ENTRIES)
+
+
+def test_json_profile_gets_concepts_per_target_language():
+    check_targets(17, 314, JSON_ENTRIES)
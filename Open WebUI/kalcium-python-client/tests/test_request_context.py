@@ -0,0 +1,27 @@
+import time
+
+from kalcium_client.request_context import RequestContext, RequestContextStore, request_key
+
+
+def test_request_key_from_metadata_or_outlet_body():
+    assert request_key({}, {"chat_id": "c", "message_id": "m"}) == ("c", "m")
+    assert request_key({"chat_id": "c", "id": "m"}) == ("c", "m")
+
+
+def test_requests_without_ids_do_not_share_a_context():
+    store = RequestContextStore()
+    assert request_key({"messages": []}, {}) is None
+    assert request_key({}, {"chat_id": "c"}) is None
+    store.put(request_key({}, {}), RequestContext(sourceLanguage="English"))
+    assert len(store) == 0
+    assert store.get(request_key({}, {})) is None and store.pop(None) is None
+
+
+def test_contexts_are_evicted_by_age_and_count():
+    store = RequestContextStore(ttl=0.05, maxContexts=2)
+    for idx in range(3):
+        store.put(("c", idx), RequestContext())
+    assert store.get(("c", 0)) is None and store.get(("c", 2)) is not None
+    assert store.pop(("c", 2)) is not None and store.get(("c", 2)) is None
+    time.sleep(0.1)
+    assert store.get(("c", 1)) is None and len(store) == 0
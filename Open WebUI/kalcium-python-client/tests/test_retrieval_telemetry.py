@@ -0,0 +1,59 @@
+import contextlib
+import io
+import time
+
+from conftest import run_inlet
+from kalcium_client.entry_cache import EntryCache
+from kalcium_client.retrieval_telemetry import RetrievalTelemetry, warm_up
+
+SEGMENT = "Das hat der Hollywood-Stern in einem Interview deutlich gemacht."
+
+
+def concept(term):
+    return {"terms": {term: [[f"{term} (en)"]]}}
+
+
+def test_record_stores_a_hash_and_the_returned_concepts(tmp_path):
+    telemetry = RetrievalTelemetry(str(tmp_path / "telemetry.sqlite"))
+    telemetry.record("Der Vertrag ist nichtig.", 314, 306, 17, {"1": concept("Vertrag")}, 0.2, "miss", termbaseId=14)
+    telemetry.record("Der Vertrag gilt.", 314, 306, 17, {"1": concept("Vertrag"), "2": concept("gelten")}, 0.4, "hit")
+    row = telemetry.connection.execute("SELECT textHash, entryCount FROM retrievals ORDER BY id").fetchone()
+    assert "Vertrag" not in row[0] and row[1] == 1
+    summary = telemetry.summary()
+    assert summary["retrievals"] == 2 and abs(summary["meanLatency"] - 0.3) < 1e-9
+    assert summary["cacheOutcomes"] == {"miss": 1, "hit": 1}
+
+
+def test_hot_concepts_are_ordered_by_count(tmp_path):
+    telemetry = RetrievalTelemetry(str(tmp_path / "telemetry.sqlite"))
+    for _ in range(3):
+        telemetry.record("a", 314, 306, 17, {"1": concept("Vertrag")}, 0.1, "miss", termbaseId=14)
+    telemetry.record("b", 314, 306, 17, {"2": concept("Botschaft")}, 0.1, "miss", termbaseId=14)
+    telemetry.record("c", 314, 306, 7, {"2": concept("Botschaft")}, 0.1, "miss", termbaseId=15)
+    hot = telemetry.hot_concepts()
+    # Concepts are counted per profile and termbase
+    assert hot[0] == ("Vertrag", 314, 306, 17, 14, 3)
+    assert set(hot[1:]) == {("Botschaft", 314, 306, 17, 14, 1), ("Botschaft", 314, 306, 7, 15, 1)}
+    assert len(telemetry.hot_concepts(limit=1)) == 1
+    assert telemetry.hot_concepts(since=time.time() + 60) == []
+
+
+def test_warm_up_fills_the_entry_cache_with_hot_concepts(tag_filter, tmp_path):
+    telemetry = tag_filter.telemetry = RetrievalTelemetry(str(tmp_path / "telemetry.sqlite"))
+    context, _ = run_inlet(tag_filter, SEGMENT)
+    assert telemetry.hot_concepts()
+
+    entry_cache = EntryCache()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cached = warm_up(tag_filter.kalc, telemetry, tag_filter.value_map, entry_cache, topN=10)
+    assert cached == len(entry_cache) >= len(context.entries)
+
+
+def test_warm_up_stops_at_the_time_budget(tag_filter, tmp_path, monkeypatch):
+    telemetry = RetrievalTelemetry(str(tmp_path / "telemetry.sqlite"))
+    telemetry.record("a", 314, 306, 17, {"1": concept("Interview")}, 0.1, "miss")
+    calls = []
+    monkeypatch.setattr(tag_filter.kalc, "get_document_content_by_lang_id", lambda *args, **kwargs: calls.append(args))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert warm_up(tag_filter.kalc, telemetry, tag_filter.value_map, EntryCache(), timeBudget=-1) == 0
+    assert not calls
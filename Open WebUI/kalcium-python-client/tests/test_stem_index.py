@@ -0,0 +1,30 @@
+from kalcium_client.stem_index import StemIndex, tokenize
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+
+def make_index():
+    snapshot = TermbaseSnapshot([
+        {"id": 1, "languages": [{"languageId": 306, "terms": [{"term": "embassy"}, {"term": "trade deficit"}]},
+                                {"languageId": 314, "terms": [{"term": "Botschaft"}]}]},
+    ])
+    return StemIndex(snapshot, {306: "en-gb", 314: "de-de"})
+
+
+def test_tokenize_keeps_hyphenated_words():
+    assert tokenize("Hollywood-Stern, 25.000") == [("Hollywood-Stern", 0, 15), ("25", 17, 19), ("000", 20, 23)]
+
+
+def test_recognize_inflected_forms():
+    index = make_index()
+    text = "Both embassies reported trade deficits."
+    assert index.recognize(text, 306, useStemmer=False) == []
+    hits = index.recognize(text, 306)
+    assert [(hit["term"], hit["source"]) for hit in hits] == [("embassy", "embassies"), ("trade deficit", "trade deficits")]
+    assert all(hit["stemmed"] and hit["entryId"] == {"id": 1} for hit in hits)
+    assert text[hits[1]["start"]:hits[1]["end"]] == "trade deficits"
+
+
+def test_recognize_is_per_language():
+    index = make_index()
+    assert [hit["term"] for hit in index.recognize("Die Botschaften sind geschlossen.", 314)] == ["Botschaft"]
+    assert index.recognize("Die Botschaften sind geschlossen.", 306) == []
@@ -0,0 +1,37 @@
+import random
+
+from kalcium_client.term_automaton import StreamingTermChecker, StreamScanner
+from test_term_automaton import forbidden_automaton
+
+TEXT = "The Personal Computer of the legation was a computer, not a PC. Legation staff use a Personal Computer."
+
+
+def chunks(text, rng):
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 8)
+        yield text[position:position + size]
+        position += size
+
+
+def test_stream_scanner_matches_one_shot_check_for_any_split():
+    automaton = forbidden_automaton()
+    expected = [(hit["source"], hit["start"], hit["end"]) for hit in automaton.check(TEXT, 306)]
+    rng = random.Random(3)
+    for _ in range(50):
+        scanner = StreamScanner(automaton.automata[306])
+        hits = [hit for delta in chunks(TEXT, rng) for hit in scanner.feed(delta)] + scanner.feed("", final=True)
+        assert [(hit["source"], hit["start"], hit["end"]) for hit in hits] == expected
+
+
+def test_streaming_term_checker_reports_found_and_missing_concepts():
+    entries = {"e1": {"terms": {"Personalcomputer": [["PC"]]}}, "e2": {"terms": {"Botschaft": [["embassy", "mission"]]}}}
+    checker = StreamingTermChecker(forbidden_automaton(), 306, entries)
+    first = checker.feed("Use a PC in the lega")
+    assert [hit["entryId"] for hit in first["found"]] == ["e1"] and first["forbidden"] == []
+    second = checker.feed("tion.")
+    # A longer forbidden term could still start at "legation", so the hit waits for more text or the end
+    assert second == {"forbidden": [], "found": []}
+    final = checker.finish()
+    assert [hit["source"] for hit in final["forbidden"]] == ["legation"]
+    assert final["missing"] == {"e2": ["embassy", "mission"]}
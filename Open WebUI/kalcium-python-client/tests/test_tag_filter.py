@@ -0,0 +1,188 @@
+import contextlib
+import io
+import threading
+import time
+
+import pytest
+import requests
+from pydantic import ValidationError
+
+from conftest import run_inlet
+from kalcium_client import kalcium_tag_functions as kalf
+from kalcium_client import retrieval_endpoint_functions as ft
+from kalcium_client.entry_cache import EntryCache
+from kalcium_client.retrieval_telemetry import RetrievalTelemetry
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+SEGMENT = "Das hat der Hollywood-Stern in einem Interview deutlich gemacht."
+
+
+def test_inlet_adds_tag_context(tag_filter):
+    context, _ = run_inlet(tag_filter, SEGMENT)
+    assert context.entries and "Interview" in context.tag_context
+
+
+def test_telemetry_is_written_in_the_background(tag_filter, tmp_path):
+    telemetry = tag_filter.telemetry = RetrievalTelemetry(str(tmp_path / "telemetry.sqlite"))
+    record = telemetry.record
+    inlet_times = []
+
+    def slow_record(*args, **kwargs):
+        time.sleep(0.5)
+        record(*args, **kwargs)
+
+    telemetry.record = slow_record
+    started = time.perf_counter()
+    original_put = tag_filter.request_contexts.put
+
+    def timed_put(key, context):
+        inlet_times.append(time.perf_counter() - started)
+        return original_put(key, context)
+
+    tag_filter.request_contexts.put = timed_put
+    run_inlet(tag_filter, SEGMENT)
+    assert inlet_times[0] < 0.5
+    assert telemetry.summary()["retrievals"] == 1
+
+
+def test_malformed_retrieval_sources_are_rejected_or_ignored(filter_module, tag_filter):
+    with pytest.raises(ValidationError, match="Invalid retrieval source"):
+        filter_module.Filter.Valves(retrieval_sources="17:21, seven")
+    assert filter_module.Filter.Valves(retrieval_sources="17:14, 7").retrieval_sources == "17:14, 7"
+
+    # Valves assigned without validation fall back to the user's profile
+    tag_filter.valves.retrieval_sources = "17:x"
+    context, emitted = run_inlet(tag_filter, SEGMENT)
+    assert context.entries
+    assert any("Retrieval sources ignored" in event["data"]["description"] for event in emitted)
+
+
+def test_merged_fragments_are_rendered_once(tag_filter, monkeypatch):
+    sources = [{"profileId": 17, "termbaseId": 14, "sourceLanguageIds": [314], "targetLanguageIds": [306]},
+               {"profileId": 7, "termbaseId": 15, "sourceLanguageIds": [314], "targetLanguageIds": [306]}]
+    rendered = []
+    render_fragment = kalf.render_fragment
+
+    def counting_render(entry_id, *args, **kwargs):
+        rendered.append(entry_id)
+        return render_fragment(entry_id, *args, **kwargs)
+
+    monkeypatch.setattr(kalf, "render_fragment", counting_render)
+    cache = EntryCache()
+    first_fragments = {}
+    first = ft.find_translation_multi(tag_filter.kalc, SEGMENT, sources, tag_filter.value_map, entry_cache=cache,
+                                      fragments=first_fragments)
+    count = len(rendered)
+    fragments = {}
+    assert ft.find_translation_multi(tag_filter.kalc, SEGMENT, sources, tag_filter.value_map, entry_cache=cache,
+                                     fragments=fragments) == first
+    assert len(rendered) == count and fragments == first_fragments
+    assert all(entry_id.startswith("14:") for entry_id in first[1])
+    assert "Concept 14:" in first[0]
+
+
+def test_degraded_mode_reuses_only_a_context_of_the_same_direction(tag_filter, monkeypatch):
+    tag_filter.valves.degraded_mode = "last_context"
+    context, _ = run_inlet(tag_filter, SEGMENT, message_id="1")
+    german_context = context.tag_context
+
+    def unavailable(*args, **kwargs):
+        raise requests.ConnectionError("Kalcium is down")
+
+    monkeypatch.setattr(tag_filter.kalc, "get_document_content_by_lang_id", unavailable)
+    context, emitted = run_inlet(tag_filter, "The embassy was closed.", message_id="2", direction="from English to German")
+    assert not context.entries and "Interview" not in str(context.tag_context)
+    assert any("without TAG" in event["data"]["description"] for event in emitted)
+
+    context, emitted = run_inlet(tag_filter, "Ein anderer Satz.", message_id="3")
+    assert context.tag_context == german_context
+    assert any("previous TAG context" in event["data"]["description"] for event in emitted)
+
+
+def test_prefilter_is_built_in_the_retrieval_worker(tag_filter, monkeypatch):
+    threads = []
+    get_prefilter = tag_filter.get_prefilter
+
+    def recording_get_prefilter():
+        threads.append(threading.current_thread())
+        return get_prefilter()
+
+    monkeypatch.setattr(tag_filter, "get_prefilter", recording_get_prefilter)
+    run_inlet(tag_filter, SEGMENT)
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_unreadable_snapshot_disables_the_prefilter(tag_filter, tmp_path):
+    tag_filter.valves.skip_term_free_text = True
+    tag_filter.valves.termbase_snapshot_path = str(tmp_path / "missing.jsonl")
+    context, emitted = run_inlet(tag_filter, SEGMENT, check_terminology=True)
+    assert context.entries and "Interview" in context.tag_context
+    assert not any("unavailable" in event["data"]["description"] for event in emitted)
+
+    # The outlet skips the terminology check and keeps the response
+    body = {"messages": [{"role": "assistant", "content": "The Hollywood star made that clear in an interview."}]}
+    user = {"valves": tag_filter.UserValves(check_terminology=True)}
+    with contextlib.redirect_stdout(io.StringIO()):
+        body = tag_filter.outlet(body, __user__=user, __metadata__={"chat_id": "chat", "message_id": "1"})
+    assert body["messages"][-1]["content"] == "The Hollywood star made that clear in an interview."
+
+
+@pytest.mark.parametrize("retrieval_sources", ["", "17:14, 7:15"])
+def test_prefilter_skips_term_free_text_without_retrieval(tag_filter, monkeypatch, tmp_path, retrieval_sources):
+    snapshot_path = tmp_path / "snapshot.jsonl"
+    # Profiles 17 and 7 use different IDs for German
+    languages = [{"languageId": languageId, "terms": [{"term": "Botschaft"}]} for languageId in (314, 352)]
+    TermbaseSnapshot([{"id": 1, "languages": languages}]).to_jsonl(str(snapshot_path))
+    tag_filter.valves.skip_term_free_text = True
+    tag_filter.valves.termbase_snapshot_path = str(snapshot_path)
+    tag_filter.valves.retrieval_sources = retrieval_sources
+    calls = []
+    retrieve = tag_filter.kalc.get_document_content_by_lang_id
+
+    def counting_retrieve(*args, **kwargs):
+        calls.append(args)
+        return retrieve(*args, **kwargs)
+
+    monkeypatch.setattr(tag_filter.kalc, "get_document_content_by_lang_id", counting_retrieve)
+    context, _ = run_inlet(tag_filter, SEGMENT)
+    assert not calls and not context.entries
+    run_inlet(tag_filter, "Die Botschaften sind geschlossen.", message_id="2")
+    assert len(calls) == (2 if retrieval_sources else 1)
+
+
+def test_failed_prefilter_is_not_rebuilt(filter_module, tag_filter, tmp_path, monkeypatch):
+    tag_filter.valves.skip_term_free_text = True
+    tag_filter.valves.termbase_snapshot_path = str(tmp_path / "missing.jsonl")
+    loads = []
+    from_jsonl = filter_module.TermbaseSnapshot.from_jsonl
+
+    def counting_from_jsonl(path):
+        loads.append(path)
+        return from_jsonl(path)
+
+    monkeypatch.setattr(filter_module.TermbaseSnapshot, "from_jsonl", counting_from_jsonl)
+    run_inlet(tag_filter, SEGMENT, chat_id="first")
+    run_inlet(tag_filter, SEGMENT, chat_id="second")
+    assert len(loads) == 1
+
+
+def test_snapshot_is_loaded_once_by_concurrent_threads(filter_module, tag_filter, tmp_path, monkeypatch):
+    snapshot_path = tmp_path / "snapshot.jsonl"
+    TermbaseSnapshot([{"id": 1, "languages": [{"languageId": 314, "terms": [{"term": "Botschaft"}]}]}]).to_jsonl(str(snapshot_path))
+    tag_filter.valves.skip_term_free_text = True
+    tag_filter.valves.termbase_snapshot_path = str(snapshot_path)
+    loads = []
+    from_jsonl = filter_module.TermbaseSnapshot.from_jsonl
+
+    def slow_from_jsonl(path):
+        loads.append(path)
+        time.sleep(0.1)
+        return from_jsonl(path)
+
+    monkeypatch.setattr(filter_module.TermbaseSnapshot, "from_jsonl", slow_from_jsonl)
+    threads = [threading.Thread(target=tag_filter.get_prefilter), threading.Thread(target=tag_filter.get_term_checker, args=(17,))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1 and tag_filter.prefilter is not None and 17 in tag_filter.term_checkers
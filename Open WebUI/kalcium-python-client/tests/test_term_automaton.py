@@ -0,0 +1,78 @@
+import json
+
+from kalcium_client.term_automaton import AhoCorasick, ForbiddenTermAutomaton
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+VALUE_MAP = {17: {"usage_status": {"name": "usageStatus", "preferred": "preferred", "allowed": "admitted",
+                                   "forbidden": "forbidden"}}}
+
+
+def automaton(*patterns):
+    ac = AhoCorasick()
+    for pattern in patterns:
+        ac.add(pattern, pattern)
+    ac.build()
+    return ac
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matches, _ = automaton("he", "she", "his", "hers").scan("ushers")
+    assert sorted(matches) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_aho_corasick_scan_continues_across_parts():
+    ac = automaton("embassy", "bass")
+    first, state = ac.scan("the emba")
+    second, _ = ac.scan("ssy", state, offset=len("the emba"))
+    assert first == [] and sorted(second) == [(4, 11, "embassy"), (6, 10, "bass")]
+
+
+def term(text, status):
+    return {"term": text, "fields": [{"name": "usageStatus", "value": status}]}
+
+
+def forbidden_automaton():
+    snapshot = TermbaseSnapshot([
+        {"id": 1, "fields": [{"name": "definition", "value": "Personal computer"}],
+         "languages": [{"languageId": 306, "terms": [term("PC", "preferred"), term("Computer", "forbidden"),
+                                                     term("Personal Computer", "forbidden")]}]},
+        {"id": 2, "languages": [{"languageId": 306, "terms": [term("embassy", "admitted"), term("legation", "forbidden")]}]},
+    ])
+    return ForbiddenTermAutomaton.from_snapshot(snapshot, 17, VALUE_MAP)
+
+
+def test_forbidden_terms_are_whole_words_and_longest_match_wins():
+    hits = forbidden_automaton().check("My Personal Computer and the Legation, not computers.", 306)
+    assert [(hit["source"], hit["replacement"]) for hit in hits] == [("Personal Computer", "PC"), ("Legation", "embassy")]
+    assert forbidden_automaton().check("My Personal Computer", 314) == []
+
+
+def test_corrections_group_hits_per_concept():
+    corrections = forbidden_automaton().corrections("Computer, Personal Computer, legation", 306)
+    assert corrections == {
+        "concept1": {"Forbidden terms": {"Computer": "PC", "Personal Computer": "PC"}, "Definition": "Personal computer"},
+        "concept2": {"Forbidden terms": {"legation": "embassy"}},
+    }
+    assert forbidden_automaton().check_terminology("Nothing here", 306) == "No forbidden terms found."
+
+
+def test_forbidden_terms_in_scripts_without_word_separators():
+    automaton = ForbiddenTermAutomaton()
+    automaton.add_term(1041, "合同書", "契約", entryId=3)
+    automaton.add_term(1054, "สัญญาเช่า", "สัญญา", entryId=4)
+    automaton.build()
+    assert [hit["source"] for hit in automaton.check("この合同書は無効です", 1041)] == ["合同書"]
+    assert [hit["source"] for hit in automaton.check("ฉันอ่านสัญญาเช่าแล้ว", 1054)] == ["สัญญาเช่า"]
+
+
+def test_termchecker_checks_locally_with_an_automaton():
+    from kalcium_client.kalcium_termchecker import Termchecker
+
+    # Without login, the automaton path makes no requests
+    checker = Termchecker.__new__(Termchecker)
+    checker.automaton = forbidden_automaton()
+    checker.sourceLanguageIds = [306]
+    result = json.loads(checker.check_terminology("Send the legation a Computer."))
+    forbidden = {term: replacement for concept in result.values() for term, replacement in concept["Forbidden terms"].items()}
+    assert forbidden == {"Computer": "PC", "legation": "embassy"}
+    assert checker.check_terminology("Send the legation a Computer.", [314]) == "No forbidden terms found."
@@ -0,0 +1,60 @@
+from kalcium_client.term_bloom import BloomFilter, TermPrefilter
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+
+def make_prefilter(useStemmer=True):
+    snapshot = TermbaseSnapshot([
+        {"id": 1, "languages": [{"languageId": 306, "terms": [{"term": "embassy"}, {"term": "trade deficit"}]},
+                                {"languageId": 1041, "terms": [{"term": "契約"}]}]},
+    ])
+    return TermPrefilter(snapshot, {306: "en-gb"}, useStemmer=useStemmer)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"key{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert len(bloom) == 1000
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate_near_error_rate():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"key{i}")
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives / 10000 < 0.03
+    assert 0.005 < bloom.false_positive_rate() < 0.015
+
+
+def test_prefilter_passes_inflected_first_tokens():
+    prefilter = make_prefilter()
+    assert prefilter.may_match("Both embassies reported.", 306)
+    assert prefilter.may_match("Trade figures fell.", 306)
+    assert not make_prefilter(useStemmer=False).may_match("Both embassies reported.", 306)
+
+
+def test_prefilter_skips_term_free_text():
+    assert not make_prefilter().may_match("The meeting was postponed.", 306)
+
+
+def test_prefilter_passes_languages_without_filter():
+    assert make_prefilter().may_match("The meeting was postponed.", 314)
+
+
+def test_prefilter_passes_scripts_without_word_separators():
+    prefilter = make_prefilter()
+    assert prefilter.term_keys("契約", 1041) == {"契約"}
+    assert prefilter.may_match("この契約は無効です", 1041)
+    assert prefilter.may_match("ประชุมสภา", 306)
+
+
+def test_prefilter_stems_each_token_once():
+    prefilter = make_prefilter()
+    stemmed = []
+    stem_english = prefilter.stemmers[306]
+    prefilter.stemmers[306] = lambda token: stemmed.append(token) or stem_english(token)
+    for _ in range(3):
+        prefilter.may_match("The meeting was postponed.", 306)
+    assert sorted(stemmed) == ["meeting", "postponed", "the", "was"]
@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from kalcium_client.termbase_export import export_termbase
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
+
+
+class FakeKalcium:
+    """Serves `total` entries with an English and a German term through search_in_kalcium. Like Kalcium, it pages by
+    hits, one per matching term, so a page of `maxCount` hits holds the entries of `maxCount / 2` concepts.
+    The requests of the pages starting at the hit indices in `failing` fail."""
+
+    def __init__(self, total: int, failing=()):
+        self.total = total
+        self.failing = set(failing)
+        self.availableLanguagesPerTb = {14: {306: "English", 314: "German", "name": "IATE"}}
+
+    def search_in_kalcium(self, term, startIndex=0, maxCount=100, **searchParams):
+        if startIndex in self.failing:
+            print("Failed to make search request. Status code:", 503)
+            return None
+        hits = [{"entryId": {"id": idx // 2}, "languageId": (306, 314)[idx % 2], "term": f"term {idx // 2}"}
+                for idx in range(startIndex, min(startIndex + maxCount, 2 * self.total))]
+        entries = [{"id": {"id": idx}, "languages": [{"languageId": 306, "terms": [{"term": f"term {idx}"}]},
+                                                     {"languageId": 314, "terms": [{"term": f"Term {idx}"}]}]}
+                   for idx in sorted({hit["entryId"]["id"] for hit in hits})]
+        return {"hits": hits, "entries": entries}
+
+
+def read_ids(path):
+    with (gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")) as file:
+        return [TermbaseSnapshot.entry_id(json.loads(line)) for line in file]
+
+
+@pytest.mark.parametrize("name", ["snapshot.jsonl", "snapshot.jsonl.gz"])
+def test_failed_page_is_not_marked_done_and_resumes(tmp_path, name):
+    path = str(tmp_path / name)
+    with pytest.raises(Exception, match="failed at result 30"):
+        export_termbase(FakeKalcium(50, failing=[30]), 14, path, pageSize=10, maxWorkers=2)
+    with open(path + ".progress", encoding="utf-8") as file:
+        progress = json.load(file)
+    assert not progress["done"] and progress["nextStartIndex"] == 30 and progress["entries"] == 15
+
+    assert export_termbase(FakeKalcium(50), 14, path, pageSize=10, maxWorkers=2) == 50
+    assert read_ids(path) == list(range(50))
+
+
+@pytest.mark.parametrize("name", ["snapshot.jsonl", "snapshot.jsonl.gz"])
+def test_resume_discards_writes_after_the_last_progress(tmp_path, name):
+    path = str(tmp_path / name)
+    with pytest.raises(Exception):
+        export_termbase(FakeKalcium(50, failing=[20]), 14, path, pageSize=10, maxWorkers=2)
+    # An interrupted write: a line past the recorded progress, and a partial one (or an unterminated gzip member)
+    tail = b'{"id": {"id": 10}, "languages": []}\n{"id": {"id'
+    with open(path, "ab") as file:
+        file.write(gzip.compress(tail)[:-12] if name.endswith(".gz") else tail)
+
+    assert export_termbase(FakeKalcium(50), 14, path, pageSize=10, maxWorkers=2) == 50
+    assert read_ids(path) == list(range(50))
+
+
+def test_resume_rejects_snapshot_shorter_than_progress(tmp_path):
+    path = str(tmp_path / "snapshot.jsonl")
+    with pytest.raises(Exception):
+        export_termbase(FakeKalcium(50, failing=[20]), 14, path, pageSize=10, maxWorkers=2)
+    with open(path, "rb") as file:
+        lines = file.readlines()
+    with open(path, "wb") as file:
+        file.writelines(lines[:5])
+    with pytest.raises(Exception, match="holds 5 of the 10"):
+        export_termbase(FakeKalcium(50), 14, path, pageSize=10, maxWorkers=2)
+    assert os.path.exists(path + ".progress")
+
+
+def test_pages_with_fewer_entries_than_hits_are_not_the_last(tmp_path):
+    # Hits of an entry can span two pages, the entry is written once
+    path = str(tmp_path / "snapshot.jsonl")
+    assert export_termbase(FakeKalcium(25), 14, path, pageSize=7, maxWorkers=3) == 25
+    assert read_ids(path) == list(range(25))
@@ -0,0 +1,65 @@
+from kalcium_client.xml_utils.KalciumXML import KalciumXML, XMLValidator, load_validator
+
+VALUES = [
+    "plain text",
+    "Tom &amp; Jerry",
+    "Tom & Jerry",
+    "<em>legal</em> basis",
+    "<strong>Note:</strong> see <a xref-type=\"ulink\" xref-ulink-url=\"https://iate.europa.eu\">IATE</a>",
+    "<ul><li>one</li><li>two</li></ul>",
+    "<ul>no items</ul>",
+    "<a>link without type</a>",
+    "<em>unclosed",
+    "<foo>unknown</foo> tag",
+    "x < y",
+]
+
+
+def fresh_validator():
+    validator = load_validator("field")
+    return XMLValidator(validator.xml_schema, validator.schema_root)
+
+
+def test_classify():
+    validator = fresh_validator()
+    assert validator.classify("plain text") == "plain"
+    assert validator.classify("Tom &amp; Jerry") == "plain"
+    assert validator.classify("Tom & Jerry") == "markup"
+    assert validator.classify("<em>legal</em>") == "markup"
+    assert validator.classify("<foo>unknown</foo>") == "escape"
+    assert validator.classify("x < y") == "escape"
+
+
+def test_prevalidation_agrees_with_full_validation():
+    reference = fresh_validator()
+    # Full XSD validation of every value, without the pre-scan
+    expected = {text: reference._validate(text) for text in VALUES}
+    assert expected["<em>legal</em> basis"] == "<em>legal</em> basis"
+    assert expected["<ul>no items</ul>"] == "&lt;ul&gt;no items&lt;/ul&gt;"
+    assert expected["<a>link without type</a>"].startswith("&lt;a&gt;")
+
+    validator = fresh_validator()
+    validator.prevalidate(VALUES)
+    assert {text: validator.validate(text) for text in VALUES} == expected
+    # Only plain values are not memoized, all others were answered from the memo of the bulk validation
+    assert validator.hits == len(VALUES) - 2
+
+    # Values one by one, without bulk validation
+    single = fresh_validator()
+    assert {text: single.validate(text) for text in VALUES} == expected
+
+
+def test_prevalidation_falls_back_for_documents_that_are_not_well_formed():
+    validator = fresh_validator()
+    values = ["<em>one</em>", "<strong>two", "<i>three</i>"]
+    validator.prevalidate(values)
+    assert [validator.validate(text) for text in values] == ["<em>one</em>", "&lt;strong&gt;two", "<i>three</i>"]
+
+
+def test_validators_are_compiled_once():
+    load_validator.cache_clear()
+    field_validator = load_validator("field")
+    assert load_validator("field") is field_validator
+    assert KalciumXML().field_validator is field_validator
+    assert KalciumXML().term_validator is load_validator("term") is not field_validator
+    assert load_validator.cache_info().misses == 2
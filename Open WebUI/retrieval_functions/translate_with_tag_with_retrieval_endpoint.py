@@ -6,53 +6,77 @@ funding_url: https://kaleidoscope.at
 version: 0.1
 """
 
+import os
 import sys
-import importlib
-
-# sys.path.append("/app/backend/data/python_modules/kalcium-python-client")
-
-sys.path.append(
-    "/app/backend/data/python_modules/kalcium-python-client/src/kalcium_client"
+import time
+import asyncio
+import threading
+import importlib.util
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+
+# The client is not installed into the Open WebUI environment, it is loaded from the data directory
+kalciumClientDir = "/app/backend/data/python_modules/kalcium-python-client"
+if importlib.util.find_spec("kalcium_client") is None:
+    sys.path.append(os.path.join(kalciumClientDir, "src"))
+
+from kalcium_client import client
+from kalcium_client import kalcium_tag_functions as kalf
+from kalcium_client import retrieval_endpoint_functions as ft
+from kalcium_client.conversation_memo import Conversation, ConversationMemo
+from kalcium_client.entry_cache import EntryCache
+from kalcium_client.retrieval_telemetry import RetrievalTelemetry, warm_up
+from kalcium_client.request_context import (
+    RequestContext,
+    RequestContextStore,
+    request_key,
 )
+from kalcium_client.term_automaton import ForbiddenTermAutomaton, StreamingTermChecker
+from kalcium_client.term_bloom import TermPrefilter
+from kalcium_client.termbase_snapshot import TermbaseSnapshot
 
-import client  # kalcium_client
-import kalcium_tag_functions as kalf
-
-# import retrieval_endpoint_functions as ft
-
-importlib.reload(client)
-importlib.reload(kalf)
-# importlib.reload(ft)
-
-from pydantic import BaseModel, Field
-from typing import Optional
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
-import requests
-import json
-
-# from lxml import etree as ET
-import numpy as np
-import re
-from typing import List, Literal
-from html import escape
-from datetime import datetime
-from time import sleep
-from lxml import etree
+try:
+    from dotenv import load_dotenv
 
-load_dotenv(dotenv_path="/app/backend/data/python_modules/kalcium-python-client/.env")
+    load_dotenv(dotenv_path=os.path.join(kalciumClientDir, ".env"))
+except ImportError:
+    pass
 
 kalciumBaseUrl = os.getenv("KALCIUM_BASE_URL_TAG_EVALUATION", "")
 kalciumApiKey = os.getenv("KALCIUM_API_KEY_TAG_EVALUATION", "")
 kalciumTermbaseIds = int(os.getenv("KALCIUM_TERMBASE_IDS_TAG_EVALUATION", "14"))
 kalciumTenantId = int(os.getenv("KALCIUM_TENANT_ID_TAG_EVALUATION", "1"))
+kalciumSnapshotPath = os.getenv("KALCIUM_SNAPSHOT_PATH_TAG_EVALUATION", "")
+kalciumTelemetryPath = os.getenv("KALCIUM_TELEMETRY_PATH_TAG_EVALUATION", "")
+
+# Blocks appended to responses by the outlet, removed from the history before it is sent to the model
+appended_blocks = ("\n\n### TAG context:\n", "\n\n### Terminology check:\n")
 
 tag_formats = Literal["yaml", "markdown", "unchanged"]
 
 supported_profile_Ids = Literal[7, 8, 15, 16, 17]
 
 
+def parse_retrieval_sources(value: str) -> list:
+    """(profileId, termbaseId or None) of each "profileId:termbaseId" item of the retrieval sources valve."""
+    sources = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        profile, _, termbase = item.strip().partition(":")
+        try:
+            sources.append(
+                (int(profile), int(termbase) if termbase.strip() else None)
+            )
+        except ValueError:
+            raise ValueError(
+                f"Invalid retrieval source '{item.strip()}', expected profileId:termbaseId (e.g. '17:21, 7:14')"
+            )
+    return sources
+
+
 class Filter:
     class Valves(BaseModel):
         kalcium_base_url: str = Field(
@@ -67,12 +91,75 @@ class Filter:
         tenantId: int = Field(
             default=kalciumTenantId, title="Tenant ID", description="Kalcium Tenant ID"
         )
-        pass
+        termbase_snapshot_path: str = Field(
+            default=kalciumSnapshotPath,
+            title="Termbase snapshot",
+            description="JSONL snapshot of the termbase (see kalcium-export) for local terminology checks",
+        )
+        telemetry_path: str = Field(
+            default=kalciumTelemetryPath,
+            title="Telemetry log",
+            description="SQLite file logging retrievals, read on startup to warm up the entry cache",
+        )
+        skip_term_free_text: bool = Field(
+            default=False,
+            title="Skip term-free text",
+            description="Skip the retrieval for texts in which no word can start a term of the termbase snapshot",
+        )
+        warmup_concepts: int = Field(
+            default=100,
+            title="Warmup concepts",
+            description="Number of most frequently retrieved concepts cached on startup",
+        )
+        warmup_time_budget: float = Field(
+            default=10.0,
+            title="Warmup time budget",
+            description="Seconds the startup warmup may spend retrieving concepts",
+        )
+        defer_citations: bool = Field(
+            default=True,
+            title="Defer citations",
+            description="Emit citations in the background instead of before the model call",
+        )
+        batch_citations: bool = Field(
+            default=False,
+            title="Batch citations",
+            description="Emit all concepts as one citation instead of one citation per concept",
+        )
+        retrieval_deadline: float = Field(
+            default=5.0,
+            title="Retrieval deadline",
+            description="Seconds the inlet waits for the terminology retrieval before the message is sent in degraded mode (0: no deadline)",
+        )
+        degraded_mode: Literal["no_tag", "last_context"] = Field(
+            default="last_context",
+            title="Degraded mode",
+            description="When the retrieval fails or misses the deadline, send the message without TAG or with the last TAG context of the chat",
+        )
+        retrieval_sources: str = Field(
+            default="",
+            title="Retrieval sources",
+            description="Profiles queried together, highest precedence first, as profileId:termbaseId separated by commas (e.g. '17:21, 7:14'). Empty: the user's profile only",
+        )
+
+        @field_validator("retrieval_sources")
+        @classmethod
+        def check_retrieval_sources(cls, value: str) -> str:
+            parse_retrieval_sources(value)
+            return value
 
     class UserValves(BaseModel):
         show_tag_context: bool = Field(default=False, title="Show TAG context")
         show_citation: bool = Field(default=True, title="Show TAG citations")
         exact_matches: bool = Field(default=False, title="Consider exact matches only")
+        exact_matches_case: Literal["smart", "sensitive", "insensitive"] = Field(
+            default="smart",
+            title="Case of exact matches",
+            description="smart: acronyms and terms with inner capitals match case-sensitively, all others case-insensitively",
+        )
+        check_terminology: bool = Field(
+            default=False, title="Check forbidden terms in the response"
+        )
         tag_format: tag_formats = Field(default="markdown", title="TAG format")
         profileId: supported_profile_Ids = Field(
             default=17,
@@ -204,11 +291,50 @@ class Filter:
         self.kalc = client.KalciumClient(
             baseUrl, tenantId, urlToken=urlToken, getAliases=True
         )
+        # Parsed concepts and rendered TAG fragments, shared across requests
+        self.entry_cache = EntryCache()
+        # Forbidden term automata per profile, built from the termbase snapshot on first use
+        self.term_checkers = {}
+        self.termbase_snapshot = None
+        # Bloom filters over the first words of all snapshot terms, built on first use in a retrieval worker
+        self.prefilter = None
+        # Snapshot path whose prefilter could not be built, it is not tried again
+        self.prefilter_failed = None
+        # The snapshot and what is built from it are loaded once, by whichever thread asks first
+        self.snapshot_lock = threading.RLock()
+        # Per-request state (language direction, TAG context, entries) from inlet to stream and outlet,
+        # keyed by chat and message ID so concurrent chats do not share state
+        self.request_contexts = RequestContextStore()
+        # TAG contexts and stripped blocks of earlier turns, per chat
+        self.conversations = ConversationMemo()
+        # Deferred citation emissions and telemetry writes, referenced until they are done
+        self.citation_tasks = set()
+        self.telemetry_tasks = set()
+        # Retrieval telemetry, the hottest concepts are cached in the background on startup
+        self.telemetry = (
+            RetrievalTelemetry(self.valves.telemetry_path)
+            if self.valves.telemetry_path
+            else None
+        )
+        if self.telemetry is not None and self.valves.warmup_concepts > 0:
+            threading.Thread(
+                target=warm_up,
+                args=(self.kalc, self.telemetry, self.value_map, self.entry_cache),
+                kwargs={
+                    "topN": self.valves.warmup_concepts,
+                    "timeBudget": self.valves.warmup_time_budget,
+                },
+                daemon=True,
+            ).start()
 
         pass
 
     async def inlet(
-        self, body: dict, __user__: Optional[dict] = None, __event_emitter__=None
+        self,
+        body: dict,
+        __user__: Optional[dict] = None,
+        __event_emitter__=None,
+        __metadata__: Optional[dict] = None,
     ) -> dict:
         # Modify the request body or validate it before processing by the chat completion API.
         # This function is the pre-processor for the API where various checks on the input can be performed.
@@ -227,6 +353,19 @@ class Filter:
             profileId = user_valves.profileId
             tag_format = user_valves.tag_format
             exact_matches_only = user_valves.exact_matches
+            case_policy = user_valves.exact_matches_case
+
+            chat_id = (__metadata__ or {}).get("chat_id") or body.get("chat_id")
+            conversation = (
+                self.conversations.conversation(chat_id) if chat_id else None
+            )
+            if conversation is not None:
+                conversation.strip_blocks(messages, appended_blocks)
+            else:
+                for message in messages:
+                    for marker in appended_blocks:
+                        if marker in message["content"]:
+                            message["content"] = message["content"].split(marker)[0]
 
             # Get language direction from prompt
             languages = []
@@ -240,14 +379,35 @@ class Filter:
                 Supported languages: German, English"""
                 )
             else:
-                self.sourceLanguage = languages[0]
-                self.kalc.sourceLanguageIds = [
-                    self.value_map[profileId]["language_names"][self.sourceLanguage]
-                ]
-                self.targetLanguage = languages[1]
-                self.kalc.targetLanguageIds = [
-                    self.value_map[profileId]["language_names"][self.targetLanguage]
-                ]
+                context = RequestContext(
+                    sourceLanguage=languages[0],
+                    targetLanguage=languages[1],
+                    sourceLanguageIds=[
+                        self.value_map[profileId]["language_names"][languages[0]]
+                    ],
+                    targetLanguageIds=[
+                        self.value_map[profileId]["language_names"][languages[1]]
+                    ],
+                    profileId=profileId,
+                    tag_format=tag_format,
+                )
+
+            # Several profiles/termbases are queried together when configured
+            try:
+                sources = self.get_sources(languages)
+            except ValueError as e:
+                # A malformed valve falls back to the user's profile instead of failing the turn
+                print("Ignoring retrieval sources", e)
+                sources = []
+                await __event_emitter__(
+                    {
+                        "type": "status",
+                        "data": {
+                            "description": f"Retrieval sources ignored: {e}",
+                            "done": False,
+                        },
+                    }
+                )
 
             # Inform user about TAG taking place
             await __event_emitter__(
@@ -262,19 +422,172 @@ class Filter:
 
             # perform tag
             # try:
-            translation, entries = find_translation(
-                self.kalc,
-                ":".join(messages[-1]["content"].split(":")[1:]),
-                profileId,
-                self.kalc.sourceLanguageIds,
-                self.kalc.targetLanguageIds,
-                self.value_map,
+            text = ":".join(messages[-1]["content"].split(":")[1:])
+            # Regenerations and edits that keep the text reuse the TAG context of the earlier turn
+            turn_key = Conversation.turn_key(
+                text,
+                profileId=profileId,
                 tag_format=tag_format,
                 exact_matches_only=exact_matches_only,
+                case_policy=case_policy,
+                sourceLanguageIds=context.sourceLanguageIds,
+                targetLanguageIds=context.targetLanguageIds,
+                termbaseId=self.valves.termbaseIds,
+                sources=sources,
             )
+            turn = conversation.get_turn(turn_key) if conversation else None
+            # Degraded mode only falls back to a TAG context of the same language pair, profile and format
+            turn_scope = (
+                tuple(context.sourceLanguageIds),
+                tuple(context.targetLanguageIds),
+                profileId,
+                tag_format,
+            )
+            started = time.perf_counter()
+            stats = {}
+            degraded = None
+            if turn is not None:
+                translation, entries, fragments, origins = turn
+            else:
+                fragments = {}
+                origins = {}
+
+                def retrieve():
+                    # The prefilter is built from the snapshot on first use, here as well as not on the event loop
+                    prefilter = self.get_prefilter()
+                    if sources:
+                        # All sources are retrieved concurrently and merged by precedence
+                        return ft.find_translation_multi(
+                            self.kalc,
+                            text,
+                            sources,
+                            self.value_map,
+                            tag_format=tag_format,
+                            exact_matches_only=exact_matches_only,
+                            entry_cache=self.entry_cache,
+                            fragments=fragments,
+                            stats=stats,
+                            origins=origins,
+                            casePolicy=case_policy,
+                            prefilter=prefilter,
+                        )
+                    return ft.find_translation(
+                        self.kalc,
+                        text,
+                        profileId,
+                        context.sourceLanguageIds,
+                        context.targetLanguageIds,
+                        self.value_map,
+                        tag_format=tag_format,
+                        exact_matches_only=exact_matches_only,
+                        entry_cache=self.entry_cache,
+                        termbaseId=self.valves.termbaseIds,
+                        fragments=fragments,
+                        stats=stats,
+                        casePolicy=case_policy,
+                        prefilter=prefilter,
+                    )
+
+                # Retrieval runs in a worker thread so concurrent inlets do not block each other
+                retrieval = asyncio.to_thread(retrieve)
+                try:
+                    # A slow or unavailable termbase must not hold up the chat beyond the deadline.
+                    # The worker thread is not cancelled, a late result still fills the entry cache.
+                    translation, entries = await asyncio.wait_for(
+                        retrieval, timeout=self.valves.retrieval_deadline or None
+                    )
+                    if conversation is not None:
+                        conversation.put_turn(
+                            turn_key,
+                            translation,
+                            entries,
+                            fragments,
+                            origins,
+                            scope=turn_scope,
+                        )
+                except Exception as e:
+                    print("Error retrieving terms, continuing in degraded mode", repr(e))
+                    last_turn = (
+                        conversation.last_turn(turn_scope)
+                        if conversation is not None
+                        and self.valves.degraded_mode == "last_context"
+                        else None
+                    )
+                    if last_turn is not None:
+                        degraded = "Terminology service unavailable, using the previous TAG context."
+                        translation, entries, fragments, origins = last_turn
+                    else:
+                        degraded = "Terminology service unavailable, translating without TAG."
+                        translation, entries, fragments, origins = "", {}, {}, {}
+            if self.telemetry is not None:
+                if degraded:
+                    cache_outcome = "degraded"
+                elif stats.get("skipped", 0) >= max(len(sources), 1):
+                    cache_outcome = "skipped"
+                elif turn is not None:
+                    cache_outcome = "memo"
+                elif stats.get("hits"):
+                    cache_outcome = "partial" if stats.get("misses") else "hit"
+                else:
+                    cache_outcome = "miss"
+                # Merged entries are logged per source, so the warmup retrieves them from their own profile
+                records = []
+                for source in sources or [
+                    {
+                        "profileId": profileId,
+                        "termbaseId": self.valves.termbaseIds,
+                        "sourceLanguageIds": context.sourceLanguageIds,
+                        "targetLanguageIds": context.targetLanguageIds,
+                    }
+                ]:
+                    if degraded:
+                        source_entries = {}
+                    elif sources:
+                        source_entries = {
+                            entry_id: entries[key]
+                            for key, (origin, entry_id) in origins.items()
+                            if origin == source
+                        }
+                    else:
+                        source_entries = entries
+                    records.append(
+                        (
+                            text,
+                            source["sourceLanguageIds"][0],
+                            source["targetLanguageIds"][0],
+                            source["profileId"],
+                            source_entries,
+                            time.perf_counter() - started,
+                            cache_outcome,
+                            source["termbaseId"],
+                        )
+                    )
+                # Written in the background, the SQLite write does not delay the request
+                task = asyncio.create_task(
+                    asyncio.to_thread(self.record_telemetry, records)
+                )
+                self.telemetry_tasks.add(task)
+                task.add_done_callback(self.telemetry_tasks.discard)
             # except Exception as e:
             #    raise Exception(f"Error retrieving terms: {e}")
 
+            if user_valves.check_terminology:
+                # The snapshot is loaded in a worker thread, the check goes on without forbidden terms if it fails
+                try:
+                    term_checker = await asyncio.to_thread(
+                        self.get_term_checker, profileId
+                    )
+                except Exception as e:
+                    print("Error loading the termbase snapshot", repr(e))
+                    term_checker = None
+                term_checker = term_checker or ForbiddenTermAutomaton()
+                # The entries of a previous TAG context are not expected in this response
+                context.stream_checker = StreamingTermChecker(
+                    term_checker,
+                    context.targetLanguageIds[0],
+                    None if degraded else entries,
+                )
+
             # add tag context to prompt
             if translation:  # and entries:
                 messages[-1]["content"] = (
@@ -285,7 +598,8 @@ class Filter:
                     {
                         "type": "status",
                         "data": {
-                            "description": f"Found {len(entries)} concept{'s' if len(entries) != 1 else ''}.",  # f"Found concepts",
+                            "description": degraded
+                            or f"Found {len(entries)} concept{'s' if len(entries) != 1 else ''}.",  # f"Found concepts",
                             "done": True,
                         },
                     }
@@ -294,49 +608,94 @@ class Filter:
                 await __event_emitter__(
                     {
                         "type": "status",
-                        "data": {"description": "No terminology found.", "done": True},
+                        "data": {
+                            "description": degraded or "No terminology found.",
+                            "done": True,
+                        },
                     }
                 )
 
-            if user_valves.show_citation:
-                for key in entries.keys():
+            if user_valves.show_citation and entries:
+                citations = self.build_citations(
+                    entries, fragments, tag_format, origins
+                )
+                if self.valves.defer_citations:
+                    # Emitted in the background, the request goes on to the model right away
+                    task = asyncio.create_task(
+                        self.emit_citations(citations, __event_emitter__)
+                    )
+                    self.citation_tasks.add(task)
+                    task.add_done_callback(self.citation_tasks.discard)
+                else:
+                    await self.emit_citations(citations, __event_emitter__)
+
+            context.tag_context = translation
+            context.entries = entries
+            self.request_contexts.put(request_key(body, __metadata__), context)
+
+        return body
+
+    async def stream(
+        self,
+        event: dict,
+        __event_emitter__=None,
+        __metadata__: Optional[dict] = None,
+    ) -> dict:
+        # Checks each streamed chunk of the response as it arrives and reports forbidden terms
+        # and missing target terms while the response is still being generated
+        context = self.request_contexts.get(request_key(metadata=__metadata__))
+        if (
+            context is None
+            or context.stream_checker is None
+            or __event_emitter__ is None
+        ):
+            return event
+        checker = context.stream_checker
+
+        for choice in event.get("choices", []):
+            delta = (choice.get("delta") or {}).get("content") or ""
+            final = choice.get("finish_reason") is not None
+            result = checker.feed(delta, final=final)
+            for hit in result["forbidden"]:
+                replacement = (
+                    f", use '{hit['replacement']}'" if hit["replacement"] else ""
+                )
+                await __event_emitter__(
+                    {
+                        "type": "status",
+                        "data": {
+                            "description": f"Forbidden term '{hit['source']}' (#{hit['entryId']}){replacement}.",
+                            "done": False,
+                        },
+                    }
+                )
+            if final:
+                for entry_id, terms in result["missing"].items():
                     await __event_emitter__(
                         {
-                            "type": "citation",
+                            "type": "status",
                             "data": {
-                                "document": [
-                                    kalf.kalcium_tag_format(
-                                        {key: entries[key]},
-                                        task="translation",
-                                        format=tag_format,
-                                        add_codeblock=False,
-                                    ),
-                                ],
-                                "metadata": [
-                                    {
-                                        "date_accessed": datetime.now().isoformat(),
-                                        "source": f"#{key} ({[term for term in entries[key]['terms']][0]})",
-                                    }
-                                ],
-                                "source": {
-                                    "name": f"#{key} ({[term for term in entries[key]['terms']][0]})",
-                                    "url": f"{self.valves.kalcium_base_url}/terminology/search?entryId={key}&termbaseId={self.valves.termbaseIds}",
-                                },
+                                "description": f"Missing term for #{entry_id}: {' / '.join(terms)}.",
+                                "done": False,
                             },
-                        },
+                        }
                     )
+                await __event_emitter__(
+                    {
+                        "type": "status",
+                        "data": {"description": "Terminology checked.", "done": True},
+                    }
+                )
+                context.stream_checker = None
 
-            for message in messages:
-                if "\n\n### TAG context:\n" in message["content"]:
-                    message["content"] = message["content"].split(
-                        "\n\n### TAG context:\n"
-                    )[0]
-
-            self.kalc.tag_context = translation
-
-        return body
+        return event
 
-    def outlet(self, body: dict, __user__: Optional[dict] = None) -> dict:
+    def outlet(
+        self,
+        body: dict,
+        __user__: Optional[dict] = None,
+        __metadata__: Optional[dict] = None,
+    ) -> dict:
         # Modify or analyze the response body after processing by the API.
         # This function is the post-processor for the API, which can be used to modify the response
         # or perform additional checks and analytics.
@@ -345,359 +704,159 @@ class Filter:
         print(f"outlet:user:{__user__}")
 
         messages = body.get("messages", [])
+        context = self.request_contexts.pop(request_key(body, __metadata__))
+        if context is None:
+            return body
 
         # get user valves
         user_valves = __user__.get("valves")
         if not user_valves:
             user_valves = self.UserValves()
+        if user_valves.check_terminology:
+            # As in the inlet, an unreadable snapshot skips the check instead of losing the response
+            try:
+                term_checker = self.get_term_checker(user_valves.profileId)
+            except Exception as e:
+                print("Error loading the termbase snapshot", repr(e))
+                term_checker = None
+            if term_checker is not None:
+                check = term_checker.check_terminology(
+                    messages[-1]["content"], context.targetLanguageIds[0]
+                )
+                messages[-1]["content"] = (
+                    messages[-1]["content"] + "\n\n### Terminology check:\n" + check
+                )
         if user_valves.show_tag_context:
-            tag_context = self.kalc.tag_context
+            tag_context = context.tag_context
             messages[-1]["content"] = (
                 messages[-1]["content"] + "\n\n### TAG context:\n" + str(tag_context)
             )
 
         return body
 
-
-# -----------------------------------
-def get_entries_xml(search_results, sourceLanguageId, targetLanguageId):
-    if not search_results:
-        return None
-    try:
-        root = etree.fromstring(search_results)
-    except Exception as e:
-        raise Exception(str(f"Invalid XML Format: {str(e)}"))
-
-    entry_dict = {}
-    for e in root.findall(".//e"):
-        # get entry id
-        entry_id = e.find("id").get("id") if e.find("id") is not None else None
-        if entry_id and entry_id not in entry_dict.keys():
-            entry_dict[entry_id] = {"terms": {}, "fields": {}}
-        # get all entry level fields
-        for f in e.findall("f"):
-            e_field_name = f.get("n")
-            e_field_content = f.get("v")
-            if e_field_name is not None:
-                if e_field_name not in entry_dict[entry_id]["fields"].keys():
-                    entry_dict[entry_id]["fields"][e_field_name] = e_field_content
-
-        # get all language and term level fields
-        target_terms = []
-        source_terms = []
-        language_fields = {}
-        for l in e.findall("l"):
-            lid = l.attrib["lid"]
-            # get all language level fields
-            language_fields[int(lid)] = {}
-            for f in l.findall("f"):
-                l_field_name = f.get("n")
-                l_field_content = f.get("v")
-                if l_field_name not in language_fields[int(lid)].keys():
-                    language_fields[int(lid)][l_field_name] = l_field_content
-            # get all terms
-            for t in l.findall("t"):
-                term_dict = {}
-                term = t.attrib["t"]
-                if term not in term_dict.keys():
-                    term_dict[term] = {}
-
-                # get all term level fields
-                for f in t.findall("f"):
-                    t_field_name = f.get("n")
-                    t_field_content = f.get("v")
-                    if t_field_name not in term_dict[term].keys():
-                        term_dict[term][t_field_name] = t_field_content
-                if int(lid) == targetLanguageId:
-                    target_terms.append(term_dict)
-                elif int(lid) == sourceLanguageId:
-                    source_terms.append(term)
-
-        if sourceLanguageId == targetLanguageId:
-            source_terms.append(next(iter(target_terms[0].keys())))
-        # add target language fields
-        try:
-            entry_dict[entry_id]["fields"].update(language_fields[targetLanguageId])
-            # add source language fields if they don't exist as target fields
-            for field in language_fields[sourceLanguageId]:
-                if field not in entry_dict[entry_id]["fields"].keys():
-                    entry_dict[entry_id]["fields"][field] = language_fields[
-                        sourceLanguageId
-                    ][field]
-            # add term fields
-            entry_dict[entry_id]["terms"][source_terms[0]] = target_terms
-        except KeyError:
-            entry_dict.pop(entry_id)
-    return entry_dict
-
-
-# helper for json retrieval profile function
-def get_info(entry: dict, field: str):
-    try:
-        return entry[field]
-    except KeyError:
-        return None
-
-
-def get_entries_json(
-    search_results: list,
-    sourceLanguageId: int,
-    targetLanguageId: int,
-    language_map: dict,
-    profileId: int,
-    value_map: dict,
-):
-    if not search_results:
-        return None
-
-    entry_dict = {}
-    for idx, entry in enumerate(search_results):
-        if value_map[profileId]["definition"]["level"] == "concept":
-            definition = get_info(entry, value_map[profileId]["definition"]["name"])
-        elif value_map[profileId]["definition"]["level"] == "language":
-            definition = get_info(
-                entry,
-                f"{language_map[targetLanguageId]}_"
-                + value_map[profileId]["definition"]["name"],
-            )
-            if definition is None:
-                definition = get_info(
-                    entry,
-                    f"{language_map[sourceLanguageId]}_"
-                    + value_map[profileId]["definition"]["name"],
+    def build_citations(
+        self, entries: dict, fragments: dict, tag_format: str, origins: dict = None
+    ) -> list:
+        # All citation events in one pass, from the fragments already rendered for the TAG context
+        date_accessed = datetime.now().isoformat()
+        documents = []
+        origins = origins or {}
+        for key, concept in entries.items():
+            # Merged entries of several sources link to the entry in their own termbase
+            source, entry_id = origins.get(key, (None, key))
+            termbaseId = (source or {}).get("termbaseId") or self.valves.termbaseIds
+            if key not in fragments:
+                fragments[key] = kalf.render_fragment(
+                    key, concept, task="translation", format=tag_format
                 )
-        source_terms = []
-        target_terms = []
-        for i, term in enumerate(entry):
-            source_term = get_info(
-                entry, f"{language_map[sourceLanguageId]}_term_{i+1}"
-            )
-            if (
-                source_term
-                and get_info(
-                    entry,
-                    f"{language_map[sourceLanguageId]}_term_{i+1}_"
-                    + value_map[profileId]["usage_status"]["name"],
+            label = f"#{key} ({next(iter(concept['terms']), '')})"
+            documents.append(
+                (
+                    kalf.assemble_tag([fragments[key]], add_codeblock=False),
+                    {"date_accessed": date_accessed, "source": label},
+                    {
+                        "name": label,
+                        "url": f"{self.valves.kalcium_base_url}/terminology/search?entryId={entry_id}&termbaseId={termbaseId}",
+                    },
                 )
-                != value_map[profileId]["usage_status"]["forbidden"]
-            ):
-                source_terms.append(source_term)
-            target_term = get_info(
-                entry, f"{language_map[targetLanguageId]}_term_{i+1}"
-            )
-            usage_note = get_info(
-                entry,
-                f"{language_map[targetLanguageId]}_term_{i+1}_"
-                + value_map[profileId]["usage_note"]["name"],
             )
-            usage_status = get_info(
-                entry,
-                f"{language_map[targetLanguageId]}_term_{i+1}_"
-                + value_map[profileId]["usage_status"]["name"],
+        if self.valves.batch_citations:
+            return [
+                {
+                    "type": "citation",
+                    "data": {
+                        "document": [document for document, _, _ in documents],
+                        "metadata": [metadata for _, metadata, _ in documents],
+                        "source": {
+                            "name": "Kalcium",
+                            "url": f"{self.valves.kalcium_base_url}/terminology/search?termbaseId={self.valves.termbaseIds}",
+                        },
+                    },
+                }
+            ]
+        return [
+            {
+                "type": "citation",
+                "data": {"document": [document], "metadata": [metadata], "source": source},
+            }
+            for document, metadata, source in documents
+        ]
+
+    async def emit_citations(self, citations: list, __event_emitter__=None):
+        try:
+            await asyncio.gather(
+                *(__event_emitter__(citation) for citation in citations)
             )
-            if target_term:
-                target_dict = {target_term: {}}
-                if usage_note:
-                    target_dict[target_term]["usage_note"] = usage_note
-                if usage_status:
-                    target_dict[target_term]["usage_status"] = usage_status
-                target_terms.append(target_dict)
-        if idx not in entry_dict.keys():
-            entry_dict[idx] = {"terms": {}, "fields": {}}
-
-        if source_terms[0] not in entry_dict[idx]["terms"].keys():
-            entry_dict[idx]["terms"][source_terms[0]] = []
-        entry_dict[idx]["terms"][source_terms[0]].extend(target_terms)
-        if definition:
-            entry_dict[idx]["fields"] = {"definition": definition}
-    return entry_dict
-
-
-def find_translation(
-    kalc,
-    text: str,
-    profileId: int,
-    sourceLanguageIds: List,
-    targetLanguageIds: List,
-    value_map: dict,
-    tag_format: str = "markdown",
-    exact_matches_only: bool = False,
-):
-    if not text:
-        raise Exception("Text cannot be empty")
-    if profileId < 0:
-        raise Exception("Invalid profile ID")
-
-    entries = {}
-    try:
-        search_results = kalc.get_entry_content_by_lang_id(
-            text, profileId, sourceLanguageIds, targetLanguageIds
-        )
-    except Exception as e:
-        print("Error retrieving terms", e)
-        raise Exception(str(e) + text)
-    # Return search results as unchanged text or convert to Dictionary from XML/JSON
-    if tag_format == "unchanged":
-        return (
-            search_results
-            if search_results
-            else "No information found in the termbase."
-        ), {}
-    if isinstance(search_results, str):
-        entries = get_entries_xml(
-            search_results, sourceLanguageIds[0], targetLanguageIds[0]
-        )
-    elif isinstance(search_results, list):
-        entries = get_entries_json(
-            search_results,
-            sourceLanguageIds[0],
-            targetLanguageIds[0],
-            value_map[profileId]["languages"],
-            profileId,
-            value_map,
-        )
-
-    if not entries:
-        return "```markdown\nNo information found in the termbase.\n```", {}
-
-    # removing forbidden terms (in case usage status is enabled)
-    try:
-        final_entries = {}
-        for entry_id in entries.keys():
-            final_entries[entry_id] = {}
-            for concept in entries[entry_id]["terms"].keys():
-                final_entries[entry_id]["terms"] = {}
-                final_entries[entry_id]["terms"][concept] = []
-                for term in entries[entry_id]["terms"][concept]:
-                    for field in term.keys():
-                        if (
-                            term[field][value_map[profileId]["usage_status"]["name"]]
-                            != value_map[profileId]["usage_status"]["forbidden"]
-                        ):
-                            final_entries[entry_id]["terms"][concept].append(term)
-            final_entries[entry_id]["fields"] = entries[entry_id]["fields"]
-        entries = final_entries
-        if not entries:
-            return "```markdown\nNo information found in the termbase.\n```", {}
-    except KeyError:
-        pass
-
-    # checking for exact matches
-    # if exact_matches_only:
-    #    exact_matches = {}
-    #    for entry_id in entries:
-    #        term = (next(iter(entries[entry_id]["terms"])))
-    #        if term in text:
-    #            exact_matches[entry_id] = entries[entry_id]
-    #    entries = exact_matches
-
-    return (
-        kalf.kalcium_tag_format(entries, task="translation", format=tag_format),
-        entries,
-    )
-
-
-def check_terminology(
-    kalc,
-    text: str,
-    profileId: int,
-    sourceLanguageIds: List,
-    targetLanguageIds: List,
-    value_map: dict,
-    tag_format: str = "markdown",
-    exact_matches_only: bool = False,
-):
-    if not text:
-        raise Exception("Text cannot be empty")
-    if profileId < 0:
-        raise Exception("Invalid profile ID")
-    if sourceLanguageIds[0] != targetLanguageIds[0]:
-        raise Exception(
-            "Differing source and target language ID for monolingual term revision"
-        )
+        except Exception as e:
+            print("Error emitting citations", e)
 
-    entries = {}
-    try:
-        search_results = kalc.get_entry_content_by_lang_id(
-            text, profileId, sourceLanguageIds, targetLanguageIds
-        )
-    except Exception as e:
-        print("Error retrieving terms", e)
-        raise Exception(str(e) + text)
-    if isinstance(search_results, str):
-        entries = get_entries_xml(
-            search_results, sourceLanguageIds[0], targetLanguageIds[0]
-        )
-    elif isinstance(search_results, list):
-        entries = get_entries_json(
-            search_results,
-            sourceLanguageIds[0],
-            targetLanguageIds[0],
-            value_map[profileId]["languages"],
-            profileId,
-            value_map,
-        )
+    def record_telemetry(self, records: list):
+        try:
+            for *record, termbaseId in records:
+                self.telemetry.record(*record, termbaseId=termbaseId)
+        except Exception as e:
+            print("Error recording retrieval telemetry", e)
+
+    def get_sources(self, languages: list) -> list:
+        # Configured retrieval sources that support the language pair, with the language IDs of their profile
+        sources = []
+        for profileId, termbaseId in parse_retrieval_sources(
+            self.valves.retrieval_sources
+        ):
+            language_names = self.value_map.get(profileId, {}).get("language_names", {})
+            if languages[0] not in language_names or languages[1] not in language_names:
+                print(
+                    f"Skipping profile {profileId}: {languages[0]} to {languages[1]} is not supported"
+                )
+                continue
+            sources.append(
+                {
+                    "profileId": profileId,
+                    "termbaseId": termbaseId,
+                    "sourceLanguageIds": [language_names[languages[0]]],
+                    "targetLanguageIds": [language_names[languages[1]]],
+                }
+            )
+        return sources
 
-    if not entries:
-        return "```markdown\nNo information found in the termbase.\n```", {}
+    def get_snapshot(self):
+        with self.snapshot_lock:
+            if self.termbase_snapshot is None:
+                self.termbase_snapshot = TermbaseSnapshot.from_jsonl(
+                    self.valves.termbase_snapshot_path
+                )
+            return self.termbase_snapshot
 
-    def add_usage(entries: dict, entry: dict, term: str, type: str):
-        try:
+    def get_prefilter(self):
+        # Built once from the termbase snapshot, stemmers follow the language codes of all profiles
+        if not self.valves.skip_term_free_text or not self.valves.termbase_snapshot_path:
+            return None
+        with self.snapshot_lock:
             if (
-                entry[value_map[profileId]["usage_status"]["name"]]
-                == value_map[profileId]["usage_status"][type]
+                self.prefilter is None
+                and self.prefilter_failed != self.valves.termbase_snapshot_path
             ):
-                if f"{type} terms" not in entries.keys():
-                    entries[f"{type} terms"] = []
-                term_dict = {term: {}}
-                for field in entry.keys():
-                    if field != value_map[profileId]["usage_status"]["name"]:
-                        term_dict[term][field] = entry[field]
-                entries[f"{type} terms"].append(term_dict)
-        except KeyError:
-            pass
-
-    # building the final entries for the revision function
-    final_entries = {}
-    for entry_id in entries.keys():
-        final_entries[entry_id] = {}
-        for concept in entries[entry_id]["terms"].keys():
-            final_entries[entry_id]["terms"] = {}
-            final_entries[entry_id]["terms"][concept] = {}
-            for term in entries[entry_id]["terms"][concept]:
-                for field in term.keys():
-                    add_usage(
-                        final_entries[entry_id]["terms"][concept],
-                        term[field],
-                        field,
-                        "preferred",
-                    )
-                    add_usage(
-                        final_entries[entry_id]["terms"][concept],
-                        term[field],
-                        field,
-                        "allowed",
-                    )
-                    add_usage(
-                        final_entries[entry_id]["terms"][concept],
-                        term[field],
-                        field,
-                        "forbidden",
-                    )
-        final_entries[entry_id]["fields"] = entries[entry_id]["fields"]
-    if not final_entries:
-        return "```markdown\nNo information found in the termbase.\n```", {}
-
-    # checking for exact matches
-    # if exact_matches_only:
-    #    exact_matches = {}
-    #    for entry_id in entries:
-    #        term = (next(iter(entries[entry_id]["terms"])))
-    #        if term in text:
-    #            exact_matches[entry_id] = entries[entry_id]
-    #    entries = exact_matches
-
-    return (
-        kalf.kalcium_tag_format(final_entries, task="revision", format=tag_format),
-        final_entries,
-    )
+                language_codes = {
+                    languageId: code
+                    for profile in self.value_map.values()
+                    for languageId, code in profile["languages"].items()
+                }
+                try:
+                    self.prefilter = TermPrefilter(self.get_snapshot(), language_codes)
+                except Exception as e:
+                    # The prefilter only saves retrieval calls, without it every text is retrieved
+                    print("Error building the term prefilter, retrieving all texts", repr(e))
+                    self.prefilter_failed = self.valves.termbase_snapshot_path
+            return self.prefilter
+
+    def get_term_checker(self, profileId: int):
+        # Compiles the forbidden terms of the profile once, checks are local afterwards
+        if not self.valves.termbase_snapshot_path:
+            return None
+        with self.snapshot_lock:
+            if profileId not in self.term_checkers:
+                self.term_checkers[profileId] = ForbiddenTermAutomaton.from_snapshot(
+                    self.get_snapshot(), profileId, self.value_map
+                )
+            return self.term_checkers[profileId]
+